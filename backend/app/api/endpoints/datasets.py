@@ -1,58 +1,50 @@
-from fastapi import APIRouter, UploadFile, File, Depends
+import logging
+from fastapi import APIRouter, UploadFile, File, Depends, Body, Query
 from sqlalchemy.orm import Session
-from app.services import data_service
+from app.services.compute import ComputeBusyError
+from app.services.serialization import RESPONSE_FORMATS, CompactJSONResponse, render_preview
 from app.db.session import get_db
 from app.db import models
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+
+def _respond(body: dict, fmt: str):
+    """
+    'records' (default) goes through FastAPI's encoder as before; 'columns' sends
+    column arrays written directly by the fast encoder.
+    """
+    if "preview" in body:
+        body["preview"] = render_preview(body["preview"], fmt)
+    return CompactJSONResponse(body) if fmt == "columns" else body
+
+
 @router.post("/upload")
-async def upload_dataset(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_dataset(
+    file: UploadFile = File(...),
+    fmt: str = Query("records", alias="format", regex=RESPONSE_FORMATS),
+    db: Session = Depends(get_db)
+):
     try:
-        contents = await file.read()
-        import io
-        import pandas as pd
-        import numpy as np
-        from app.services.analysis import analyze_csv, smart_downsample, preprocess_dataframe
-        
-        # 1. Analyze
-        df = pd.read_csv(io.BytesIO(contents))
-        
-        # Preprocess (Identify/Parse Dates, Sort)
-        df = preprocess_dataframe(df)
+        from app.services.ingest import ingest_upload
         
-        analysis_result = await analyze_csv(df)
-        
-        # 2. Upload
-        # NOTE: We are uploading the ORIGINAL raw content for integrity, 
-        # but the analysis/preview uses the processed version.
-        file_obj = io.BytesIO(contents)
-        dataset_record = await data_service.upload_dataset(
-            file_obj=file_obj, 
+        # Stream to content-addressed storage chunk-by-chunk; only a bounded row sample stays in memory.
+        # NOTE: The ORIGINAL raw content is stored for integrity,
+        # but the analysis/preview uses the processed data.
+        dataset_record, result = await ingest_upload(
+            file, 
             filename=file.filename, 
             db=db,
             content_type=file.content_type
         )
         
-        # Prepare Preview Data (Smart Downsampled)
-        preview_df = smart_downsample(df, max_points=1000)
-        # Sanitize for JSON (Nan/Inf -> None)
-        preview_df = preview_df.replace([np.inf, -np.inf], None).where(pd.notnull(preview_df), None)
-        
-        # Ensure date column is formatted as string for JSON
-        if 'date' in preview_df.columns:
-            preview_df['date'] = preview_df['date'].astype(str)
-            
-        preview_data = preview_df.to_dict(orient='records')
-        
-        return {
-            "dataset": dataset_record,
-            "analysis": analysis_result["analysis"],
-            "metrics": analysis_result["metrics"],
-            "radar": analysis_result["radar"],
-            "preview": preview_data
-        }
+        return _respond({"dataset": dataset_record, **result}, fmt)
 
+    except ComputeBusyError as e:
+        from fastapi import HTTPException
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -60,60 +52,175 @@ async def upload_dataset(file: UploadFile = File(...), db: Session = Depends(get
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 @router.post("/upload-url")
-async def upload_dataset_from_url(url: str, db: Session = Depends(get_db)):
+async def upload_dataset_from_url(
+    url: str,
+    fmt: str = Query("records", alias="format", regex=RESPONSE_FORMATS),
+    db: Session = Depends(get_db)
+):
+    from fastapi import HTTPException
+    from app.services.url_import import import_url, DownloadError, DownloadTooLarge
     try:
-        import requests
-        import io
-        import pandas as pd
-        import numpy as np
-        from app.services.analysis import analyze_csv, smart_downsample, preprocess_dataframe
-        
-        # 1. Fetch
-        response = requests.get(url)
-        response.raise_for_status()
-        contents = response.content
-        filename = url.split("/")[-1] or "downloaded_data.csv"
-        
-        # 2. Analyze
-        df = pd.read_csv(io.BytesIO(contents))
-        
-        # Preprocess
-        df = preprocess_dataframe(df)
-        
-        analysis_result = await analyze_csv(df)
-        
-        # 3. Upload
-        file_obj = io.BytesIO(contents)
-        dataset_record = await data_service.upload_dataset(
-            file_obj=file_obj, 
-            filename=filename, 
-            db=db,
-            content_type="text/csv"
-        )
-        
-        # Prepare Preview
-        preview_df = smart_downsample(df, max_points=1000)
-        preview_df = preview_df.replace([np.inf, -np.inf], None).where(pd.notnull(preview_df), None)
-        
-        if 'date' in preview_df.columns:
-            preview_df['date'] = preview_df['date'].astype(str)
-            
-        preview_data = preview_df.to_dict(orient='records')
-        
-        return {
-            "dataset": dataset_record,
-            "analysis": analysis_result["analysis"],
-            "metrics": analysis_result["metrics"],
-            "radar": analysis_result["radar"],
-            "preview": preview_data
-        }
-        
+        # Streamed async fetch (size limit, timeouts, Range resume) into the same ingest pipeline as /upload
+        dataset_record, result = await import_url(url, db)
+        return _respond({"dataset": dataset_record, **result}, fmt)
+
+    except DownloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DownloadError as e:
+        raise HTTPException(status_code=502, detail=f"URL Upload failed: {str(e)}")
+    except ComputeBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         import traceback
         traceback.print_exc()
-        from fastapi import HTTPException
         raise HTTPException(status_code=500, detail=f"URL Upload failed: {str(e)}")
 
+@router.post("/upload-urls")
+async def upload_datasets_from_urls(
+    urls: list[str] = Body(...),
+    fmt: str = Query("records", alias="format", regex=RESPONSE_FORMATS),
+    db: Session = Depends(get_db)
+):
+    """
+    Imports several URLs concurrently (bounded by URL_IMPORT_CONCURRENCY).
+    Each URL succeeds or fails on its own.
+    """
+    import asyncio
+    from app.services.url_import import import_url
+
+    async def one(url):
+        try:
+            dataset_record, result = await import_url(url, db)
+            return {"url": url, "dataset": dataset_record, **result, "preview": render_preview(result["preview"], fmt)}
+        except Exception as e:
+            logger.error(f"URL import failed for {url}: {e}")
+            return {"url": url, "error": str(e)}
+
+    results = await asyncio.gather(*(one(url) for url in urls))
+    return CompactJSONResponse(results) if fmt == "columns" else results
+
+@router.post("/{dataset_id}/append")
+async def append_to_dataset(
+    dataset_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Appends the rows of a CSV with the dataset's columns (header included) to the dataset.
+    The retrain scheduler picks up the new rows; forecasts roll their models forward.
+    """
+    from fastapi import HTTPException
+    from app.services.ingest import append_upload, AppendError
+    dataset = db.query(models.Dataset).filter(models.Dataset.id == dataset_id).first()
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    try:
+        dataset, appended = await append_upload(dataset, file, db)
+        return {"dataset": dataset, "appended_rows": appended, "rows": dataset.metadata_info["rows"]}
+    except AppendError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ComputeBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
 @router.get("/")
 def list_datasets(db: Session = Depends(get_db)):
     return db.query(models.Dataset).all()
+
+@router.get("/{dataset_id}/preview")
+def preview_dataset(
+    dataset_id: int,
+    max_points: int = 1000,
+    fmt: str = Query("records", alias="format", regex=RESPONSE_FORMATS),
+    db: Session = Depends(get_db)
+):
+    """
+    Chart preview served from the columnar copy (only the role columns are read).
+    """
+    from fastapi import HTTPException
+    from app.services.columnar import load_dataset_frame
+    from app.services.analysis import smart_downsample
+    from app.services.serialization import frame_columns
+
+    dataset = db.query(models.Dataset).filter(models.Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    loaded = load_dataset_frame(dataset)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="No columnar copy for this dataset; re-upload to generate one")
+
+    df, is_time_series = loaded
+    if is_time_series:
+        df = df.rename(columns={"ds": "date", "y": "value"})
+    preview_df = smart_downsample(df, max_points=max_points)
+    return _respond({"dataset_id": dataset_id, "preview": frame_columns(preview_df)}, fmt)
+
+
+@router.get("/{dataset_id}/zoom")
+def zoom_dataset(
+    dataset_id: int,
+    start: str = None,
+    end: str = None,
+    points: int = 1000,
+    fmt: str = Query("records", alias="format", regex=RESPONSE_FORMATS),
+    db: Session = Depends(get_db)
+):
+    """
+    Returns any time window at screen resolution from the precomputed pyramid.
+    Narrow windows are read as raw rows from the columnar copy and downsampled with LTTB.
+    """
+    from fastapi import HTTPException
+    import pandas as pd
+    from app.services.columnar import load_pyramid, load_columnar
+    from app.services.analysis import smart_downsample
+    from app.services.serialization import frame_columns, window_columns
+
+    dataset = db.query(models.Dataset).filter(models.Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    meta = dataset.metadata_info or {}
+    if not meta.get("pyramid_key"):
+        raise HTTPException(status_code=404, detail="No pyramid for this dataset; re-upload to generate one")
+
+    try:
+        start_ts = pd.Timestamp(start) if start else None
+        end_ts = pd.Timestamp(end) if end else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid window: {e}")
+
+    pyramid = load_pyramid(meta["pyramid_key"])
+    window = pyramid.window(
+        start_ts.value if start_ts is not None else None,
+        end_ts.value if end_ts is not None else None,
+        points=points
+    )
+    if window is not None:
+        return _respond(
+            {"dataset_id": dataset_id, "source": "pyramid", "level": window["level"], "preview": window_columns(window)}, fmt
+        )
+
+    filters = []
+    if start_ts is not None:
+        filters.append(("ds", ">=", start_ts))
+    if end_ts is not None:
+        filters.append(("ds", "<=", end_ts))
+    raw = load_columnar(meta["columnar_key"], columns=["ds", "y"], filters=filters or None).dropna().sort_values("ds")
+    raw = smart_downsample(raw.rename(columns={"ds": "date", "y": "value"}), max_points=points)
+    return _respond({"dataset_id": dataset_id, "source": "raw", "level": None, "preview": frame_columns(raw)}, fmt)
+
+
+@router.get("/{dataset_id}/drift")
+async def dataset_drift(dataset_id: int, window: str = None, db: Session = Depends(get_db)):
+    """
+    Distribution drift of every numeric column: the latest (or given) window against the
+    rows before it, as KS, PSI and Wasserstein distances from the dataset's quantile sketches.
+    """
+    from fastapi import HTTPException
+    from app.services.drift import dataset_monitor
+
+    dataset = db.query(models.Dataset).filter(models.Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    monitor = await dataset_monitor(dataset, db)
+    if monitor is None:
+        raise HTTPException(status_code=404, detail="No columnar copy for this dataset; re-upload to generate one")
+    return {"dataset_id": dataset_id, "windows": sorted(monitor.windows), **monitor.report(window)}
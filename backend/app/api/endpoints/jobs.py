@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.services.jobs import get_broker, RUN_KINDS
+from app.db.session import get_db
+
+router = APIRouter()
+
+@router.get("/stats")
+async def queue_stats():
+    """
+    Queue depth: queued, retrying and running jobs, and running jobs per tenant.
+    """
+    return await get_broker().stats()
+
+@router.get("/retrain")
+def retrain_history(limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
+    """
+    Recent decisions of the retraining scheduler, with the reasons behind each.
+    """
+    from app.db.models import AuditLog
+    rows = (db.query(AuditLog).filter(AuditLog.action.like("retrain.%"))
+            .order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit).all())
+    return [{"timestamp": row.timestamp, **row.details} for row in rows]
+
+@router.post("/retrain/{dataset_id}")
+async def request_retrain(dataset_id: int, now: bool = False):
+    """
+    Requests a retrain of a dataset's model. Requests coalesce until the next scheduler
+    tick; `now` runs the tick at once and returns its decisions.
+    """
+    from app.services.scheduler import get_retrain_scheduler
+    retrain = get_retrain_scheduler()
+    retrain.request(dataset_id)
+    if not now:
+        return {"dataset_id": dataset_id, "status": "pending"}
+    return {"dataset_id": dataset_id, "status": "ticked", "decisions": await retrain.tick()}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    job = await get_broker().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancels a queued job at once; a running job is stopped by its worker.
+    """
+    from app.services import results_store
+    from app.services.compute import get_compute
+    broker = get_broker()
+    job = await broker.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    status = await broker.cancel(job_id)
+    if status == "cancelled" and job["status"] != "cancelled" and job["kind"] in RUN_KINDS:
+        await get_compute().run_local(results_store.save_run, job["payload"]["run_id"], "cancelled", {"error": "Cancelled"})
+    return {"job_id": job_id, "status": status}
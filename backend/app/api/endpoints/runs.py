@@ -1,7 +1,8 @@
-from fastapi import APIRouter, BackgroundTasks, Depends
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from typing import List
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from app.services import forecasting
+from app.services import forecasting, multiseries, results_store, intervals, jobs, stress, recommendations, response_surface
 from app.db.session import get_db
 from app.db import models
 
@@ -12,23 +13,32 @@ class RunCreate(BaseModel):
     horizon: int = 30
     model_type: str = "prophet"
     overrides: dict = None
+    series_column: str = None  # long-format datasets: forecast every series of this column
+    value_column: str = None  # grouped runs: the column to forecast (inferred, never the series column, by default)
+    quantiles: List[float] = None  # quantile levels in (0, 1); default P10/P50/P90
+    tenant: str = "default"  # concurrency limits apply per tenant
+    priority: int = 0  # 0 (lowest) .. 9 (highest)
 
 @router.post("/start")
-async def start_run(run: RunCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    # Create DB entry
-    db_run = models.ForecastRun(
-        dataset_id=run.dataset_id,
-        horizon=run.horizon,
-        model_type=run.model_type,
-        status="running",
-        parameters=run.overrides
-    )
-    db.add(db_run)
-    db.commit()
-    db.refresh(db_run)
-    
-    background_tasks.add_task(forecasting.run_forecast_task, db_run.id, run.dataset_id, run.overrides)
-    return {"run_id": db_run.id, "status": "started"}
+async def start_run(run: RunCreate, db: Session = Depends(get_db)):
+    """
+    Queues a forecast run for the worker processes. An identical run of the same tenant
+    that is still queued or running is returned instead of starting another.
+    """
+    if run.horizon < 1:
+        raise HTTPException(status_code=400, detail="horizon must be positive")
+    if run.quantiles and not all(0 < q < 1 for q in run.quantiles):
+        raise HTTPException(status_code=400, detail="quantiles must be between 0 and 1")
+    if not 0 <= run.priority <= jobs.MAX_PRIORITY:
+        raise HTTPException(status_code=400, detail=f"priority must be between 0 and {jobs.MAX_PRIORITY}")
+    if run.series_column:
+        kind, spec = "multi_series", {"dataset_id": run.dataset_id, "series_column": run.series_column,
+                                      "value_column": run.value_column, "horizon": run.horizon}
+    else:
+        kind, spec = "forecast", {"dataset_id": run.dataset_id, "overrides": run.overrides, "horizon": run.horizon, "quantiles": run.quantiles}
+    grouping = {"series_column": run.series_column, **({"value_column": run.value_column} if run.value_column else {})}
+    parameters = {**(run.overrides or {}), **grouping} if run.series_column else run.overrides
+    return await jobs.submit_run(db, kind, spec, run.tenant, run.priority, parameters, model_type=run.model_type)
 
 @router.get("/")
 def list_runs(db: Session = Depends(get_db)):
@@ -38,9 +48,146 @@ def list_runs(db: Session = Depends(get_db)):
 def get_run(run_id: int, db: Session = Depends(get_db)):
     return db.query(models.ForecastRun).filter(models.ForecastRun.id == run_id).first()
 
+def _stored_run(db: Session, run_id: int) -> models.ForecastRun:
+    run = db.query(models.ForecastRun).filter(models.ForecastRun.id == run_id).first()
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if not results_store.series_names(run.results):
+        raise HTTPException(status_code=400, detail="Run has no stored results")
+    return run
+
+@router.get("/{run_id}/results")
+def get_run_results(run_id: int, db: Session = Depends(get_db)):
+    """
+    Full results of a run, every stored series included.
+    """
+    return results_store.load_results(_stored_run(db, run_id).results)
+
+@router.get("/{run_id}/arrays/{name:path}")
+def get_run_array(
+    run_id: int,
+    name: str,
+    start: int = Query(None),
+    stop: int = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    One stored series of a run (e.g. forecast, quantiles/p90), optionally rows [start, stop).
+    """
+    run = _stored_run(db, run_id)
+    try:
+        values = results_store.read_series(run.results, name, start, stop)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Series '{name}' not found; available: {', '.join(results_store.series_names(run.results))}")
+    return {"name": name, "start": start or 0, "values": values}
+
+@router.get("/{run_id}/quantiles")
+def get_run_quantiles(run_id: int, levels: List[float] = Query(None), db: Session = Depends(get_db)):
+    """
+    Quantile forecasts of a completed run at any levels, without refitting.
+    """
+    run = _stored_run(db, run_id)
+    if run.results.get("mode") == "multi_series":
+        raise HTTPException(status_code=400, detail="Quantiles are not available for grouped runs")
+    levels = levels or list(intervals.DEFAULT_QUANTILES)
+    if not all(0 < q < 1 for q in levels):
+        raise HTTPException(status_code=400, detail="levels must be between 0 and 1")
+    return forecasting.quantile_forecast(run.results, sorted(set(levels)))
+
+@router.get("/{run_id}/series")
+def get_run_series(
+    run_id: int,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(multiseries.PAGE_SIZE, ge=1, le=multiseries.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """
+    Per-series forecasts of a grouped (multi-series) run, paged.
+    """
+    run = _stored_run(db, run_id)
+    if run.results.get("mode") != "multi_series":
+        raise HTTPException(status_code=400, detail="Run is not a completed grouped forecast")
+    return multiseries.series_page(run.results, page, page_size)
+
 @router.post("/{run_id}/stress")
-async def run_stress_test(run_id: int):
+async def run_stress_test(
+    run_id: int,
+    paths: int = Body(stress.DEFAULT_PATHS, ge=100, le=stress.MAX_PATHS, embed=True),
+    scenarios: List[str] = Body(None, embed=True),
+    seed: int = Body(None, embed=True)
+):
+    """
+    Trigger a stress test (War Games) for a specific run: Monte Carlo percentile fans and
+    VaR/CVaR of revenue per scenario. Precomputed when the run completes; repeat requests
+    are cache reads (`cached` in the response).
+    """
+    from app.services.compute import ComputeBusyError
+    try:
+        return await forecasting.run_stress_test(run_id, paths=paths, scenarios=scenarios, seed=seed)
+    except ComputeBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except forecasting.RunNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except forecasting.RunNotReadyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{run_id}/recommendations")
+async def get_recommendations(
+    run_id: int,
+    levers: List[str] = Body(None, embed=True),
+    budget: int = Body(recommendations.DEFAULT_BUDGET, ge=1, le=recommendations.MAX_BUDGET, embed=True)
+):
+    """
+    What-if optimizer: ranked actions (marketing, discount, inventory and their best
+    combination) with uplift, cost and risk, scored against the run's fitted models.
+    """
+    from app.services.compute import ComputeBusyError
+    try:
+        return await recommendations.generate_recommendations(run_id, levers=levers, budget=budget)
+    except ComputeBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except recommendations.ModelUnavailableError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except recommendations.RecommendationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{run_id}/surface")
+async def get_scenario_surface(
+    run_id: int,
+    override: str = Query("marketing_boost"),
+    values: List[float] = Query(..., alias="value"),
+):
+    """
+    Scenario slider preview: the run's forecast with an override at each value, interpolated
+    on the response surface precomputed when the run completed. POST /{run_id}/surface/exact
+    re-runs the forecast for one value.
+    """
+    from app.services.compute import ComputeBusyError
+    try:
+        return await response_surface.preview(run_id, override, values)
+    except ComputeBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except recommendations.ModelUnavailableError as e:
+        raise HTTPException(status_code=409, detail=f"{e}, or request an exact re-run")
+    except recommendations.RecommendationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{run_id}/surface/exact")
+async def run_exact_scenario(
+    run_id: int,
+    value: float = Body(..., embed=True),
+    override: str = Body("marketing_boost", embed=True),
+    tenant: str = Body("default", embed=True),
+    priority: int = Body(0, ge=0, le=jobs.MAX_PRIORITY, embed=True),
+    db: Session = Depends(get_db)
+):
     """
-    Trigger a stress test (War Games) for a specific run.
+    Queues the run's forecast refitted with the override at `value`: the exact counterpart
+    of a surface preview.
     """
-    return await forecasting.run_stress_test(run_id)
+    try:
+        return await response_surface.submit_exact(db, run_id, override, value, tenant, priority)
+    except recommendations.RecommendationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,6 +1,14 @@
-from fastapi import APIRouter, Body
+import json
+import asyncio
+import logging
+from typing import List
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.responses import StreamingResponse
+from app.services.backtest import run_backtest, BacktestError, BACKTEST_MODES
+from app.services.compute import ComputeBusyError
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.post("/run_forecast")
 def tool_run_forecast(dataset_id: int = Body(...), horizon: int = Body(30), overrides: dict = Body(None)):
@@ -9,8 +17,60 @@ def tool_run_forecast(dataset_id: int = Body(...), horizon: int = Body(30), over
     return {"message": f"Triggered forecast for dataset {dataset_id} horizon {horizon}", "overrides": overrides}
 
 @router.post("/run_backtest")
-def tool_run_backtest(dataset_id: int = Body(...), horizons: list = Body([30])):
-    return {"message": "Backtest started", "metrics": {"mae": 12.4, "rmse": 15.2}}
+async def tool_run_backtest(
+    dataset_id: int = Body(...),
+    horizons: List[int] = Body([30]),
+    folds: int = Body(5),
+    mode: str = Body("expanding", regex=BACKTEST_MODES),
+    window: int = Body(None),
+    stream: bool = Body(False)
+):
+    """
+    Rolling-origin backtest of the forecasting ensemble. With `stream`, progress events and
+    the final result are sent as newline-delimited JSON.
+    """
+    kwargs = dict(dataset_id=dataset_id, horizons=horizons, folds=folds, mode=mode, window=window)
+    if stream:
+        return StreamingResponse(_stream_backtest(kwargs), media_type="application/x-ndjson")
+    try:
+        result = await run_backtest(**kwargs)
+    except BacktestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ComputeBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return _backtest_response(result)
+
+def _backtest_response(result: dict) -> dict:
+    summary = result["summary"] or {}
+    return {
+        "message": "Backtest completed" + (" (cached)" if result["cached"] else ""),
+        "metrics": {"mae": summary.get("mae"), "rmse": summary.get("rmse")},
+        "backtest": result,
+    }
+
+async def _stream_backtest(kwargs: dict):
+    events = asyncio.Queue()
+
+    async def on_progress(event):
+        await events.put(event)
+
+    async def work():
+        try:
+            result = _backtest_response(await run_backtest(**kwargs, on_progress=on_progress))
+            await events.put({"type": "backtest.completed", **result})
+        except Exception as e:
+            logger.error(f"Backtest failed: {e}")
+            await events.put({"type": "backtest.failed", "message": str(e)})
+
+    task = asyncio.create_task(work())
+    try:
+        while True:
+            event = await events.get()
+            yield json.dumps(event, default=str) + "\n"
+            if event["type"] != "backtest.progress":
+                break
+    finally:
+        task.cancel()
 
 @router.post("/get_executive_summary")
 def tool_get_executive_summary(run_id: int = Body(...)):
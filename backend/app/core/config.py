@@ -19,9 +19,62 @@ class Settings(BaseSettings):
     MINIO_ACCESS_KEY: str
     MINIO_SECRET_KEY: str
     
+    # Object Storage ("s3" uses MinIO above, "local" stores files under STORAGE_LOCAL_ROOT)
+    STORAGE_BACKEND: str = "s3"
+    STORAGE_LOCAL_ROOT: str = "./storage"
+    STORAGE_MAX_CONNECTIONS: int = 32
+    
+    # Compute tier (CPU-bound analysis/forecasting/simulation; 0 workers = one per CPU)
+    COMPUTE_WORKERS: int = 0
+    COMPUTE_MAX_QUEUE: int = 32
+    COMPUTE_JOB_TIMEOUT: float = 300.0
+    COMPUTE_START_METHOD: str = "spawn"
+    
+    # URL imports
+    URL_IMPORT_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    URL_IMPORT_CONNECT_TIMEOUT: float = 10.0
+    URL_IMPORT_READ_TIMEOUT: float = 60.0
+    URL_IMPORT_TIMEOUT: float = 1800.0
+    URL_IMPORT_RETRIES: int = 3
+    URL_IMPORT_CONCURRENCY: int = 4
+    
     # MLflow
     MLFLOW_TRACKING_URI: str
     
+    # Fitted-model registry ("local" files under MODEL_REGISTRY_ROOT, "mlflow" also logs to MLflow)
+    MODEL_REGISTRY_BACKEND: str = "local"
+    MODEL_REGISTRY_ROOT: str = "./model_registry"
+    MODEL_REGISTRY_MEMORY_ITEMS: int = 16
+    MODEL_REGISTRY_MAX_MODELS: int = 200
+    MODEL_REGISTRY_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    
+    # Run queue ("redis" is shared by the API and `python -m app.worker` processes; "memory"
+    # keeps queue and worker inside the API process, for development and tests)
+    JOB_BROKER: str = "redis"
+    JOB_WORKER_CONCURRENCY: int = 2
+    JOB_TENANT_CONCURRENCY: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BASE: float = 5.0
+    JOB_RETRY_MAX: float = 300.0
+    JOB_LEASE_SECONDS: float = 60.0
+    JOB_POLL_INTERVAL: float = 0.5
+    JOB_RESULT_TTL: int = 7 * 24 * 3600
+
+    # War Games cache ("redis" or "memory"), filled when a run completes
+    STRESS_CACHE: str = "redis"
+    STRESS_CACHE_TTL: int = 24 * 3600
+    STRESS_CACHE_MAX_ENTRIES: int = 256
+
+    # Retraining scheduler: datasets with new rows, drift or stale models are re-run, at most
+    # RETRAIN_WORKERS at a time (a tenant limit of the run queue)
+    RETRAIN_ENABLED: bool = True
+    RETRAIN_INTERVAL: int = 900
+    RETRAIN_MAX_AGE: int = 7 * 24 * 3600
+    RETRAIN_MIN_NEW_ROWS: int = 1
+    RETRAIN_DRIFT_PSI: float = 0.2
+    RETRAIN_WORKERS: int = 1
+    RETRAIN_MAX_PER_TICK: int = 10
+    
     class Config:
         case_sensitive = True
 
@@ -10,6 +10,7 @@ class Dataset(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
     s3_key = Column(String)
+    content_hash = Column(String, index=True, nullable=True) # SHA-256 of the raw upload
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     metadata_info = Column(JSON, nullable=True)
 
@@ -1,9 +1,37 @@
+from sqlalchemy import inspect, text
 from app.db.session import engine
 from app.db.models import Base
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
-    print("Tables created successfully.")
+# Columns added to existing tables since they were first created: create_all only creates
+# missing tables, so these are added to databases that predate them.
+ADDED_COLUMNS = [
+    ("uploaded_datasets", "content_hash"),
+]
+
+def upgrade_columns(bind=engine):
+    """
+    Adds the ADDED_COLUMNS missing from existing tables, with their indexes. Idempotent, so
+    the API and the workers can all run it at startup.
+    """
+    existing = {}
+    with bind.begin() as conn:
+        for table_name, column_name in ADDED_COLUMNS:
+            if table_name not in existing:
+                existing[table_name] = {c["name"] for c in inspect(conn).get_columns(table_name)}
+            if column_name in existing[table_name]:
+                continue
+            column = Base.metadata.tables[table_name].c[column_name]
+            column_type = column.type.compile(dialect=bind.dialect)
+            # Postgres: a concurrent startup may add it first (SQLite has no IF NOT EXISTS here)
+            if_not_exists = "IF NOT EXISTS " if bind.dialect.name == "postgresql" else ""
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {if_not_exists}{column_name} {column_type}"))
+            if column.index:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table_name}_{column_name} ON {table_name} ({column_name})"))
+
+def init_db(bind=engine):
+    Base.metadata.create_all(bind=bind)
+    upgrade_columns(bind)
 
 if __name__ == "__main__":
     init_db()
+    print("Tables created successfully.")
@@ -27,31 +27,49 @@ app.add_middleware(
 
 # Redis for PubSub
 redis_client = None
+# In-process run worker (JOB_BROKER=memory only; otherwise runs go to `python -m app.worker`)
+job_worker = None
+job_worker_task = None
 
 @app.on_event("startup")
 async def startup_event():
-    global redis_client
+    global redis_client, job_worker, job_worker_task
     
-    # Ensure Tables Exist
-    from app.db.models import Base
-    from app.db.session import engine
-    Base.metadata.create_all(bind=engine)
+    # Ensure Tables (and columns added since they were created) Exist
+    from app.init_db import init_db
+    init_db()
+
+    # Ensure the datasets bucket exists once, instead of on every upload
+    from app.services.storage import get_storage
+    await get_storage("datasets").aensure_bucket()
     
     redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
     start_scheduler()
+    if settings.JOB_BROKER == "memory":
+        from app.services.jobs import create_worker
+        job_worker = create_worker()
+        job_worker_task = asyncio.create_task(job_worker.run())
     logger.info(f"🚀 InsightX Backend Started with Prompt: {settings.USER_PROMPT}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     if redis_client:
         await redis_client.close()
+    if job_worker is not None:
+        await job_worker.stop()
+        await job_worker_task
+    from app.services.compute import get_compute
+    from app.services.url_import import close_http_client
+    get_compute().shutdown()
+    await close_http_client()
 
 # Router
 app.include_router(api_router, prefix="/api")
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    from app.services.compute import get_compute
+    return {"status": "ok", "compute": get_compute().stats()}
 
 # WebSocket for Real-time Updates
 @app.websocket("/ws")
@@ -1,70 +1,286 @@
+import copy
+import hashlib
+import warnings
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
+from pandas.tseries.api import guess_datetime_format
+from app.services.compute import get_compute
+from app.services.downsampling import downsample_indices
+from app.services.profiling import StreamingProfile, profile_dataframe, frame_batches
 
 def smart_downsample(df: pd.DataFrame, max_points: int = 500) -> pd.DataFrame:
     """
     Downsamples the dataframe to a maximum number of points while preserving the shape.
-    Uses simple slicing for efficiency on large datasets.
+    Uses LTTB over the value column (min/max pre-bucketing on long series) so peaks and
+    anomalies survive; falls back to simple slicing when there is no numeric value column.
     """
     if len(df) <= max_points:
         return df
     
+    if 'value' in df.columns and pd.api.types.is_numeric_dtype(df['value']):
+        y = df['value'].to_numpy(dtype=float)
+        valid = np.flatnonzero(np.isfinite(y))
+        if len(valid) > max_points:
+            if 'date' in df.columns and pd.api.types.is_datetime64_any_dtype(df['date']):
+                x = df['date'].to_numpy(dtype='datetime64[ns]').view(np.int64)[valid].astype(float)
+            else:
+                x = valid.astype(float)
+            picked = valid[downsample_indices(x, y[valid], max_points)]
+            return df.iloc[picked].copy()
+
     # Calculate step size
     step = max(1, len(df) // max_points)
     return df.iloc[::step].copy()
 
 
-def preprocess_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+DATE_SAMPLE_SIZE = 200
+DATE_FORMAT_CACHE_SIZE = 256
+COMMON_DATE_FORMATS = [
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y/%m/%d',
+    '%m/%d/%Y', '%d/%m/%Y', '%d.%m.%Y', '%Y-%m', '%b %d, %Y', '%d %b %Y'
+]
+
+# Detected date schema per dataset schema (column names + dtypes), most recent last
+_date_schema_cache = OrderedDict()
+
+ANALYSIS_CACHE_SIZE = 64
+# analyze_csv results per content fingerprint, most recent last
+_analysis_cache = OrderedDict()
+
+
+def _sample_values(series: pd.Series, sample_size: int = DATE_SAMPLE_SIZE) -> pd.Series:
     """
-    Intelligently identifies date columns, converts them, and sorts the dataset.
+    Evenly spaced sample of non-null values (head-only samples miss late format changes).
     """
-    df = df.copy()
-    
-    # 1. Identify Date Column
+    values = series.dropna()
+    if len(values) <= sample_size:
+        return values
+    positions = np.linspace(0, len(values) - 1, sample_size).astype(int)
+    return values.iloc[positions]
+
+
+def infer_date_format(series: pd.Series):
+    """
+    Infers an explicit parse format for a candidate date column from a small sample.
+    Returns a strptime format, one of the special tokens 'year', 'epoch_s', 'epoch_ms',
+    'numeric', or None if the column does not look like dates.
+    """
+    sample = _sample_values(series)
+    if sample.empty:
+        return None
+
+    if pd.api.types.is_numeric_dtype(series):
+        # Heuristic: small values are years, large values are epoch seconds / milliseconds
+        sample_val = sample.iloc[0]
+        if sample_val < 3000:
+            return 'year'
+        if sample_val > 1e11:
+            return 'epoch_ms'
+        if sample_val > 1e8:
+            return 'epoch_s'
+        return 'numeric'
+
+    sample = sample.astype(str).str.strip()
+    candidates = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for value in sample.iloc[:5]:
+            for dayfirst in (False, True):
+                fmt = guess_datetime_format(value, dayfirst=dayfirst)
+                if fmt and fmt not in candidates:
+                    candidates.append(fmt)
+    candidates += [f for f in COMMON_DATE_FORMATS if f not in candidates]
+
+    # The format must parse every sampled value
+    for fmt in candidates:
+        if _format_matches(sample, fmt):
+            return fmt
+    return None
+
+
+def _format_matches(sample: pd.Series, fmt: str) -> bool:
+    return bool(pd.to_datetime(sample, format=fmt, errors='coerce').notna().all())
+
+
+_FIXED_WIDTH_FIELDS = {'%Y': ('year', 4), '%m': ('month', 2), '%d': ('day', 2), '%H': ('hour', 2), '%M': ('minute', 2), '%S': ('second', 2)}
+
+
+def _parse_fixed_width(series: pd.Series, fmt: str):
+    """
+    Fast path for zero-padded numeric formats (e.g. '%d/%m/%Y %H:%M'): slices digit
+    positions out of a fixed-width byte matrix instead of running strptime per element.
+    Returns None when the column does not fit the layout, so the caller can fall back.
+    """
+    # Compile the format into (field, offset, width) slots and literal separators
+    fields, literals, pos, i = [], [], 0, 0
+    while i < len(fmt):
+        token = fmt[i:i + 2]
+        if token in _FIXED_WIDTH_FIELDS:
+            name, width = _FIXED_WIDTH_FIELDS[token]
+            fields.append((name, pos, width))
+            pos += width
+            i += 2
+        elif fmt[i] == '%':
+            return None
+        else:
+            literals.append((pos, ord(fmt[i])))
+            pos += 1
+            i += 1
+    if not any(name == 'year' for name, _, _ in fields):
+        return None
+
+    mask = series.notna().to_numpy()
+    try:
+        raw = series[mask].to_numpy().astype('S')
+    except (UnicodeEncodeError, ValueError, TypeError):
+        return None
+    if raw.dtype.itemsize != pos:
+        return None
+    grid = raw.view(np.uint8).reshape(len(raw), pos)
+    if (grid[:, -1] == 0).any() or any((grid[:, p] != c).any() for p, c in literals):
+        return None
+
+    digits = grid.astype(np.int64) - 48
+    parts = {}
+    for name, offset, width in fields:
+        block = digits[:, offset:offset + width]
+        if ((block < 0) | (block > 9)).any():
+            return None
+        parts[name] = block @ (10 ** np.arange(width - 1, -1, -1))
+    parts.setdefault('month', 1)
+    parts.setdefault('day', 1)
+
+    parsed = pd.to_datetime(pd.DataFrame(parts), errors='coerce')
+    result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    result[mask] = parsed.to_numpy()
+    return result
+
+
+def parse_dates(series: pd.Series, fmt) -> pd.Series:
+    """
+    Single vectorized parse of a date column using a format from `infer_date_format`.
+    """
+    if fmt == 'year':
+        years = pd.to_numeric(series, errors='coerce').round().astype('Int64').astype(str)
+        return pd.to_datetime(years, format='%Y', errors='coerce')
+    if fmt == 'epoch_ms':
+        return pd.to_datetime(series, unit='ms', errors='coerce')
+    if fmt == 'epoch_s':
+        return pd.to_datetime(series, unit='s', errors='coerce')
+    if fmt in (None, 'numeric'):
+        return pd.to_datetime(series, errors='coerce')
+    if series.dtype == 'object':
+        fast = _parse_fixed_width(series, fmt)
+        if fast is not None:
+            return fast
+    return pd.to_datetime(series, format=fmt, errors='coerce')
+
+
+def _schema_key(df: pd.DataFrame) -> tuple:
+    return tuple((str(col), str(dtype)) for col, dtype in df.dtypes.items())
+
+
+def infer_date_schema(df: pd.DataFrame) -> dict:
+    """
+    Identifies the date column and its parse format from a sample.
+    Results are cached per dataset schema, so repeated uploads/chunks skip detection.
+    """
+    key = _schema_key(df)
+    cached = _date_schema_cache.get(key)
+    if cached is not None:
+        # Same schema can still carry a different format (e.g. day-first exports); re-check on a sample
+        col, fmt = cached["column"], cached["format"]
+        if col is None or fmt in (None, 'year', 'epoch_s', 'epoch_ms', 'numeric') or \
+                _format_matches(_sample_values(df[col]).astype(str).str.strip(), fmt):
+            _date_schema_cache.move_to_end(key)
+            return cached
+
     date_col = None
+    date_format = None
     common_names = ['date', 'time', 'timestamp', 'year', 'month', 'day', 'ds', 'datetime']
     
     # Check by name
     for col in df.columns:
-        if col.lower() in common_names:
+        if str(col).lower() in common_names:
             date_col = col
+            date_format = infer_date_format(df[col])
             break
             
-    # Check by dtype (if object, try converting)
+    # Check by dtype (if object, try a sampled format inference)
     if not date_col:
         for col in df.columns:
             if df[col].dtype == 'object':
-                try:
-                    pd.to_datetime(df[col], errors='raise')
+                fmt = infer_date_format(df[col])
+                if fmt:
                     date_col = col
+                    date_format = fmt
                     break
-                except:
-                    continue
 
-    # 2. Convert and Sort
+    schema = {"column": date_col, "format": date_format}
+    _date_schema_cache[key] = schema
+    if len(_date_schema_cache) > DATE_FORMAT_CACHE_SIZE:
+        _date_schema_cache.popitem(last=False)
+    return schema
+
+
+def preprocess_dataframe(df: pd.DataFrame, date_schema: dict = None) -> pd.DataFrame:
+    """
+    Intelligently identifies date columns, converts them, and sorts the dataset.
+    """
+    df = df.copy()
+    
+    # 1. Identify Date Column (sampled inference, cached per schema)
+    if date_schema is None:
+        date_schema = infer_date_schema(df)
+    date_col = date_schema["column"]
+    if date_col not in df.columns:
+        date_col = None
+
+    # 2. Convert and Sort (one format-specified parse)
     if date_col:
-        # Check if numerical
-        if pd.api.types.is_numeric_dtype(df[date_col]):
-            # Heuristic: If values are small (e.g. years), convert to string first to force Year parsing
-            sample_val = df[date_col].dropna().iloc[0]
-            if sample_val < 3000: 
-                # Likely a Year (e.g. 2022)
-                df[date_col] = pd.to_datetime(df[date_col].astype(str), format='%Y', errors='coerce')
-            else:
-                 if sample_val > 1e11: # ms or ns
-                     df[date_col] = pd.to_datetime(df[date_col], unit='ms', errors='coerce')
-                 elif sample_val > 1e8: # seconds
-                     df[date_col] = pd.to_datetime(df[date_col], unit='s', errors='coerce')
-                 else:
-                     df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-        else:
-            df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-            
+        df[date_col] = parse_dates(df[date_col], date_schema["format"])
         df = df.sort_values(by=date_col)
-        df.rename(columns={date_col: 'date'}, inplace=True)
+        if date_col != 'date':
+            _make_room(df, 'date')
+            df.rename(columns={date_col: 'date'}, inplace=True)
     
     # 3. Aggressive Numeric Conversion
-    # Try to convert object columns to numeric (handling currency symbols, commas)
+    df = coerce_numeric_columns(df)
+
+    # 4. Normalize Value Column (for Frontend consistency)
+    target_col = find_target_column(df, exclude=['date'])
+    # Rename to 'value' for standard processing if needed
+    if target_col and target_col != 'value':
+         _make_room(df, 'value')
+         df.rename(columns={target_col: 'value'}, inplace=True)
+
+    return df
+
+
+def _make_room(df: pd.DataFrame, name: str):
+    # Another column already named `name` keeps a numbered suffix, as in the columnar copy
+    if name in df.columns:
+        i = 1
+        while f"{name}_{i}" in df.columns:
+            i += 1
+        df.rename(columns={name: f"{name}_{i}"}, inplace=True)
+
+
+def clean_numeric(series: pd.Series) -> pd.Series:
+    """
+    Strips currency symbols / thousands separators and converts to float (invalid -> NaN).
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    cleaned = series.astype(str).str.replace(r'[$,]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce').astype('float64')
+
+
+def coerce_numeric_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Try to convert object columns to numeric (handling currency symbols, commas)
+    """
     for col in df.columns:
         if df[col].dtype == 'object':
             try:
@@ -77,11 +293,15 @@ def preprocess_dataframe(df: pd.DataFrame) -> pd.DataFrame:
                     df[col] = converted
             except:
                 pass
+    return df
 
-    # 4. Normalize Value Column (for Frontend consistency)
-    # Identify the first numeric column that is NOT the date column
+
+def find_target_column(df: pd.DataFrame, exclude: list = None):
+    """
+    Identify the first numeric column that is NOT the date column, preferring business metric names.
+    """
     numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    if 'date' in numeric_cols: numeric_cols.remove('date')
+    numeric_cols = [c for c in numeric_cols if c not in (exclude or [])]
     
     # If we have numeric columns, look for a likely target
     target_col = None
@@ -90,7 +310,7 @@ def preprocess_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     if len(numeric_cols) > 0:
         # 1. Check priority names
         for name in priority_names:
-            matches = [c for c in numeric_cols if name in c.lower()]
+            matches = [c for c in numeric_cols if name in str(c).lower()]
             if matches:
                 target_col = matches[0]
                 break
@@ -98,27 +318,61 @@ def preprocess_dataframe(df: pd.DataFrame) -> pd.DataFrame:
         # 2. Fallback to first numeric column
         if not target_col:
             target_col = numeric_cols[0]
-            
-        # Rename to 'value' for standard processing if needed
-        if target_col and target_col != 'value':
-             df.rename(columns={target_col: 'value'}, inplace=True)
 
-    return df
+    return target_col
 
 async def analyze_csv(df: pd.DataFrame) -> dict:
     """
     Analyzes the uploaded CSV dataframe and returns insights, precautions, and graph config.
+    The pandas work runs on the compute tier, never on the event loop.
+    """
+    compute = get_compute()
+
+    # Identical content is answered from the cache
+    key = await compute.run_local(dataframe_fingerprint, df)
+    if key in _analysis_cache:
+        _analysis_cache.move_to_end(key)
+        return copy.deepcopy(_analysis_cache[key])
+
+    result = await compute.run(analyze_frame, df)
+    _analysis_cache[key] = copy.deepcopy(result)
+    if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+        _analysis_cache.popitem(last=False)
+    return result
+
+
+def analyze_frame(df: pd.DataFrame) -> dict:
+    """
+    Blocking body of analyze_csv (runs in a compute worker).
     """
     # Ensure processed
     if 'date' not in [c.lower() for c in df.columns]:
          df = preprocess_dataframe(df)
 
-    columns = [c.lower() for c in df.columns]
+    # One pass over row batches for the profile, a second one for the listed anomalies
+    return analysis_from_profile(profile_dataframe(df), frame_batches(df))
+
+
+def dataframe_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame (column names, dtypes and values; vectorized row hashing).
+    """
+    digest = hashlib.sha256(repr(_schema_key(df)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def analysis_from_profile(profile: StreamingProfile, batches) -> dict:
+    """
+    Builds the analysis/metrics/radar payload from a (possibly merged) streaming profile;
+    `batches` yields the profiled rows again, for the anomalies outside the IQR bounds.
+    """
+    columns = [c.lower() for c in (profile.columns or [])]
     
     # Initialize Structure
     result = {
         "analysis": {
-            "columns": list(df.columns),
+            "columns": list(profile.columns or []),
             "graph_type": "bar",
             "precautions": [],
             "recommendations": [],
@@ -151,19 +405,19 @@ async def analyze_csv(df: pd.DataFrame) -> dict:
         result["analysis"]["graph_type"] = "bar"
 
     # 2. Advanced Metrics & Anomalies
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    if len(numeric_cols) > 0:
-        target = df[numeric_cols[0]]
+    if profile.target is not None:
+        target = profile.column
         
         # Basic Stats
-        mean_val = target.mean()
-        std_val = target.std()
-        min_val = target.min()
-        max_val = target.max()
-        total_val = target.sum()
+        mean_val = target.mean if target.n else float('nan')
+        std_val = target.std
+        min_val = target.min[0] if target.min else float('nan')
+        max_val = target.max[0] if target.max else float('nan')
+        total_val = target.total
+        q1, median_val, q3 = target.quantile([0.25, 0.5, 0.75])
         
         result["metrics"]["mean"] = float(mean_val)
-        result["metrics"]["median"] = float(target.median())
+        result["metrics"]["median"] = float(median_val)
         result["metrics"]["std_dev"] = float(std_val)
         result["metrics"]["min"] = float(min_val)
         result["metrics"]["max"] = float(max_val)
@@ -178,8 +432,8 @@ async def analyze_csv(df: pd.DataFrame) -> dict:
              result["metrics"]["volatility"] = "Medium"
         
         # Growth (Robust)
-        start_val = target.iloc[0]
-        end_val = target.iloc[-1]
+        start_val = target.first[2]
+        end_val = target.last[2]
         
         if start_val == 0:
             growth = 100 if end_val > 0 else 0
@@ -197,21 +451,20 @@ async def analyze_csv(df: pd.DataFrame) -> dict:
             result["radar"][4]["A"] = 60 # Resilience decreased
 
         # Anomaly Detection (IQR Method)
-        q1 = target.quantile(0.25)
-        q3 = target.quantile(0.75)
         iqr = q3 - q1
         lower_bound = q1 - 1.5 * iqr
         upper_bound = q3 + 1.5 * iqr
         
-        anomalies = df[(target < lower_bound) | (target > upper_bound)]
+        # Exact check from min/max; listed anomalies are the first rows out of bounds
+        has_anomalies = target.n > 0 and (min_val < lower_bound or max_val > upper_bound)
+        outliers = profile.outliers(batches, lower_bound, upper_bound, limit=5) if has_anomalies else []
         
-        for idx, row in anomalies.head(5).iterrows():
-            date_val = row.get('date', f'Row {idx}')
+        for val, key, pos in outliers:
+            date_val = profile.label(key, pos)
             date_str = str(date_val)
-            if hasattr(date_val, 'strftime'):
+            if hasattr(date_val, 'strftime') and not pd.isnull(date_val):
                 date_str = date_val.strftime('%Y-%m-%d')
                 
-            val = row[numeric_cols[0]]
             reason = "Spike detected" if val > upper_bound else "Drop detected"
             result["analysis"]["anomalies"].append({
                 "date": date_str,
@@ -220,16 +473,16 @@ async def analyze_csv(df: pd.DataFrame) -> dict:
             })
             
         # Data Quality Score
-        null_count = df.isnull().sum().sum()
-        total_cells = df.size
-        quality_score = max(0, 100 - int((null_count / total_cells) * 100) - (5 if len(anomalies) > 0 else 0))
+        null_count = profile.null_cells
+        total_cells = profile.total_cells
+        quality_score = max(0, 100 - int((null_count / total_cells) * 100) - (5 if has_anomalies else 0))
         result["radar"][3]["A"] = quality_score
         
         if null_count > 0:
              result["analysis"]["precautions"].append(f"Data contains {null_count} missing values.")
 
         # 3. Recommendations & Narrative Insights
-        if len(df) < 50:
+        if profile.rows < 50:
             result["analysis"]["precautions"].append("Small dataset size. Forecast confidence reduced.")
             result["radar"][0]["A"] = 65 
         else:
@@ -237,16 +490,16 @@ async def analyze_csv(df: pd.DataFrame) -> dict:
 
         # Narrative Generation (Moved inside check)
         # Peak Analysis
-        peak_idx = target.idxmax()
-        peak_val = target.max()
-        peak_date = df.loc[peak_idx]['date'] if 'date' in df.columns else f"Row {peak_idx}"
-        result["analysis"]["insights"].append(f"Historical peak of {peak_val:,.2f} reached on {str(peak_date).split(' ')[0]}.")
+        if target.max:
+            peak_val, peak_key, peak_pos = target.max
+            peak_date = profile.label(peak_key, peak_pos)
+            result["analysis"]["insights"].append(f"Historical peak of {peak_val:,.2f} reached on {str(peak_date).split(' ')[0]}.")
 
         # Trough Analysis
-        min_idx = target.idxmin()
-        min_val = target.min()
-        min_date = df.loc[min_idx]['date'] if 'date' in df.columns else f"Row {min_idx}"
-        result["analysis"]["insights"].append(f"Lowest point recorded at {min_val:,.2f} on {str(min_date).split(' ')[0]}.")
+        if target.min:
+            min_val, min_key, min_pos = target.min
+            min_date = profile.label(min_key, min_pos)
+            result["analysis"]["insights"].append(f"Lowest point recorded at {min_val:,.2f} on {str(min_date).split(' ')[0]}.")
 
         # Volatility Narrative
         if cov > 0.5:
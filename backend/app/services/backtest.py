@@ -0,0 +1,255 @@
+import time
+import asyncio
+import logging
+import numpy as np
+import pandas as pd
+from app.core.config import get_settings
+from app.services.compute import get_compute, shared
+from app.services.ensemble import (
+    MODELS, MEMBERS, ENGINE_VERSION, infer_frequency, blend_weights, lag_features, xgboost_lags, new_xgboost
+)
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+BACKTEST_MODES = "^(expanding|rolling)$"
+MIN_TRAIN = 30
+MAX_FOLDS = 20
+
+
+class BacktestError(ValueError):
+    """The dataset or configuration does not allow a backtest."""
+
+
+def fold_origins(n: int, horizon: int, folds: int, step: int, min_train: int) -> list:
+    """
+    Forecast origins (index of the first forecast row), oldest first: the last fold ends at
+    the end of the history and earlier folds step back by `step` rows.
+    """
+    origins = [n - horizon - k * step for k in reversed(range(folds))]
+    return [o for o in origins if o >= min_train]
+
+
+def backtest_fold(name: str, data: dict, origin: int, train_start: int, steps: int, freq: str) -> dict:
+    """
+    Fits one member on rows [train_start, origin) and forecasts `steps` rows (runs in a compute
+    worker). The series, dates and the XGBoost lag matrix arrive as shared-memory views built
+    once for all folds; XGBoost trains on a slice of the matrix rather than rebuilding it.
+    """
+    y, ds = data["y"], data["ds"]
+    started = time.perf_counter()
+    try:
+        if name == "xgboost":
+            lags = data["lags"]
+            # Feature row r predicts y[r + lags]
+            rows = slice(train_start, origin - lags)
+            model = new_xgboost()
+            model.fit(data["features"][rows], data["target"][rows])
+            state = {"model": model, "lags": lags, "tail": y[origin - lags:origin], "last_date": ds[origin - 1], "freq": freq}
+            forecast = MEMBERS[name][1](state, steps)
+        else:
+            fit, predict = MEMBERS[name]
+            history = pd.DataFrame({"ds": ds[train_start:origin], "y": y[train_start:origin]})
+            forecast = predict(fit(history, freq), steps)
+        forecast = np.asarray(forecast, dtype=float)
+        if not np.isfinite(forecast).all():
+            raise ValueError("non-finite predictions")
+        return {"model": name, "origin": origin, "forecast": forecast, "seconds": time.perf_counter() - started}
+    except Exception as e:
+        return {"model": name, "origin": origin, "error": str(e), "seconds": time.perf_counter() - started}
+
+
+def _errors(predicted: np.ndarray, actual: np.ndarray, horizons: list) -> dict:
+    """
+    MAE / RMSE / MAPE over the first h steps of every fold, per requested horizon.
+    """
+    metrics = {}
+    for h in horizons:
+        err = predicted[:, :h] - actual[:, :h]
+        nonzero = actual[:, :h] != 0
+        mape = float(np.mean(np.abs(err[nonzero] / actual[:, :h][nonzero])) * 100) if nonzero.any() else None
+        metrics[str(h)] = {
+            "mae": float(np.mean(np.abs(err))),
+            "rmse": float(np.sqrt(np.mean(err ** 2))),
+            "mape": mape,
+        }
+    return metrics
+
+
+def score_folds(results: list, actual: np.ndarray, origins: list, horizons: list, models: list) -> dict:
+    """
+    Per-model and ensemble metrics. The ensemble is blended walk-forward: weights for a fold
+    are learned (NNLS) on the earlier folds only, equal weights for the first, so the score
+    is free of look-ahead. Members failing any fold are left out of the blend.
+    """
+    index = {o: i for i, o in enumerate(origins)}
+    predictions, failures = {}, {}
+    for name in models:
+        matrix = np.full(actual.shape, np.nan)
+        for result in results:
+            if result["model"] == name and not result.get("error"):
+                matrix[index[result["origin"]]] = result["forecast"]
+            elif result["model"] == name:
+                failures.setdefault(name, result["error"])
+        predictions[name] = matrix
+
+    metrics = {}
+    for name, matrix in predictions.items():
+        ok = ~np.isnan(matrix).any(axis=1)
+        metrics[name] = _errors(matrix[ok], actual[ok], horizons) if ok.any() else None
+
+    members = [n for n in models if n not in failures]
+    if not members:
+        return {"metrics": metrics, "failures": failures, "weights": {}, "residuals": []}
+    blended = np.empty(actual.shape)
+    for i in range(len(origins)):
+        if i == 0:
+            weights = {n: 1.0 / len(members) for n in members}
+        else:
+            weights = blend_weights({n: predictions[n][:i].ravel() for n in members}, actual[:i].ravel())
+        blended[i] = sum(weights[n] * predictions[n][i] for n in members)
+    metrics["ensemble"] = _errors(blended, actual, horizons)
+    final = blend_weights({n: predictions[n].ravel() for n in members}, actual.ravel())
+    return {"metrics": metrics, "failures": failures, "weights": final, "residuals": (actual - blended).tolist()}
+
+
+def backtest_params(horizons: list, folds: int, mode: str, window: int, step: int, models: list, freq: str) -> dict:
+    return {
+        "kind": "backtest",
+        "engine": ENGINE_VERSION,
+        "horizons": horizons,
+        "folds": folds,
+        "mode": mode,
+        "window": window,
+        "step": step,
+        "models": models,
+        "frequency": freq,
+    }
+
+
+async def run_backtest(dataset_id: int, horizons: list = None, folds: int = 5, mode: str = "expanding", window: int = None,
+                       step: int = None, models: list = None, on_progress=None, registry=None) -> dict:
+    """
+    Backtest of a stored dataset (see backtest_history).
+    """
+    from app.services.forecasting import load_dataset
+
+    df, is_time_series = await load_dataset(dataset_id)
+    if df is None or df.empty:
+        raise BacktestError(f"Dataset {dataset_id} could not be loaded")
+    if is_time_series:
+        history = df[["ds", "y"]]
+    else:
+        # Categorical datasets are evaluated in row order on a synthetic daily axis, as forecast
+        history = pd.DataFrame({
+            "ds": pd.date_range(end=pd.Timestamp.today().normalize(), periods=len(df), freq="D"),
+            "y": df["value"].to_numpy(dtype=float),
+        })
+    result = await backtest_history(history, horizons, folds, mode, window, step, models, on_progress, registry)
+    return {**result, "dataset_id": dataset_id}
+
+
+async def backtest_history(history: pd.DataFrame, horizons: list = None, folds: int = 5, mode: str = "expanding", window: int = None,
+                           step: int = None, models: list = None, on_progress=None, registry=None) -> dict:
+    """
+    Rolling-origin evaluation of the ensemble members on a ds/y history. Each fold fits on the
+    history before its origin (all of it for 'expanding', the last `window` rows for 'rolling')
+    and forecasts max(horizons) rows; metrics are reported per requested horizon.
+    Folds x models run in parallel on the compute tier; `on_progress(event)` is awaited as
+    each finishes. Results are cached in the model registry per dataset version and config.
+    """
+    from app.services.analysis import dataframe_fingerprint
+    from app.services.model_registry import get_model_registry, training_fingerprint
+
+    started = time.perf_counter()
+    horizons = sorted({int(h) for h in (horizons or [30])})
+    if horizons[0] < 1:
+        raise BacktestError("Horizons must be positive")
+    if not 1 <= folds <= MAX_FOLDS:
+        raise BacktestError(f"folds must be between 1 and {MAX_FOLDS}")
+    models = sorted(models or MODELS)
+    unknown = [m for m in models if m not in MODELS]
+    if unknown:
+        raise BacktestError(f"Unknown models: {', '.join(unknown)}")
+    history = history[["ds", "y"]].reset_index(drop=True)
+
+    compute = get_compute()
+    horizon = horizons[-1]
+    step = step or horizon
+    n = len(history)
+    origins = fold_origins(n, horizon, folds, step, max(MIN_TRAIN, window or 0) if mode == "rolling" else MIN_TRAIN)
+    if not origins:
+        raise BacktestError(f"History of {n} rows is too short for a {horizon}-step backtest")
+    window = (window or origins[0]) if mode == "rolling" else None
+    freq = infer_frequency(history["ds"])
+
+    registry = registry or get_model_registry()
+    params = backtest_params(horizons, folds, mode, window, step, models, freq)
+    fingerprint = training_fingerprint(await compute.run_local(dataframe_fingerprint, history), params)
+    cached = await registry.get(fingerprint)
+    if cached is not None:
+        logger.info(f"Backtest {fingerprint[:12]} served from cache")
+        return {**cached, "cached": True, "seconds": time.perf_counter() - started}
+
+    # The lag matrix is built once, for the shortest training window, and sliced per fold
+    y = history["y"].to_numpy(dtype=float)
+    ds = history["ds"].to_numpy(dtype="datetime64[ns]")
+    lags = xgboost_lags(window or origins[0])
+    features, target = await compute.run_local(lag_features, y, history["ds"].iloc[lags:], lags)
+
+    total = len(origins) * len(models)
+    done = 0
+    slots = asyncio.Semaphore(compute.workers)  # stay within the pool instead of filling its queue
+    with shared(y, ds, features, target) as (y_shared, ds_shared, features_shared, target_shared):
+        data = {"y": y_shared, "ds": ds_shared, "features": features_shared, "target": target_shared, "lags": lags}
+
+        async def job(name, origin):
+            nonlocal done
+            train_start = origin - window if mode == "rolling" else 0
+            async with slots:
+                try:
+                    result = await compute.run(backtest_fold, name, data, origin, train_start, horizon, freq)
+                except Exception as e:
+                    result = {"model": name, "origin": origin, "error": str(e), "seconds": None}
+            done += 1
+            if on_progress is not None:
+                await on_progress({
+                    "type": "backtest.progress",
+                    "done": done,
+                    "total": total,
+                    "model": name,
+                    "origin": str(pd.Timestamp(ds[origin]).date()),
+                    "seconds": result["seconds"],
+                    "error": result.get("error"),
+                })
+            return result
+
+        results = await asyncio.gather(*(job(name, origin) for origin in origins for name in models))
+
+    actual = np.stack([y[o:o + horizon] for o in origins])
+    scored = score_folds(results, actual, origins, horizons, models)
+    ensemble = scored["metrics"].get("ensemble")
+    result = {
+        "mode": mode,
+        "window": window,
+        "step": step,
+        "horizons": horizons,
+        "frequency": freq,
+        "folds": [
+            {"origin": str(pd.Timestamp(ds[o]).date()), "train_rows": o - (o - window if mode == "rolling" else 0)}
+            for o in origins
+        ],
+        "metrics": scored["metrics"],
+        "summary": ensemble[str(horizon)] if ensemble else None,
+        "weights": scored["weights"],
+        "failures": scored["failures"],
+        "residuals": scored["residuals"],
+        "fingerprint": fingerprint,
+    }
+    if ensemble is not None:
+        try:
+            await registry.put(fingerprint, result, metadata={"params": params, "metrics": {
+                "mae": ensemble[str(horizon)]["mae"], "rmse": ensemble[str(horizon)]["rmse"]}})
+        except Exception as e:
+            logger.error(f"Failed to cache backtest {fingerprint[:12]}: {e}")
+    return {**result, "cached": False, "seconds": time.perf_counter() - started}
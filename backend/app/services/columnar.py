@@ -0,0 +1,227 @@
+import os
+import logging
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from functools import lru_cache
+from app.services.storage import ObjectStorage, get_storage
+from app.services.downsampling import Pyramid
+from app.services.analysis import (
+    infer_date_schema, parse_dates, clean_numeric, coerce_numeric_columns, find_target_column
+)
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "datasets"
+# Role columns of the columnar copy, plus 'date' (the profiler's name for ds)
+RESERVED_NAMES = ("ds", "y", "category", "value", "date")
+
+
+def columnar_key(key: str) -> str:
+    return f"{key}.parquet"
+
+
+def pyramid_key(key: str) -> str:
+    return f"{key}.pyramid.npz"
+
+
+def resolve_roles(batch: pd.DataFrame, exclude: list = None, target: str = None) -> dict:
+    """
+    Resolves the forecasting roles (ds/y for time series, category/value otherwise)
+    and the typed layout of every other column from the first parsed batch.
+    `target` forces the value column; columns in `exclude` are never inferred as it.
+    """
+    exclude = list(exclude or [])
+    date_schema = infer_date_schema(batch)
+    converted = coerce_numeric_columns(batch.copy())
+    date_col = date_schema["column"]
+
+    # A name-matched date column that does not parse is not a time axis
+    if date_col is not None and parse_dates(batch[date_col], date_schema["format"]).isnull().all():
+        date_col = None
+
+    target_col = target or find_target_column(converted, exclude=[date_col, *exclude])
+    if target_col is None and len(batch.columns) >= 2 and batch.columns[1] not in exclude:
+        # Fallback: second column is the value (legacy "first two columns" rule)
+        target_col = batch.columns[1]
+
+    if date_col is not None:
+        roles = {"kind": "time_series", "ds": date_col, "y": target_col, "date_format": date_schema["format"]}
+    else:
+        remaining = [c for c in batch.columns if c != target_col]
+        non_numeric = [c for c in remaining if not pd.api.types.is_numeric_dtype(converted[c])]
+        category_col = (non_numeric or remaining or [None])[0]
+        roles = {"kind": "categorical", "category": category_col, "value": target_col}
+
+    role_sources = {roles.get("ds"), roles.get("y"), roles.get("category"), roles.get("value")}
+    others = [c for c in batch.columns if c not in role_sources]
+    roles["numeric"] = [c for c in others if pd.api.types.is_numeric_dtype(converted[c])]
+    roles["text"] = [c for c in others if c not in roles["numeric"]]
+    roles["renamed"] = stored_names(others, [str(c) for c in batch.columns])
+    return roles
+
+
+def stored_names(columns: list, taken: list) -> dict:
+    """
+    Columnar names of other columns that collide with the role names: a numbered suffix,
+    e.g. a 'value' column next to date/sales is stored as 'value_1'.
+    """
+    taken = set(taken) | set(RESERVED_NAMES)
+    renamed = {}
+    for column in columns:
+        if str(column) not in RESERVED_NAMES:
+            continue
+        i = 1
+        while f"{column}_{i}" in taken:
+            i += 1
+        renamed[str(column)] = f"{column}_{i}"
+        taken.add(renamed[str(column)])
+    return renamed
+
+
+def stored_name(roles: dict, column) -> str:
+    """
+    Name of a dataset column in its columnar copy (other than the role columns).
+    """
+    return (roles.get("renamed") or {}).get(str(column), str(column))
+
+
+def to_columnar(batch: pd.DataFrame, roles: dict) -> pd.DataFrame:
+    """
+    Converts a raw parsed batch into the typed columnar layout (role columns first).
+    """
+    out = {}
+    if roles["kind"] == "time_series":
+        ds = parse_dates(batch[roles["ds"]], roles["date_format"])
+        if getattr(ds.dt, "tz", None) is not None:
+            ds = ds.dt.tz_convert(None)
+        out["ds"] = ds.astype("datetime64[ns]")
+        out["y"] = clean_numeric(batch[roles["y"]]) if roles["y"] is not None else pd.Series(float("nan"), index=batch.index)
+    else:
+        out["category"] = batch[roles["category"]].astype("string") if roles["category"] is not None else pd.Series(pd.NA, index=batch.index, dtype="string")
+        out["value"] = clean_numeric(batch[roles["value"]]) if roles["value"] is not None else pd.Series(float("nan"), index=batch.index)
+
+    for col in roles["numeric"]:
+        out[stored_name(roles, col)] = clean_numeric(batch[col])
+    for col in roles["text"]:
+        out[stored_name(roles, col)] = batch[col].astype("string")
+    return pd.DataFrame(out, index=batch.index).reset_index(drop=True)
+
+
+class ColumnarWriter:
+    """
+    Appends typed batches to a local Parquet file during ingest, then uploads it
+    next to the raw CSV. Roles are resolved from the first batch unless given.
+    """
+    def __init__(self, key: str, storage: ObjectStorage = None, roles: dict = None):
+        self.key = columnar_key(key)
+        self.storage = storage or get_storage(BUCKET)
+        self.roles = roles
+        self.schema = None
+        self.writer = None
+        fd, self.path = tempfile.mkstemp(suffix=".parquet")
+        os.close(fd)
+
+    def write(self, batch: pd.DataFrame):
+        if self.roles is None:
+            self.roles = resolve_roles(batch)
+        frame = to_columnar(batch, self.roles)
+        if self.writer is None:
+            self.schema = pa.Schema.from_pandas(frame, preserve_index=False)
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+        return frame
+
+    def extend(self, key: str):
+        """
+        Starts the file with the row groups of a stored columnar file, streamed one row
+        group at a time, so the batches written next follow them. Blocking.
+        """
+        source = pq.ParquetFile(self.storage.open_range_reader(key))
+        self.schema = source.schema_arrow
+        self.writer = pq.ParquetWriter(self.path, self.schema)
+        for i in range(source.num_row_groups):
+            self.writer.write_table(source.read_row_group(i))
+        return source.metadata.num_rows
+
+    def finalize(self):
+        """
+        Closes the local Parquet file (it stays readable at `self.path` until `close`).
+        """
+        if self.writer is not None and self.writer.is_open:
+            self.writer.close()
+
+    async def close(self, key: str = None):
+        """
+        Uploads the file (under `key` when given) and returns its key; None without rows.
+        """
+        try:
+            if self.writer is None:
+                return None
+            self.key = key or self.key
+            self.finalize()
+            await self.storage.aput_file(self.key, self.path)
+            return self.key
+        finally:
+            self._cleanup()
+
+    def abort(self):
+        self.finalize()
+        self._cleanup()
+
+    def _cleanup(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def load_columnar(key: str, columns: list = None, bucket: str = BUCKET, filters: list = None) -> pd.DataFrame:
+    """
+    Loads selected columns of a dataset's columnar file (no text parsing).
+    Range reads fetch only the footer and the requested column chunks; `filters`
+    are pushed down to Parquet row groups (e.g. a ds window). Blocking.
+    """
+    reader = get_storage(bucket).open_range_reader(key)
+    return pq.read_table(reader, columns=columns, filters=filters).to_pandas()
+
+
+def iter_columnar(key: str, columns: list = None, bucket: str = BUCKET, batch_rows: int = 65536):
+    """
+    Streams selected columns of a dataset's columnar file as DataFrames of at most
+    `batch_rows` rows, read by range requests one row group at a time. Blocking.
+    """
+    reader = get_storage(bucket).open_range_reader(key)
+    for batch in pq.ParquetFile(reader).iter_batches(batch_size=batch_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+async def save_pyramid(key: str, pyramid: Pyramid, storage: ObjectStorage = None) -> str:
+    storage = storage or get_storage(BUCKET)
+    await storage.aput(key, pyramid.to_bytes(), "application/octet-stream")
+    return key
+
+
+@lru_cache(maxsize=32)
+def load_pyramid(key: str, bucket: str = BUCKET) -> Pyramid:
+    """
+    Pyramids are immutable once written, so decoded copies are cached per key. Blocking.
+    """
+    return Pyramid.from_bytes(get_storage(bucket).get(key))
+
+
+def load_dataset_frame(dataset):
+    """
+    Loads the role columns a forecast needs from the columnar copy of a dataset.
+    Returns (df, is_time_series), or None when the dataset has no columnar copy. Blocking.
+    """
+    meta = dataset.metadata_info or {}
+    key, roles = meta.get("columnar_key"), meta.get("roles")
+    if not key or not roles:
+        return None
+
+    if roles["kind"] == "time_series":
+        df = load_columnar(key, columns=["ds", "y"]).dropna()
+        return df.sort_values("ds"), True
+
+    df = load_columnar(key, columns=["category", "value"]).dropna()
+    return df, False
@@ -0,0 +1,283 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from multiprocessing import shared_memory
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SHARE_MIN_BYTES = 64 * 1024  # smaller arrays are cheaper to pickle than to map
+
+
+class ComputeBusyError(RuntimeError):
+    """Raised when the compute queue is full; callers should retry later (HTTP 503)."""
+
+
+class ComputeTimeoutError(TimeoutError):
+    """Raised when a job exceeds its time limit; the worker running it is killed."""
+
+
+class SharedArray:
+    """
+    Picklable handle to a numpy array placed in shared memory. Only the segment name,
+    shape and dtype cross the process boundary; the data is mapped, not copied through a pipe.
+    """
+    def __init__(self, name: str, shape: tuple, dtype: str):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    @classmethod
+    def create(cls, array: np.ndarray, handles: list) -> "SharedArray":
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        handles.append(shm)
+        return cls(shm.name, array.shape, array.dtype.str)
+
+    def attach(self, handles: list, copy: bool = False) -> np.ndarray:
+        shm = shared_memory.SharedMemory(name=self.name)
+        view = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=shm.buf)
+        if copy:
+            view = view.copy()
+        handles.append(shm)
+        return view
+
+
+class SharedFrame:
+    """
+    DataFrame handle: numeric, boolean and datetime columns go through shared memory,
+    other columns (strings, categoricals) and the index are pickled as usual.
+    """
+    def __init__(self, columns: list, index):
+        self.columns = columns  # (name, SharedArray | Series, dtype or None)
+        self.index = index
+
+    @classmethod
+    def create(cls, df: pd.DataFrame, handles: list) -> "SharedFrame":
+        columns = []
+        for name in df.columns:
+            col = df[name]
+            dtype = col.dtype
+            if isinstance(dtype, np.dtype) and dtype.kind in "biufM" and col.nbytes >= SHARE_MIN_BYTES:
+                values = col.to_numpy()
+                if dtype.kind == "M":
+                    values = values.view(np.int64)
+                columns.append((name, SharedArray.create(values, handles), dtype.str))
+            else:
+                columns.append((name, col.reset_index(drop=True), None))
+        return cls(columns, df.index)
+
+    def attach(self, handles: list, copy: bool = False) -> pd.DataFrame:
+        data = {}
+        for name, payload, dtype in self.columns:
+            if dtype is None:
+                data[name] = payload.set_axis(self.index)
+                continue
+            values = payload.attach(handles, copy=copy)
+            if np.dtype(dtype).kind == "M":
+                values = values.view(np.dtype(dtype))
+            data[name] = values
+        return pd.DataFrame(data, index=self.index, columns=[name for name, _, _ in self.columns])
+
+
+def _pack(obj, handles: list):
+    if isinstance(obj, pd.DataFrame) and not obj.columns.duplicated().any():
+        return SharedFrame.create(obj, handles)
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in "biufM" and obj.nbytes >= SHARE_MIN_BYTES:
+        return SharedArray.create(obj, handles)
+    if isinstance(obj, tuple):
+        return tuple(_pack(item, handles) for item in obj)
+    if isinstance(obj, list):
+        return [_pack(item, handles) for item in obj]
+    if isinstance(obj, dict):
+        return {key: _pack(value, handles) for key, value in obj.items()}
+    return obj
+
+
+def _unpack(obj, handles: list, copy: bool = False):
+    if isinstance(obj, (SharedArray, SharedFrame)):
+        return obj.attach(handles, copy=copy)
+    if isinstance(obj, tuple):
+        return tuple(_unpack(item, handles, copy) for item in obj)
+    if isinstance(obj, list):
+        return [_unpack(item, handles, copy) for item in obj]
+    if isinstance(obj, dict):
+        return {key: _unpack(value, handles, copy) for key, value in obj.items()}
+    return obj
+
+
+def _release(handles: list, unlink: bool = False):
+    for shm in handles:
+        try:
+            shm.close()
+        except BufferError:
+            # A view is still referenced; the mapping goes away with it
+            pass
+        if unlink:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+    handles.clear()
+
+
+@contextmanager
+def shared(*arrays):
+    """
+    Places arrays in shared memory once for many jobs: yields picklable SharedArray handles
+    (workers map them without copying, slices stay views) and unlinks the segments on exit.
+    """
+    handles = []
+    try:
+        yield [SharedArray.create(np.asarray(array), handles) for array in arrays]
+    finally:
+        _release(handles, unlink=True)
+
+
+def _run_job(fn, args, kwargs):
+    """
+    Worker-side entry point: maps shared inputs, runs the job and places large
+    results in new shared segments (the caller copies them out and unlinks them).
+    """
+    inputs, outputs = [], []
+    try:
+        result = fn(*_unpack(args, inputs), **_unpack(kwargs, inputs))
+        packed = _pack(result, outputs)
+        _release(outputs)
+        return packed
+    except BaseException:
+        _release(outputs, unlink=True)
+        raise
+    finally:
+        _release(inputs)
+
+
+class ComputePool:
+    """
+    Managed executor tier for CPU-bound analysis, forecasting and simulation work.
+
+    - `run` executes a picklable top-level function in a worker process.
+      At most `workers` jobs run at once; at most `max_queue` more may wait, beyond
+      that `ComputeBusyError` is raised instead of queueing without bound.
+    - Each job has a time limit; on expiry the pool is recycled (worker processes are
+      killed), and other jobs caught by the recycle are resubmitted once.
+    - `run_local` runs stateful in-process work (e.g. an incremental parser) on a thread,
+      so it never blocks the event loop either.
+    """
+    def __init__(self, workers: int = None, max_queue: int = 32, timeout: float = 300.0, start_method: str = "spawn"):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.context = multiprocessing.get_context(start_method)
+        self.executor = self._new_executor()
+        self.threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compute")
+        self.slots = None
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self.context)
+
+    def _recycle(self, broken):
+        if self.executor is not broken:
+            return  # already replaced by another job
+        self.executor = self._new_executor()
+        for process in list((getattr(broken, "_processes", None) or {}).values()):
+            process.terminate()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _admit(self):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.workers)
+        if self.queued >= self.max_queue and self.slots.locked():
+            self.rejected += 1
+            raise ComputeBusyError(f"Compute queue is full ({self.queued} jobs waiting)")
+
+    async def run(self, fn, *args, timeout: float = None, **kwargs):
+        self._admit()
+        timeout = self.timeout if timeout is None else timeout
+        self.queued += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            for attempt in range(2):
+                executor = self.executor
+                handles = []
+                try:
+                    future = executor.submit(_run_job, fn, _pack(args, handles), _pack(kwargs, handles))
+                    packed = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    self._recycle(executor)
+                    raise ComputeTimeoutError(f"{getattr(fn, '__name__', fn)} exceeded {timeout}s")
+                except BrokenProcessPool:
+                    self._recycle(executor)
+                    if attempt == 0:
+                        logger.warning(f"Compute pool was recycled; resubmitting {getattr(fn, '__name__', fn)}")
+                        continue
+                    raise
+                finally:
+                    _release(handles, unlink=True)
+
+                outputs = []
+                try:
+                    result = _unpack(packed, outputs, copy=True)
+                finally:
+                    _release(outputs, unlink=True)
+                self.completed += 1
+                return result
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self.slots.release()
+
+    async def run_local(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.threads, partial(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.threads.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache()
+def get_compute() -> ComputePool:
+    """
+    Process-wide compute tier (worker processes start lazily on first use).
+    """
+    return ComputePool(
+        workers=settings.COMPUTE_WORKERS or None,
+        max_queue=settings.COMPUTE_MAX_QUEUE,
+        timeout=settings.COMPUTE_JOB_TIMEOUT,
+        start_method=settings.COMPUTE_START_METHOD,
+    )
@@ -0,0 +1,228 @@
+import io
+import numpy as np
+import pandas as pd
+
+PYRAMID_BASE = 64      # rows per bucket at the finest stored level
+PYRAMID_FACTOR = 4     # buckets merged per step up the pyramid
+PYRAMID_TOP = 1024     # stop once a level has at most this many buckets
+BUCKET_FIELDS = ["t0", "t1", "ymin", "tmin", "imin", "ymax", "tmax", "imax", "ysum", "count"]
+
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Indices of the min and max of each of `n_buckets` equal row buckets (plus the endpoints).
+    Fully vectorized: the series is padded into a (buckets, size) matrix.
+    """
+    n = len(y)
+    if n_buckets <= 0 or n <= 2 * n_buckets:
+        return np.arange(n)
+    size = int(np.ceil(n / n_buckets))
+    rows = int(np.ceil(n / size))
+    padded = np.full(rows * size, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(rows, size)
+    offsets = np.arange(rows) * size
+    valid = ~np.isnan(grid).all(axis=1)
+    lows = offsets[valid] + np.nanargmin(grid[valid], axis=1)
+    highs = offsets[valid] + np.nanargmax(grid[valid], axis=1)
+    return np.unique(np.concatenate([[0, n - 1], lows, highs]))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keeps the point of each bucket that forms the largest
+    triangle with the previously kept point and the next bucket's average, so peaks survive.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+    sums_x = np.add.reduceat(x[1:n - 1], starts - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], starts - 1)
+    counts = np.maximum(ends - starts, 1)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = starts[i], max(ends[i], starts[i] + 1)
+        nx, ny = avg_x[i + 1], avg_y[i + 1]
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Shape-preserving selection of at most `max_points` rows. Very long series are first
+    reduced to per-bucket min/max candidates, then LTTB picks the final points.
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    candidates = np.arange(n)
+    if n > 8 * max_points:
+        candidates = minmax_indices(y, 2 * max_points)
+    picked = lttb_indices(x[candidates], y[candidates], max_points)
+    return candidates[picked]
+
+
+def _aggregate(buckets: dict, size: int) -> dict:
+    """
+    Merges every `size` consecutive buckets into one (the last group may be partial).
+    """
+    n = len(buckets["t0"])
+    groups = int(np.ceil(n / size))
+    pad = groups * size - n
+
+    def grid(name, fill):
+        values = buckets[name]
+        if pad:
+            values = np.concatenate([values, np.full(pad, fill, dtype=values.dtype)])
+        return values.reshape(groups, size)
+
+    starts = np.arange(groups) * size
+    last = np.minimum(starts + size, n) - 1
+    ymin, ymax = grid("ymin", np.inf), grid("ymax", -np.inf)
+    i_min, i_max = ymin.argmin(axis=1), ymax.argmax(axis=1)
+    rows = np.arange(groups)
+    return {
+        "t0": buckets["t0"][starts],
+        "t1": buckets["t1"][last],
+        "ymin": ymin[rows, i_min],
+        "tmin": grid("tmin", 0)[rows, i_min],
+        "imin": grid("imin", 0)[rows, i_min],
+        "ymax": ymax[rows, i_max],
+        "tmax": grid("tmax", 0)[rows, i_max],
+        "imax": grid("imax", 0)[rows, i_max],
+        "ysum": grid("ysum", 0.0).sum(axis=1),
+        "count": grid("count", 0).sum(axis=1),
+    }
+
+
+def _rows_as_buckets(ts: np.ndarray, y: np.ndarray, positions: np.ndarray) -> dict:
+    return {"t0": ts, "t1": ts, "ymin": y, "tmin": ts, "imin": positions, "ymax": y, "tmax": ts,
+            "imax": positions, "ysum": y, "count": np.ones(len(y), dtype=np.int64)}
+
+
+class Pyramid:
+    """
+    Multi-resolution min/max summary of a (ds, y) series. Level 0 buckets hold
+    PYRAMID_BASE rows; each level above merges PYRAMID_FACTOR buckets.
+    """
+    def __init__(self, levels: list):
+        self.levels = levels
+
+    @property
+    def rows(self) -> int:
+        return int(self.levels[0]["count"].sum()) if self.levels and len(self.levels[0]["count"]) else 0
+
+    def window(self, start=None, end=None, points: int = 1000):
+        """
+        Min/max points for the [start, end] window (ns timestamps) at screen resolution.
+        Returns None when even the finest level is too coarse for the window (it then spans
+        at most PYRAMID_BASE * points / 4 raw rows, which callers read and downsample directly).
+        """
+        if not self.levels:
+            return None
+        start = np.iinfo(np.int64).min if start is None else start
+        end = np.iinfo(np.int64).max if end is None else end
+        budget = max(points // 2, 1)
+
+        for level, buckets in enumerate(self.levels):
+            lo = np.searchsorted(buckets["t1"], start, side="left")
+            hi = np.searchsorted(buckets["t0"], end, side="right")
+            if level == 0 and hi - lo < budget // 2:
+                return None
+            if hi - lo <= budget or level == len(self.levels) - 1:
+                break
+
+        # Points keep row order (duplicate timestamps are legitimate), one per distinct row
+        ts = np.concatenate([buckets["tmin"][lo:hi], buckets["tmax"][lo:hi]])
+        ys = np.concatenate([buckets["ymin"][lo:hi], buckets["ymax"][lo:hi]])
+        pos = np.concatenate([buckets["imin"][lo:hi], buckets["imax"][lo:hi]])
+        keep = (ts >= start) & (ts <= end)
+        pos, unique = np.unique(pos[keep], return_index=True)
+        return {"level": level, "ts": ts[keep][unique], "values": ys[keep][unique]}
+
+    def to_bytes(self) -> bytes:
+        arrays = {f"{level}_{name}": buckets[name] for level, buckets in enumerate(self.levels) for name in BUCKET_FIELDS}
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **arrays)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Pyramid":
+        with np.load(io.BytesIO(data)) as arrays:
+            depth = len({name.split("_")[0] for name in arrays.files})
+            levels = [{name: arrays[f"{level}_{name}"] for name in BUCKET_FIELDS} for level in range(depth)]
+        return cls(levels)
+
+
+class PyramidBuilder:
+    """
+    Builds the pyramid incrementally from (ds, y) batches in arrival order.
+    Only a partial bucket of raw rows is carried between batches.
+    Tracks whether timestamps arrived sorted; unsorted input must be rebuilt sorted.
+    """
+    def __init__(self, base: int = PYRAMID_BASE):
+        self.base = base
+        self.carry_ts = np.empty(0, dtype=np.int64)
+        self.carry_y = np.empty(0)
+        self.rows = 0
+        self.chunks = []
+        self.sorted = True
+        self.last_ts = np.iinfo(np.int64).min
+
+    def add(self, ds: pd.Series, y: pd.Series):
+        ts = pd.to_datetime(ds).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        y = np.asarray(y, dtype=float)
+        valid = (ts != np.iinfo(np.int64).min) & ~np.isnan(y)
+        ts, y = ts[valid], y[valid]
+        if ts.size == 0:
+            return
+        if ts[0] < self.last_ts or (ts.size > 1 and (np.diff(ts) < 0).any()):
+            self.sorted = False
+        self.last_ts = ts[-1]
+
+        ts = np.concatenate([self.carry_ts, ts])
+        y = np.concatenate([self.carry_y, y])
+        full = (len(ts) // self.base) * self.base
+        if full:
+            positions = np.arange(self.rows, self.rows + full)
+            self.chunks.append(_aggregate(_rows_as_buckets(ts[:full], y[:full], positions), self.base))
+            self.rows += full
+        self.carry_ts, self.carry_y = ts[full:], y[full:]
+
+    def finish(self) -> Pyramid:
+        if len(self.carry_ts):
+            positions = np.arange(self.rows, self.rows + len(self.carry_ts))
+            self.chunks.append(_aggregate(_rows_as_buckets(self.carry_ts, self.carry_y, positions), self.base))
+            self.rows += len(self.carry_ts)
+            self.carry_ts, self.carry_y = self.carry_ts[:0], self.carry_y[:0]
+        if not self.chunks:
+            return Pyramid([])
+        level = {name: np.concatenate([c[name] for c in self.chunks]) for name in BUCKET_FIELDS}
+        levels = [level]
+        while len(level["t0"]) > PYRAMID_TOP:
+            level = _aggregate(level, PYRAMID_FACTOR)
+            levels.append(level)
+        return Pyramid(levels)
+
+
+def build_pyramid(ds: pd.Series, y: pd.Series) -> Pyramid:
+    """
+    Builds a pyramid from a full series (sorted by time first).
+    """
+    order = np.argsort(pd.to_datetime(ds).to_numpy(dtype="datetime64[ns]"), kind="stable")
+    builder = PyramidBuilder()
+    builder.add(ds.iloc[order], np.asarray(y)[order])
+    return builder.finish()
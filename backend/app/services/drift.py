@@ -1,35 +1,299 @@
+import json
 import numpy as np
+import pandas as pd
 import logging
-from scipy.stats import ks_2samp
+from scipy.stats import kstwo
+from app.services.profiling import QuantileSketch
 
 logger = logging.getLogger(__name__)
 
-def check_drift(reference_data: list, current_data: list) -> dict:
+DRIFT_SKETCH_K = 128        # ~1% rank error per sketch; memory per column and window stays O(k log n)
+WINDOW_PERIOD = "M"         # dated data: one window per calendar month
+WINDOW_ROWS = 1000          # undated data: one window per block of rows
+MAX_WINDOWS = 6             # windows kept apart; older ones are merged into the baseline
+KS_ALPHA = 0.05
+PSI_BINS = 10
+PSI_MODERATE = 0.1          # PSI conventions: < 0.1 stable, 0.1-0.2 moderate shift, > 0.2 major shift
+PSI_MAJOR = 0.2
+PSI_FLOOR = 1e-4            # bin share floor, so empty bins do not make PSI infinite
+WASSERSTEIN_POINTS = 256    # quantile grid of the Wasserstein-1 integral
+
+
+def to_sketch(data, k: int = DRIFT_SKETCH_K) -> QuantileSketch:
+    if isinstance(data, QuantileSketch):
+        return data
+    return QuantileSketch(k=k).update(np.asarray(data, dtype=float))
+
+
+def compare_sketches(reference: QuantileSketch, current: QuantileSketch) -> dict:
+    """
+    Two-sample KS (statistic and p-value), PSI over the reference deciles and Wasserstein-1
+    distance (also scaled by the reference IQR), from two quantile sketches. Cost depends on
+    the sketch sizes only, not on the rows they summarize.
+    """
+    n, m = reference.count, current.count
+    points = np.unique(np.concatenate([reference.items(), current.items()]))
+    ks = float(np.max(np.abs(reference.cdf(points) - current.cdf(points))))
+    # As scipy's asymptotic two-sample test: the one-sample distribution at n * m / (n + m)
+    p_value = float(kstwo.sf(ks, max(int(round(n * m / (n + m))), 1)))
+
+    edges = np.unique(reference.quantile(np.linspace(0, 1, PSI_BINS + 1)[1:-1]))
+    expected = np.diff(np.concatenate([[0.0], reference.cdf(edges), [1.0]]))
+    actual = np.diff(np.concatenate([[0.0], current.cdf(edges), [1.0]]))
+    expected, actual = np.maximum(expected, PSI_FLOOR), np.maximum(actual, PSI_FLOOR)
+    psi = float(np.sum((actual - expected) * np.log(actual / expected)))
+
+    grid = (np.arange(WASSERSTEIN_POINTS) + 0.5) / WASSERSTEIN_POINTS
+    wasserstein = float(np.mean(np.abs(reference.quantile(grid) - current.quantile(grid))))
+    iqr = float(reference.quantile(0.75) - reference.quantile(0.25))
+    return {
+        "statistic": ks,
+        "p_value": p_value,
+        "psi": psi,
+        "wasserstein": wasserstein,
+        "wasserstein_scaled": wasserstein / iqr if iqr > 0 else None,
+        "reference_rows": int(n),
+        "current_rows": int(m),
+    }
+
+
+def _severity(psi: float) -> str:
+    if psi >= PSI_MAJOR:
+        return "major"
+    if psi >= PSI_MODERATE:
+        return "moderate"
+    return "stable"
+
+
+def is_drift(metrics: dict) -> bool:
+    """
+    The drift criterion shared by every check: a significant KS test and at least a moderate
+    PSI shift (with many rows KS alone flags negligible shifts; the PSI floor keeps those out).
     """
-    Checks for data drift using Kolmogorov-Smirnov test.
-    Returns a dictionary with drift detected status and p-value.
+    return metrics["p_value"] < KS_ALPHA and metrics["psi"] >= PSI_MODERATE
+
+
+def check_drift(reference_data, current_data) -> dict:
+    """
+    Checks for data drift between two samples (arrays or quantile sketches) with a
+    Kolmogorov-Smirnov test on their sketches, plus PSI and Wasserstein distance, flagged
+    by is_drift. Returns a dictionary with drift detected status and p-value.
     """
     logger.info("Checking for data drift...")
-    
+
     # Validation
-    if not reference_data or not current_data:
+    if reference_data is None or current_data is None:
+        return {"drift_detected": False, "reason": "Insufficient data"}
+    reference, current = to_sketch(reference_data), to_sketch(current_data)
+    if reference.count == 0 or current.count == 0:
         return {"drift_detected": False, "reason": "Insufficient data"}
-    
-    # Convert to numpy arrays
-    ref_arr = np.array(reference_data)
-    curr_arr = np.array(current_data)
-    
-    # Perform KS Test
-    statistic, p_value = ks_2samp(ref_arr, curr_arr)
-    
-    # Drift if p-value < 0.05 (reject null hypothesis that distributions are same)
-    drift_detected = p_value < 0.05
-    
+
+    result = compare_sketches(reference, current)
+
+    drift_detected = is_drift(result)
+
     result = {
         "drift_detected": drift_detected,
-        "statistic": statistic,
-        "p_value": p_value,
+        **result,
+        "severity": _severity(result["psi"]),
         "message": "Drift detected!" if drift_detected else "No significant drift."
     }
     logger.info(f"Drift Check Result: {result}")
     return result
+
+
+class DriftMonitor:
+    """
+    Streaming drift state of a dataset: a quantile sketch per numeric column and time window
+    (calendar period of the date column, or block of rows for undated data). Batches update
+    it incrementally in any order; the MAX_WINDOWS most recent windows are kept apart and
+    older ones merged into a baseline sketch, so memory is bounded whatever the row count.
+    Monitors over disjoint row ranges (pass `offset` for undated data) can be merged.
+    """
+    def __init__(self, period: str = WINDOW_PERIOD, window_rows: int = WINDOW_ROWS, k: int = DRIFT_SKETCH_K, offset: int = 0):
+        self.period = period
+        self.offset = offset
+        self.window_rows = window_rows
+        self.k = k
+        self.rows = 0
+        self.columns = []
+        self.baseline = {}   # column -> sketch of every retired window
+        self.windows = {}    # window label -> {column -> sketch}; labels sort chronologically
+
+    def _labels(self, frame: pd.DataFrame) -> np.ndarray:
+        if "ds" in frame.columns:
+            dates = pd.to_datetime(frame["ds"], errors="coerce")
+            labels = dates.dt.to_period(self.period).dt.start_time.dt.strftime("%Y-%m-%d")
+            return labels.fillna("").to_numpy()
+        blocks = (self.offset + self.rows + np.arange(len(frame))) // self.window_rows
+        return np.char.add("rows-", np.char.zfill(blocks.astype(str), 9))
+
+    def update(self, frame: pd.DataFrame):
+        """
+        Adds a batch of typed rows (as the columnar copy: ds/y or category/value plus the
+        other numeric columns). Rows without a date are skipped.
+        """
+        if len(frame) == 0:
+            return self
+        numeric = [c for c in frame.select_dtypes(include=[np.number]).columns if c != "ds"]
+        self.columns += [c for c in numeric if c not in self.columns]
+        labels = self._labels(frame)
+        self.rows += len(frame)
+        oldest = min(self.windows) if len(self.windows) >= MAX_WINDOWS else None
+        for label in np.unique(labels):
+            if not label:
+                continue
+            rows = labels == label
+            # Late rows for a retired window go straight to the baseline
+            target = self.baseline if oldest is not None and label < oldest else self.windows.setdefault(label, {})
+            for column in numeric:
+                target.setdefault(column, QuantileSketch(k=self.k)).update(frame[column].to_numpy(dtype=float)[rows])
+        self._retire()
+        return self
+
+    def _retire(self):
+        for label in sorted(self.windows)[:max(len(self.windows) - MAX_WINDOWS, 0)]:
+            for column, sketch in self.windows.pop(label).items():
+                if column in self.baseline:
+                    self.baseline[column].merge(sketch)
+                else:
+                    self.baseline[column] = sketch
+
+    def merge(self, other: "DriftMonitor"):
+        """
+        Combines a monitor of other rows of the same dataset (e.g. a parallel partition).
+        """
+        self.offset = min(self.offset, other.offset)
+        self.rows += other.rows
+        self.columns += [c for c in other.columns if c not in self.columns]
+        for column, sketch in other.baseline.items():
+            self.baseline.setdefault(column, QuantileSketch(k=self.k)).merge(sketch)
+        for label, sketches in other.windows.items():
+            window = self.windows.setdefault(label, {})
+            for column, sketch in sketches.items():
+                window.setdefault(column, QuantileSketch(k=self.k)).merge(sketch)
+        self._retire()
+        return self
+
+    def report(self, window: str = None) -> dict:
+        """
+        Drift of every numeric column: one window (the latest by default) against everything
+        before it (earlier windows and the baseline).
+        """
+        labels = sorted(self.windows)
+        window = window or (labels[-1] if labels else None)
+        earlier = [label for label in labels if label < window] if window in self.windows else []
+        columns = []
+        for column in self.columns if window in self.windows else []:
+            current = self.windows[window].get(column)
+            reference = self.sketch(column, earlier)
+            if current is None or current.count == 0 or reference.count == 0:
+                continue
+            metrics = compare_sketches(reference, current)
+            columns.append({
+                "column": column,
+                **metrics,
+                "severity": _severity(metrics["psi"]),
+                "drift_detected": is_drift(metrics),
+            })
+        return {
+            "window": window,
+            "reference_windows": len(earlier) + (1 if self.baseline else 0),
+            "rows": self.rows,
+            "drift_detected": any(c["drift_detected"] for c in columns),
+            "drifted_columns": [c["column"] for c in columns if c["drift_detected"]],
+            "max_psi": max((c["psi"] for c in columns), default=0.0),
+            "columns": columns,
+            **({} if columns else {"reason": "Insufficient data"}),
+        }
+
+    def sketch(self, column: str, windows: list = None) -> QuantileSketch:
+        """
+        One sketch of a column over the baseline and the given windows (all by default).
+        Seeded, so the same state always reports the same numbers.
+        """
+        merged = QuantileSketch(k=self.k, seed=0)
+        if column in self.baseline:
+            merged.merge(self.baseline[column])
+        for label in self.windows if windows is None else windows:
+            if column in self.windows[label]:
+                merged.merge(self.windows[label][column])
+        return merged
+
+    def to_dict(self) -> dict:
+        return {
+            "period": self.period,
+            "window_rows": self.window_rows,
+            "k": self.k,
+            "offset": self.offset,
+            "rows": self.rows,
+            "columns": self.columns,
+            "baseline": {c: s.to_dict() for c, s in self.baseline.items()},
+            "windows": {label: {c: s.to_dict() for c, s in sketches.items()} for label, sketches in self.windows.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DriftMonitor":
+        monitor = cls(period=data["period"], window_rows=data["window_rows"], k=data["k"], offset=data.get("offset", 0))
+        monitor.rows = data["rows"]
+        monitor.columns = list(data["columns"])
+        monitor.baseline = {c: QuantileSketch.from_dict(s) for c, s in data["baseline"].items()}
+        monitor.windows = {
+            label: {c: QuantileSketch.from_dict(s) for c, s in sketches.items()}
+            for label, sketches in data["windows"].items()
+        }
+        return monitor
+
+
+def monitor_key(dataset_key: str) -> str:
+    return f"{dataset_key}.drift.json"
+
+
+async def save_monitor(dataset_key: str, monitor: DriftMonitor, bucket: str = "datasets") -> str:
+    from app.services.storage import get_storage
+    key = monitor_key(dataset_key)
+    await get_storage(bucket).aput(key, json.dumps(monitor.to_dict()).encode(), "application/json")
+    return key
+
+
+async def load_monitor(key: str, bucket: str = "datasets") -> DriftMonitor:
+    from app.services.storage import get_storage
+    try:
+        body = await get_storage(bucket).aget(key)
+    except Exception:
+        return None
+    return DriftMonitor.from_dict(json.loads(body))
+
+
+def build_monitor(frames) -> DriftMonitor:
+    """
+    A monitor over an iterable of typed row batches. Blocking.
+    """
+    monitor = DriftMonitor()
+    for frame in frames:
+        monitor.update(frame)
+    return monitor
+
+
+async def dataset_monitor(dataset, db=None) -> DriftMonitor:
+    """
+    The stored drift monitor of a dataset. Datasets ingested before monitors existed get one
+    built from their columnar copy, streamed a batch at a time (and stored). None without a
+    columnar copy.
+    """
+    from app.services.compute import get_compute
+    from app.services.columnar import iter_columnar
+
+    metadata = dataset.metadata_info or {}
+    if metadata.get("drift_key"):
+        monitor = await load_monitor(metadata["drift_key"])
+        if monitor is not None:
+            return monitor
+    if not metadata.get("columnar_key"):
+        return None
+    monitor = await get_compute().run_local(build_monitor, iter_columnar(metadata["columnar_key"]))
+    key = await save_monitor(dataset.s3_key, monitor)
+    if db is not None:
+        dataset.metadata_info = {**metadata, "drift_key": key}
+        db.commit()
+    return monitor
@@ -0,0 +1,491 @@
+import time
+import json
+import asyncio
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.optimize import nnls
+from app.core.config import get_settings
+from app.services.compute import get_compute
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+MODELS = {"prophet": "Prophet", "xgboost": "XGBoost", "arima": "ARIMA"}
+HOLDOUT_FRACTION = 0.2
+MIN_HOLDOUT = 7
+MAX_HOLDOUT = 90
+XGB_MAX_LAGS = 28
+ARIMA_ORDER = (2, 1, 2)
+Z_90 = 1.645
+ENGINE_VERSION = 1  # bump when fitting code changes, so registered models are not reused
+XGB_UPDATE_TREES = 25  # boosting rounds added per incremental update
+INCREMENTAL_MAX_GROWTH = 0.25  # full refit once appends exceed this share of the last full fit's rows
+
+# One sync Redis connection per worker process, for progress events
+_progress_client = None
+
+
+class EnsembleError(RuntimeError):
+    """Raised when no ensemble member could be fitted."""
+
+
+class ProgressReporter:
+    """
+    Picklable progress sink for worker processes: publishes per-model stages on the
+    run's event channel directly from the worker. Publishing is best effort.
+    """
+    def __init__(self, run_id: int, model: str, channel: str = "insightx:events"):
+        self.run_id = run_id
+        self.model = model
+        self.channel = channel
+
+    def report(self, stage: str, progress: int):
+        global _progress_client
+        if self.run_id is None:
+            return
+        try:
+            if _progress_client is None:
+                import redis
+                _progress_client = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=1)
+            _progress_client.publish(self.channel, json.dumps({
+                "type": "run.progress",
+                "run_id": self.run_id,
+                "payload": {
+                    "step": f"Ensemble Training ({MODELS[self.model]})",
+                    "model": self.model,
+                    "stage": stage,
+                    "model_progress": progress
+                }
+            }))
+        except Exception as e:
+            logger.debug(f"Progress publish failed: {e}")
+
+
+def infer_frequency(ds: pd.Series) -> str:
+    """
+    Pandas frequency alias of a date column (daily when it cannot be inferred).
+    """
+    ds = pd.to_datetime(ds).drop_duplicates().sort_values()
+    if len(ds) >= 3:
+        freq = pd.infer_freq(ds.tail(100))
+        if freq:
+            return freq
+        step = ds.diff().median()
+        if pd.notnull(step) and step > pd.Timedelta(0):
+            return pd.tseries.frequencies.to_offset(step).freqstr
+    return "D"
+
+
+def holdout_size(n: int, horizon: int) -> int:
+    """
+    Holdout length for learning blend weights: about the horizon, at most 20% of history.
+    """
+    size = min(horizon, int(n * HOLDOUT_FRACTION), MAX_HOLDOUT)
+    if size < MIN_HOLDOUT:
+        size = max(1, min(MIN_HOLDOUT, n // 4))
+    return size
+
+
+def future_dates(last_date, steps: int, freq: str) -> pd.DatetimeIndex:
+    offset = pd.tseries.frequencies.to_offset(freq)
+    return pd.date_range(start=pd.Timestamp(last_date) + offset, periods=steps, freq=offset)
+
+
+def _fit_prophet(df: pd.DataFrame, freq: str) -> dict:
+    from prophet import Prophet
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    model = Prophet()
+    model.fit(df[["ds", "y"]])
+    return {"model": model, "last_date": df["ds"].iloc[-1], "freq": freq}
+
+
+def _update_prophet(state: dict, history: pd.DataFrame, appended: pd.DataFrame) -> dict:
+    """
+    Prophet has no online update; the refit is warm-started from the previous parameters,
+    which converges in a fraction of the iterations.
+    """
+    from prophet import Prophet
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    params = state["model"].params
+    init = {name: params[name][0][0] for name in ("k", "m", "sigma_obs")}
+    init.update({name: params[name][0] for name in ("delta", "beta")})
+    model = Prophet()
+    try:
+        model.fit(history[["ds", "y"]], init=init)
+    except Exception:
+        # Parameter shapes changed (e.g. yearly seasonality switched on): plain refit
+        model = Prophet()
+        model.fit(history[["ds", "y"]])
+    return {"model": model, "last_date": history["ds"].iloc[-1], "freq": state["freq"]}
+
+
+def _predict_prophet(state: dict, steps: int) -> np.ndarray:
+    future = pd.DataFrame({"ds": future_dates(state["last_date"], steps, state["freq"])})
+    return state["model"].predict(future)["yhat"].to_numpy()
+
+
+def _fit_arima(df: pd.DataFrame, freq: str) -> dict:
+    from statsmodels.tsa.arima.model import ARIMA
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        fitted = ARIMA(df["y"].to_numpy(dtype=float), order=ARIMA_ORDER).fit()
+    return {"model": fitted, "last_date": df["ds"].iloc[-1], "freq": freq}
+
+
+def _update_arima(state: dict, history: pd.DataFrame, appended: pd.DataFrame) -> dict:
+    # The state-space model is filtered over the new observations; parameters are kept
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        fitted = state["model"].append(appended["y"].to_numpy(dtype=float), refit=False)
+    return {"model": fitted, "last_date": appended["ds"].iloc[-1], "freq": state["freq"]}
+
+
+def _predict_arima(state: dict, steps: int) -> np.ndarray:
+    return np.asarray(state["model"].forecast(steps))
+
+
+def _calendar(ds: pd.DatetimeIndex) -> np.ndarray:
+    return np.column_stack([ds.dayofweek, ds.month, ds.day]).astype(float)
+
+
+def lag_features(y: np.ndarray, ds: pd.Series, lags: int):
+    """
+    Feature matrix and targets for every step of `y` after the first `lags` (`ds` holds the
+    dates of those steps).
+    """
+    # windows[i] = y[i : i + lags + 1]; the last element is the target
+    windows = np.lib.stride_tricks.sliding_window_view(y, lags + 1)
+    last = windows[:, -2:-1]
+    features = np.hstack([windows[:, :-1] - last, _calendar(pd.DatetimeIndex(ds))])
+    return features, windows[:, -1] - last[:, 0]
+
+
+def xgboost_lags(n: int) -> int:
+    return int(min(XGB_MAX_LAGS, max(2, n // 3)))
+
+
+def new_xgboost():
+    import xgboost as xgb
+    return xgb.XGBRegressor(n_estimators=300, max_depth=4, learning_rate=0.05, subsample=0.9, n_jobs=1)
+
+
+def _fit_xgboost(df: pd.DataFrame, freq: str) -> dict:
+    """
+    Gradient-boosted trees on lag differences: predicts the next step change from the
+    recent path relative to the last value plus calendar features, so trends extrapolate.
+    """
+    y = df["y"].to_numpy(dtype=float)
+    lags = xgboost_lags(len(y))
+    if len(y) <= lags + 2:
+        raise ValueError("Not enough history for lag features")
+
+    features, target = lag_features(y, df["ds"].iloc[lags:], lags)
+    model = new_xgboost()
+    model.fit(features, target)
+    return {"model": model, "lags": lags, "tail": y[-lags:].copy(), "last_date": df["ds"].iloc[-1], "freq": freq}
+
+
+def _update_xgboost(state: dict, history: pd.DataFrame, appended: pd.DataFrame) -> dict:
+    # Warm start: a few extra boosting rounds fitted on the appended rows only
+    import xgboost as xgb
+    lags = state["lags"]
+    y = np.concatenate([state["tail"], appended["y"].to_numpy(dtype=float)])
+    features, target = lag_features(y, appended["ds"], lags)
+    model = xgb.XGBRegressor(**{**state["model"].get_params(), "n_estimators": XGB_UPDATE_TREES})
+    model.fit(features, target, xgb_model=state["model"].get_booster())
+    return {"model": model, "lags": lags, "tail": y[-lags:].copy(), "last_date": appended["ds"].iloc[-1], "freq": state["freq"]}
+
+
+def predict_xgboost_paths(state: dict, tails: np.ndarray, steps: int) -> np.ndarray:
+    """
+    Recursive multi-step forecasts from several alternative tails (rows of `tails`, each the
+    last `lags` values) at once: one batched predict call per step. Shape (len(tails), steps).
+    """
+    model, lags = state["model"], state["lags"]
+    window = np.array(tails, dtype=float).reshape(-1, lags)
+    calendar = _calendar(future_dates(state["last_date"], steps, state["freq"]))
+    out = np.empty((len(window), steps))
+    for h in range(steps):
+        last = window[:, -1:]
+        rows = np.hstack([window - last, np.repeat(calendar[h][None, :], len(window), axis=0)])
+        out[:, h] = last[:, 0] + model.predict(rows)
+        window = np.hstack([window[:, 1:], out[:, h:h + 1]])
+    return out
+
+
+def _predict_xgboost(state: dict, steps: int) -> np.ndarray:
+    # Multi-step forecasts are recursive
+    return predict_xgboost_paths(state, state["tail"][None, :], steps)[0]
+
+
+# name -> (fit(history, freq) -> state, predict(state, steps) -> values)
+MEMBERS = {
+    "prophet": (_fit_prophet, _predict_prophet),
+    "xgboost": (_fit_xgboost, _predict_xgboost),
+    "arima": (_fit_arima, _predict_arima),
+}
+
+# name -> update(state, history, appended) -> state, for rows appended since the state was fitted
+UPDATES = {
+    "prophet": _update_prophet,
+    "xgboost": _update_xgboost,
+    "arima": _update_arima,
+}
+
+
+def fit_member(name: str, history: pd.DataFrame, horizon: int, holdout: int, freq: str, progress: ProgressReporter = None) -> dict:
+    """
+    Fits one ensemble member (runs in a compute worker): first on the history minus the
+    holdout (to score it and learn blend weights), then on the full history. The full-history
+    state is returned for the model registry.
+    """
+    progress = progress or ProgressReporter(None, name)
+    fit, predict = MEMBERS[name]
+    started = time.perf_counter()
+    try:
+        progress.report("holdout fit", 0)
+        holdout_pred = predict(fit(history.iloc[:-holdout], freq), holdout)
+        progress.report("full fit", 50)
+        state = fit(history, freq)
+        forecast = predict(state, horizon)
+        if not (np.isfinite(holdout_pred).all() and np.isfinite(forecast).all()):
+            raise ValueError("non-finite predictions")
+        progress.report("done", 100)
+        return {"model": name, "holdout": holdout_pred, "forecast": forecast, "state": state,
+                "seconds": time.perf_counter() - started}
+    except Exception as e:
+        progress.report("failed", 100)
+        return {"model": name, "error": str(e), "seconds": time.perf_counter() - started}
+
+
+def update_member(name: str, state: dict, history: pd.DataFrame, appended: pd.DataFrame, horizon: int, progress: ProgressReporter = None) -> dict:
+    """
+    Rolls a fitted member forward over appended rows (runs in a compute worker) and forecasts
+    from the new end of the history. Blend weights are not re-learned.
+    """
+    progress = progress or ProgressReporter(None, name)
+    started = time.perf_counter()
+    try:
+        progress.report("incremental update", 0)
+        state = UPDATES[name](state, history, appended)
+        forecast = MEMBERS[name][1](state, horizon)
+        if not np.isfinite(forecast).all():
+            raise ValueError("non-finite predictions")
+        progress.report("done", 100)
+        return {"model": name, "forecast": forecast, "state": state, "seconds": time.perf_counter() - started}
+    except Exception as e:
+        progress.report("failed", 100)
+        return {"model": name, "error": str(e), "seconds": time.perf_counter() - started}
+
+
+def predict_ensemble(artifact: dict, horizon: int) -> dict:
+    """
+    Inference from a registered ensemble (runs in a compute worker): each fitted member
+    forecasts the horizon and the stored weights blend them.
+    """
+    forecasts = {name: MEMBERS[name][1](state, horizon) for name, state in artifact["states"].items()}
+    return {"forecasts": forecasts}
+
+
+def blend_weights(predictions: dict, actual: np.ndarray) -> dict:
+    """
+    Non-negative least-squares weights of the members' holdout predictions against the
+    actuals, normalized to sum to 1 (inverse-MSE weights if NNLS selects nothing).
+    """
+    names = list(predictions)
+    matrix = np.column_stack([predictions[n] for n in names])
+    weights, _ = nnls(matrix, actual)
+    if weights.sum() <= 0:
+        mse = ((matrix - actual[:, None]) ** 2).mean(axis=0)
+        weights = 1.0 / np.maximum(mse, 1e-12)
+    weights = weights / weights.sum()
+    return {n: float(w) for n, w in zip(names, weights)}
+
+
+def ensemble_params(horizon: int, holdout: int, freq: str) -> dict:
+    """
+    Everything besides the data that determines the fitted ensemble.
+    """
+    return {
+        "engine": ENGINE_VERSION,
+        "models": sorted(MODELS),
+        "horizon": horizon,
+        "holdout": holdout,
+        "frequency": freq,
+        "arima_order": ARIMA_ORDER,
+        "xgb_max_lags": XGB_MAX_LAGS,
+    }
+
+
+def _blend(artifact: dict, forecasts: dict, history: pd.DataFrame, horizon: int) -> dict:
+    weights = artifact["weights"]
+    forecast = sum(weights[n] * forecasts[n] for n in weights)
+    sigma = artifact["holdout_rmse"]
+    return {
+        "forecast": forecast,
+        # Interval half-width from the blended holdout error
+        "confidence_lower": forecast - Z_90 * sigma,
+        "confidence_upper": forecast + Z_90 * sigma,
+        "dates": future_dates(history["ds"].iloc[-1], horizon, artifact["frequency"]),
+        "frequency": artifact["frequency"],
+        "holdout": artifact["holdout"],
+        "weights": weights,
+        "members": artifact["members"],
+        "holdout_rmse": sigma,
+        "fingerprint": artifact["fingerprint"],
+    }
+
+
+async def _update_ensemble(base: dict, base_rows: int, history: pd.DataFrame, horizon: int, fingerprint: str, params: dict,
+                           lineage: dict, run_id: int, on_member, registry):
+    """
+    Rolls a registered ensemble forward over the rows appended since it was fitted and
+    registers the result. Returns None when any member cannot be updated (full retrain instead).
+    """
+    compute = get_compute()
+    appended = history.iloc[base_rows:]
+
+    async def member(name):
+        try:
+            return await compute.run(update_member, name, base["states"][name], history, appended, horizon, ProgressReporter(run_id, name))
+        except Exception as e:
+            return {"model": name, "error": str(e), "seconds": None}
+
+    updated = await asyncio.gather(*(member(name) for name in base["states"]))
+    failed = [m for m in updated if m.get("error")]
+    if failed:
+        logger.warning(f"Incremental update of {base['fingerprint'][:12]} failed ({failed[0]['model']}: {failed[0]['error']}); retraining")
+        return None
+    if on_member is not None:
+        # Reported once all members are through, so a fallback to retraining is not double counted
+        for done, name in enumerate(MODELS, start=1):
+            result = next((m for m in updated if m["model"] == name), {"model": name, "seconds": None})
+            await on_member({**base["members"][name], **result, "updated": True}, done, len(MODELS))
+
+    artifact = {
+        **base,
+        "fingerprint": fingerprint,
+        "params": params,
+        "states": {m["model"]: m["state"] for m in updated},
+        "rows": len(history),
+        "fit_rows": base.get("fit_rows", base["rows"]),
+        "parent": base["fingerprint"],
+        "members": {name: {**info, "seconds": next((m["seconds"] for m in updated if m["model"] == name), info["seconds"])}
+                    for name, info in base["members"].items()},
+    }
+    try:
+        await registry.put(fingerprint, artifact, metadata={"params": {**params, "parent": base["fingerprint"]}}, lineage=lineage)
+    except Exception as e:
+        logger.error(f"Failed to register ensemble {fingerprint[:12]}: {e}")
+    forecasts = {m["model"]: m["forecast"] for m in updated}
+    return {**_blend(artifact, forecasts, history, horizon), "reused": False, "updated": True}
+
+
+async def run_ensemble(history: pd.DataFrame, horizon: int = 30, run_id: int = None, on_member=None, registry=None,
+                       refit: str = None) -> dict:
+    """
+    Forecast with the Prophet/XGBoost/ARIMA ensemble. When the registry holds an ensemble with
+    the same training fingerprint (data + parameters) training is skipped and the stored models
+    only run inference. When it holds one fitted on a prefix of this history (rows appended
+    since), the members are rolled forward over the new rows instead of refitted; a full
+    refit happens once appends exceed INCREMENTAL_MAX_GROWTH of the last full fit.
+    Otherwise the members are fitted concurrently on the compute tier, blended with
+    holdout-learned weights and registered.
+    `on_member(result, done, total)` is awaited as each member finishes.
+    A `refit` token (a retrain's trigger time) forces a full fit: it is part of the
+    fingerprint, so the fit is registered as a new model, and no earlier one is updated.
+    """
+    from app.services.analysis import dataframe_fingerprint
+    from app.services.model_registry import get_model_registry, training_fingerprint, lineage_key
+
+    registry = registry or get_model_registry()
+    history = history[["ds", "y"]].reset_index(drop=True)
+    freq = infer_frequency(history["ds"])
+    holdout = holdout_size(len(history), horizon)
+    compute = get_compute()
+    params = ensemble_params(horizon, holdout, freq)
+    if refit:
+        params["refit"] = refit
+    data_fingerprint = await compute.run_local(dataframe_fingerprint, history)
+    fingerprint = training_fingerprint(data_fingerprint, params)
+
+    artifact = await registry.get(fingerprint)
+    if artifact is not None:
+        logger.info(f"Reusing fitted ensemble {fingerprint[:12]}; skipping training")
+        predicted = await compute.run(predict_ensemble, artifact, horizon)
+        if on_member is not None:
+            for done, name in enumerate(MODELS, start=1):
+                await on_member({"model": name, "seconds": 0.0, "cached": True, **artifact["members"][name]}, done, len(MODELS))
+        return {**_blend(artifact, predicted["forecasts"], history, horizon), "reused": True, "updated": False}
+
+    # The holdout length may grow with the history and refits replace their predecessor;
+    # neither breaks the lineage
+    lineage_params = {k: v for k, v in params.items() if k not in ("holdout", "refit")}
+    lineage = {"anchor": await compute.run_local(lineage_key, history, lineage_params), "rows": len(history), "data": data_fingerprint}
+    base, base_rows = (None, 0) if refit else await registry.afind_base(lineage["anchor"], history)
+    if base is not None and len(history) - base.get("fit_rows", base["rows"]) <= INCREMENTAL_MAX_GROWTH * base.get("fit_rows", base["rows"]):
+        logger.info(f"Updating ensemble {base['fingerprint'][:12]} with {len(history) - base_rows} appended rows")
+        result = await _update_ensemble(base, base_rows, history, horizon, fingerprint, params, lineage, run_id, on_member, registry)
+        if result is not None:
+            return result
+
+    done = 0
+
+    async def member(name):
+        nonlocal done
+        try:
+            result = await compute.run(fit_member, name, history, horizon, holdout, freq, ProgressReporter(run_id, name))
+        except Exception as e:
+            result = {"model": name, "error": str(e), "seconds": None}
+        done += 1
+        if result.get("error"):
+            logger.warning(f"Ensemble member {name} failed: {result['error']}")
+        if on_member is not None:
+            await on_member(result, done, len(MODELS))
+        return result
+
+    members = await asyncio.gather(*(member(name) for name in MODELS))
+    fitted = {m["model"]: m for m in members if not m.get("error")}
+    if not fitted:
+        raise EnsembleError("; ".join(f"{m['model']}: {m['error']}" for m in members))
+
+    actual = history["y"].to_numpy(dtype=float)[-holdout:]
+    weights = blend_weights({n: m["holdout"] for n, m in fitted.items()}, actual)
+    blended_holdout = sum(weights[n] * fitted[n]["holdout"] for n in fitted)
+    artifact = {
+        "fingerprint": fingerprint,
+        "params": params,
+        "states": {n: m["state"] for n, m in fitted.items()},
+        "weights": weights,
+        "holdout_rmse": float(np.sqrt(np.mean((actual - blended_holdout) ** 2))),
+        "frequency": freq,
+        "holdout": holdout,
+        "rows": len(history),
+        "fit_rows": len(history),
+        "members": {
+            m["model"]: {
+                "weight": weights.get(m["model"], 0.0),
+                "holdout_rmse": float(np.sqrt(np.mean((actual - m["holdout"]) ** 2))) if not m.get("error") else None,
+                "seconds": m["seconds"],
+                "error": m.get("error"),
+            }
+            for m in members
+        },
+    }
+    try:
+        await registry.put(fingerprint, artifact, metadata={
+            "params": params,
+            "metrics": {"holdout_rmse": artifact["holdout_rmse"], **{f"weight_{n}": w for n, w in weights.items()}},
+        }, lineage=lineage)
+    except Exception as e:
+        logger.error(f"Failed to register ensemble {fingerprint[:12]}: {e}")
+
+    forecasts = {n: m["forecast"] for n, m in fitted.items()}
+    return {**_blend(artifact, forecasts, history, horizon), "reused": False, "updated": False}
+
+
+def describe_weights(weights: dict) -> str:
+    parts = [f"{MODELS[n]} {w * 100:.0f}%" for n, w in sorted(weights.items(), key=lambda item: -item[1]) if w > 0]
+    return f"Ensemble ({' + '.join(parts)})"
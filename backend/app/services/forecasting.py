@@ -5,20 +5,36 @@ import redis.asyncio as redis
 import pandas as pd
 import numpy as np
 import xgboost as xgb
-from statsmodels.tsa.seasonal import STL
 from statsmodels.tsa.arima.model import ARIMA
 from sklearn.metrics import mean_squared_error
 from scipy import stats
 from app.db import models
 from app.services.drift import check_drift
+from app.services.compute import get_compute, ComputeBusyError
+from app.services import seasonality, intervals, results_store, stress
+from app.services.ensemble import MODELS, run_ensemble, describe_weights
 from app.core.config import get_settings
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
-def check_reliability(df: pd.DataFrame, history_df: pd.DataFrame = None) -> dict:
+
+class StressTestError(ValueError):
+    """The run cannot be stress tested."""
+
+
+class RunNotFoundError(StressTestError):
+    """No run has the requested id."""
+
+
+class RunNotReadyError(StressTestError):
+    """The run has no stored forecast (yet) to simulate from."""
+
+
+def check_reliability(df: pd.DataFrame, history=None) -> dict:
     """
-    Evaluates forecast reliability based on CI width and Drift.
+    Evaluates forecast reliability based on CI width and Drift. `history` is the target's
+    quantile sketch (see history_sketch) or its values.
     """
     # 1. Check CI Width (Uncertainty)
     mean_ci_width = (df['confidence_upper'] - df['confidence_lower']).mean()
@@ -33,8 +49,8 @@ def check_reliability(df: pd.DataFrame, history_df: pd.DataFrame = None) -> dict
         score -= 0.2
         
     # 2. Check Drift (if history available)
-    if history_df is not None:
-         drift_result = check_drift(history_df['y'].tolist(), df['forecast'].tolist())
+    if history is not None:
+         drift_result = check_drift(history, df['forecast'].to_numpy(dtype=float))
          if drift_result['drift_detected']:
              warnings.append("Data Drift Detected: Forecast distribution differs significantly from history.")
              score -= 0.3
@@ -44,162 +60,203 @@ def check_reliability(df: pd.DataFrame, history_df: pd.DataFrame = None) -> dict
         
     return {"score": max(0.0, score), "warnings": warnings}
 
-async def run_stress_test(run_id: int):
+DECOMPOSITION_PARAMS = {"kind": "decomposition", "engine": seasonality.ENGINE_VERSION}
+CONFORMAL_FOLDS = 5
+
+def flag_anomalies(df: pd.DataFrame, components: dict) -> pd.DataFrame:
     """
-    Run specific stress scenarios (Recession, Blackout) and return impact analysis.
+    Attaches decomposition components and residual anomaly flags (beyond 3 sigma) to the history.
     """
+    df['trend'] = components['trend']
+    df['seasonal'] = components['seasonal']
+    df['resid'] = components['resid']
+    
+    # Anomaly Detection
+    resid_mu = df['resid'].mean()
+    resid_std = df['resid'].std()
+    df['is_anomaly'] = (np.abs(df['resid'] - resid_mu) > 3 * resid_std)
+    return df
+
+def decompose_history(df: pd.DataFrame, previous: dict = None) -> dict:
+    """
+    Seasonal decomposition of the history with automatically detected periods, rolled
+    forward from `previous` components when given. Blocking; runs in a compute worker.
+    """
+    return seasonality.decompose(df['y'].to_numpy(dtype=float), seasonality.sampling_step(df['ds']), previous)
+
+async def decompose_series(df: pd.DataFrame):
+    """
+    Decomposition (XAI) and anomaly flags for the history, as (df, components). Components
+    are cached in the model registry per dataset version: a repeat run reads them back without
+    recomputing, and a version with appended rows rolls the previous one forward.
+    """
+    from app.services.analysis import dataframe_fingerprint
+    from app.services.model_registry import get_model_registry, training_fingerprint, lineage_key
+
+    registry = get_model_registry()
+    compute = get_compute()
+    series = df[['ds', 'y']].reset_index(drop=True)
+    data_fingerprint = await compute.run_local(dataframe_fingerprint, series)
+    fingerprint = training_fingerprint(data_fingerprint, DECOMPOSITION_PARAMS)
+    components = await registry.get(fingerprint)
+    if components is None:
+        lineage = {"anchor": await compute.run_local(lineage_key, series, DECOMPOSITION_PARAMS), "rows": len(series), "data": data_fingerprint}
+        previous, _ = await registry.afind_base(lineage["anchor"], series)
+        components = await compute.run(decompose_history, series, previous)
+        try:
+            await registry.put(fingerprint, components, metadata={"params": {**DECOMPOSITION_PARAMS, "periods": components["periods"]}}, lineage=lineage)
+        except Exception as e:
+            logger.error(f"Failed to register decomposition {fingerprint[:12]}: {e}")
+    else:
+        logger.info(f"Reusing decomposition {fingerprint[:12]}")
+    return await compute.run_local(flag_anomalies, df, components), components
+
+async def run_stress_test(run_id: int, paths: int = stress.DEFAULT_PATHS, scenarios: list = None, seed: int = None):
+    """
+    War Games: Monte Carlo shock scenarios (Recession, Inflation, Blackout, Supply Chain)
+    over the run's forecast and confidence band, with percentile fans and tail risk.
+    The seed defaults to the run id, so repeated requests return the same simulation.
+    Raises RunNotFoundError/RunNotReadyError when there is no stored forecast to simulate.
+    Results are served from the scenario cache (filled in the background when the run
+    completes, see precompute_stress) and stored there on a miss.
+    """
+    from app.services.scenario_cache import get_scenario_cache
+
+    cache = get_scenario_cache()
+    params = {"paths": paths, "scenarios": scenarios or list(stress.SCENARIOS), "seed": run_id if seed is None else seed}
+    try:
+        cached = await cache.get(run_id, params)
+        generation = await cache.generation(run_id) if cached is None else None
+    except Exception as e:
+        logger.error(f"Scenario cache unavailable: {e}")
+        cached = generation = None
+    if cached is not None:
+        return {**cached, "cached": True}
+
     logger.info(f"Running Dynamic Stress Test for Run {run_id}")
     
     from app.db.session import SessionLocal
     from app.db import models
     db = SessionLocal()
     run = db.query(models.ForecastRun).filter(models.ForecastRun.id == run_id).first()
+    db.close()
     
-    scenarios = []
-    
+    if run is None:
+        raise RunNotFoundError(f"Run {run_id} not found")
+    if "forecast" not in results_store.series_names(run.results):
+        raise RunNotReadyError(f"Run {run_id} has no stored forecast (status: {run.status})")
+
     try:
-        if run and run.results and "forecast" in run.results:
-            forecast_values = run.results["forecast"] # List of floats
-            # We need dates to plot
-            forecast_dates = run.results.get("dates", [])
-            
-            baseline_revenue = sum(forecast_values)
-            if baseline_revenue == 0: baseline_revenue = 1 # Avoid div by zero
-
-            # Scenario 1: Recession
-            # Drop 20% over the period linearly
-            recession_values = []
-            for i, v in enumerate(forecast_values):
-                drop_factor = 0.8 - (0.1 * (i / len(forecast_values))) # Worsens over time
-                recession_values.append(v * drop_factor)
-                
-            recession_rev = sum(recession_values)
-            recession_diff = recession_rev - baseline_revenue
-            recession_impact = (recession_diff / baseline_revenue) * 100
-            
-            scenarios.append({
-                "id": "recession",
-                "name": "Global Recession",
-                "impact": f"{recession_impact:.1f}% Revenue",
-                "severity": "Critical",
-                "description": "Demand collapses by 20-30% due to macroeconomic factors.",
-                "data": recession_values,
-                "color": "#ef4444" # Red
-            })
-            
-            # Scenario 2: Inflation
-            # Costs rise, revenue stays flat or dips slightly
-            inflation_values = [v * 0.92 for v in forecast_values]
-            inflation_rev = sum(inflation_values)
-            inflation_diff = inflation_rev - baseline_revenue
-            inflation_impact = (inflation_diff / baseline_revenue) * 100
-             
-            scenarios.append({
-                "id": "inflation",
-                "name": "High Inflation",
-                "impact": f"{inflation_impact:.1f}% Revenue",
-                "severity": "Medium",
-                "description": "Purchasing power decreases, leading to a steady 8% drop.",
-                "data": inflation_values,
-                "color": "#f97316" # Orange
-            })
-            
-            # Scenario 3: Supply Chain Optimization (Positive)
-            supply_values = [v * 1.05 for v in forecast_values]
-            scenarios.append({
-                "id": "supply_chain",
-                "name": "Supply Chain Opt",
-                "impact": "+5.0% Efficiency",
-                "severity": "Positive",
-                "description": "Optimized logistics improve margins by 5%.",
-                "data": supply_values,
-                "color": "#10b981" # Emerald
-            })
-            
-            return {
-                "baseline": {
-                    "name": "Current Forecast",
-                    "data": forecast_values,
-                    "dates": forecast_dates
-                },
-                "scenarios": scenarios
-            }
-            
-        else:
-            # Fallback if no run data exists yet (Pre-computation)
-            # Generate dummy data for demo purposes
-            dates = pd.date_range(start="2024-06-01", periods=30, freq="D").strftime('%Y-%m-%d').tolist()
-            base = np.linspace(100, 150, 30).tolist()
-            
-            return {
-                "baseline": { "name": "Current Forecast", "data": base, "dates": dates },
-                "scenarios": [
-                     {"id": "recession", "name": "Recession", "impact": "-25%", "severity": "Critical", "description": "Simulated market crash.", "data": [x*0.75 for x in base], "color": "#ef4444"},
-                     {"id": "inflation", "name": "Inflation", "impact": "-10%", "severity": "High", "description": "Simulated purchasing power drop.", "data": [x*0.9 for x in base], "color": "#f97316"}
-                ]
-            }
+        # Only the series needed are read from the results store
+        compute = get_compute()
+        forecast_values, forecast_dates, lower, upper = await asyncio.gather(*(
+            compute.run_local(results_store.read_series, run.results, name)
+            for name in ("forecast", "dates", "confidence_lower", "confidence_upper")
+        ))
+        simulation = await stress.simulate(forecast_values, lower, upper, paths=params["paths"],
+                                           scenarios=params["scenarios"], seed=params["seed"])
+        result = {
+            "baseline": {
+                "name": "Current Forecast",
+                "data": forecast_values,
+                "dates": forecast_dates,
+                "lower": lower,
+                "upper": upper
+            },
+            **simulation
+        }
+        if generation is not None:
+            try:
+                await cache.put(run_id, params, result, generation)
+            except Exception as e:
+                logger.error(f"Failed to cache stress test of run {run_id}: {e}")
+        return {**result, "cached": False}
 
+    except (ComputeBusyError, ValueError):
+        raise
     except Exception as e:
         logger.error(f"Stress test error: {e}")
         return {"error": str(e)}
 
-async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None):
+
+async def precompute_stress(run_id: int):
     """
-    Simulates a long-running forecasting task with Redis pubsub updates.
-    Includes Ensemble (Prophet + XGBoost + ARIMA) and Confidence Intervals.
+    Fills the scenario cache with the default War Games (what the dashboard requests) of a
+    completed run. Runs as a background job after the run's results are stored.
+    """
+    result = await run_stress_test(run_id)
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+    logger.info(f"Stress test of run {run_id} precomputed in {result['seconds']:.2f}s")
+
+
+async def schedule_precompute(run_id: int):
+    """
+    Queues the background precomputations of a completed run: its War Games
+    (precompute_stress) and scenario response surfaces (response_surface.precompute_surface),
+    at the lowest priority and deduplicated per run.
+    """
+    from app.services import jobs
+    for kind in ("stress", "surface"):
+        try:
+            payload = {"run_id": run_id}
+            dedup = jobs.dedup_key(kind, payload, jobs.PRECOMPUTE_TENANT)
+            await jobs.get_broker().enqueue(jobs.new_job(kind, payload, tenant=jobs.PRECOMPUTE_TENANT, dedup=dedup))
+        except Exception as e:
+            logger.error(f"Failed to schedule {kind} precompute for run {run_id}: {e}")
+
+async def load_dataset(dataset_id: int):
+    """
+    Loads a dataset's history as (df, is_time_series): ds/y for time series, category/value
+    otherwise. Returns (None, True) when the dataset is missing, unreadable or empty.
     """
-    r = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
-    channel = "insightx:events"
-    
-    # 1. Notify Start
-    await r.publish(channel, json.dumps({
-        "type": "run.started",
-        "run_id": run_id,
-        "payload": {"message": "Forecasting with Ensemble (Tier 2) started..."}
-    }))
-    
-    # Generate Dummy Data
-    # Load Real Data if available
     df = None
+    is_time_series = True
     if dataset_id:
         try:
             from app.db.session import SessionLocal
-            from app.services.data_service import get_s3_client
+            from app.services.storage import get_storage
+            from app.services.columnar import load_dataset_frame
             from app.db.models import Dataset
             from io import BytesIO
 
             db = SessionLocal()
             dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
             if dataset:
-                logger.info(f"Loading dataset {dataset_id} (Key: {dataset.s3_key})")
-                s3 = get_s3_client()
-                response = s3.get_object(Bucket="datasets", Key=dataset.s3_key)
-                content = response['Body'].read()
-                df = pd.read_csv(BytesIO(content))
-
-                # Standardize columns (Expect likely 'ds' and 'y', or use first two)
-                if 'ds' not in df.columns or 'y' not in df.columns:
-                    # Fallback: rename first two columns
-                    if len(df.columns) >= 2:
-                        df.rename(columns={df.columns[0]: 'ds', df.columns[1]: 'y'}, inplace=True)
+                storage = get_storage("datasets")
+                columnar = await storage.offload(load_dataset_frame, dataset)
+                if columnar is not None:
+                    # Typed columnar copy: roles already resolved, no text parsing
+                    logger.info(f"Loading dataset {dataset_id} (Columnar: {dataset.metadata_info['columnar_key']})")
+                    df, is_time_series = columnar
+                else:
+                    logger.info(f"Loading dataset {dataset_id} (Key: {dataset.s3_key})")
+                    content = await storage.aget(dataset.s3_key)
+                    df = await get_compute().run_local(pd.read_csv, BytesIO(content))
+
+                    # Standardize columns (Expect likely 'ds' and 'y', or use first two)
+                    if 'ds' not in df.columns or 'y' not in df.columns:
+                        # Fallback: rename first two columns
+                        if len(df.columns) >= 2:
+                            df.rename(columns={df.columns[0]: 'ds', df.columns[1]: 'y'}, inplace=True)
                 
-                df['ds'] = pd.to_datetime(df['ds'], errors='coerce') # Handle non-dates gracefully
+                    df['ds'] = pd.to_datetime(df['ds'], errors='coerce') # Handle non-dates gracefully
                 
-                # Check if 'ds' is valid (Time Series) or Categorical
-                is_time_series = True
-                if df['ds'].isnull().all():
-                     is_time_series = False
-                     # Reload/Reset to treat 0th column as Category
-                     df = pd.read_csv(BytesIO(content)) # Reload
-                     if len(df.columns) >= 2:
-                        df.rename(columns={df.columns[0]: 'category', df.columns[1]: 'value'}, inplace=True)
-                     df['value'] = pd.to_numeric(df['value'], errors='coerce')
-                else:
-                     df['y'] = pd.to_numeric(df['y'], errors='coerce')
+                    # Check if 'ds' is valid (Time Series) or Categorical
+                    is_time_series = True
+                    if df['ds'].isnull().all():
+                         is_time_series = False
+                         # Reload/Reset to treat 0th column as Category
+                         df = pd.read_csv(BytesIO(content)) # Reload
+                         if len(df.columns) >= 2:
+                            df.rename(columns={df.columns[0]: 'category', df.columns[1]: 'value'}, inplace=True)
+                         df['value'] = pd.to_numeric(df['value'], errors='coerce')
+                    else:
+                         df['y'] = pd.to_numeric(df['y'], errors='coerce')
                 
-                df = df.dropna()
-                if is_time_series:
-                    df = df.sort_values('ds')
+                    df = df.dropna()
+                    if is_time_series:
+                        df = df.sort_values('ds')
                 
                 if df.empty:
                     logger.warning(f"Dataset {dataset_id} resulted in empty dataframe after processing. Falling back to dummy data.")
@@ -210,6 +267,109 @@ async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None
             logger.error(f"Failed to load dataset {dataset_id}: {e}")
             df = None
             is_time_series = True # Default for dummy
+    return df, is_time_series
+
+
+async def history_sketch(dataset_id: int, column: str):
+    """
+    Quantile sketch of a dataset column over every ingested row, merged from the dataset's
+    stored drift monitor (no pass over the data), or None.
+    """
+    from app.db.session import SessionLocal
+    from app.db.models import Dataset
+    from app.services.drift import dataset_monitor
+
+    if not dataset_id:
+        return None
+    db = SessionLocal()
+    try:
+        dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+        monitor = await dataset_monitor(dataset, db) if dataset is not None else None
+    except Exception as e:
+        logger.error(f"Drift monitor of dataset {dataset_id} unavailable: {e}")
+        monitor = None
+    finally:
+        db.close()
+    if monitor is None or column not in monitor.columns:
+        return None
+    return monitor.sketch(column)
+
+
+def dataset_rows(dataset_id: int) -> int:
+    """
+    Row count of the dataset as ingested (its metadata), or None. Runs record it so the
+    retrain scheduler compares like with like. Blocking.
+    """
+    from app.db.session import SessionLocal
+    from app.db.models import Dataset
+
+    if not dataset_id:
+        return None
+    db = SessionLocal()
+    try:
+        dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+        rows = (dataset.metadata_info or {}).get("rows") if dataset is not None else None
+        return int(rows) if rows is not None else None
+    finally:
+        db.close()
+
+async def calibrate_intervals(history: pd.DataFrame, horizon: int):
+    """
+    Out-of-sample ensemble residuals (folds x horizon) from the cached rolling-origin
+    backtest, or None when the history is too short to backtest (or gives a single residual).
+    """
+    from app.services.backtest import backtest_history, BacktestError
+    try:
+        backtest = await backtest_history(history, [horizon], folds=CONFORMAL_FOLDS)
+    except BacktestError as e:
+        logger.info(f"No conformal calibration: {e}")
+        return None
+    residuals = np.asarray(backtest["residuals"], dtype=float) if backtest["residuals"] else None
+    if not intervals.has_spread(residuals):
+        logger.info("No conformal calibration: fewer than two backtest residuals")
+        return None
+    return residuals
+
+def quantile_forecast(results: dict, levels: list) -> dict:
+    """
+    Quantile bands at any levels for a stored run: re-derived from the residuals kept in the
+    results store (or the holdout RMSE for Gaussian runs), without refitting. Blocking.
+    """
+    forecast = results_store.read_array(results, "forecast")
+    residuals = results_store.read_array(results, "intervals/residuals") if "intervals/residuals" in results_store.series_names(results) else None
+    if intervals.has_spread(residuals):
+        bands = intervals.conformal_bands(forecast, residuals, levels)
+    else:
+        bands = intervals.gaussian_bands(forecast, results["ensemble"]["holdout_rmse"], levels)
+    return {
+        "method": results["intervals"]["method"],
+        "dates": results_store.read_series(results, "dates"),
+        "quantiles": {intervals.quantile_name(level): results_store.decode_array(values) for level, values in bands.items()},
+    }
+
+async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None, horizon: int = 30, quantiles: list = None,
+                            refit: str = None):
+    """
+    Long-running forecasting task with Redis pubsub updates.
+    Ensemble (Prophet + XGBoost + ARIMA fitted in parallel, holdout-learned blend) and
+    split-conformal quantile bands from backtest residuals. `refit` forces a full fit of
+    the ensemble (see run_ensemble).
+    """
+    r = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    channel = "insightx:events"
+    
+    # 1. Notify Start
+    await r.publish(channel, json.dumps({
+        "type": "run.started",
+        "run_id": run_id,
+        "payload": {"message": "Forecasting with Ensemble (Tier 2) started..."}
+    }))
+    
+    # Load Real Data if available. Counted first: rows appended in between are trained on
+    # but not counted, so the scheduler may queue one more (incremental) retrain, never miss them
+    rows = await get_compute().run_local(dataset_rows, dataset_id)
+    df, is_time_series = await load_dataset(dataset_id)
+    labels = None
 
     if df is None or df.empty:
         # Generate Dummy Data (Simulated Analysis of Upload - Fallback)
@@ -227,8 +387,13 @@ async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None
         
         values = base_value + trend + seasonal + noise
         df = pd.DataFrame({"ds": dates, "y": values})
+    elif not is_time_series:
+        # Categorical datasets are modelled in row order on a synthetic daily axis
+        labels = df['category'].astype(str).tolist()
+        values = df['value'].to_numpy(dtype=float, copy=True)
+        dates = pd.Series(pd.date_range(end=pd.Timestamp.today().normalize(), periods=len(df), freq="D"))
     else:
-        values = df['y'].values
+        values = df['y'].to_numpy(dtype=float, copy=True)
         dates = df['ds']
     
     # Apply overrides (Scenario Simulation)
@@ -237,55 +402,76 @@ async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None
             values[-30:] += overrides["marketing_boost"] # Apply to forecast period
     
     df = pd.DataFrame({"ds": dates, "y": values})
-    
-    steps = ["Preprocessing", "Ensemble Training (Prophet)", "Ensemble Training (XGBoost)", "Ensemble Training (ARIMA)", "Blending & Confidence"]
-    
-    forecast_values = []
-    confidence_lower = []
-    confidence_upper = []
-    
-    for i, step in enumerate(steps):
-        await asyncio.sleep(1) # Simulate
-        progress = int((i + 1) / len(steps) * 100)
-        
-        # Simulate calculations
-        if step == "Blending & Confidence":
-            # Generate forecast with confidence
-            last_val = values[-1]
-            future_steps = 30
-            # Define future_dates here so it's available for results
-            last_date = pd.to_datetime(dates.iloc[-1]) if hasattr(dates, 'iloc') else pd.to_datetime(dates[-1])
-            future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=future_steps, freq="D")
-
-            forecast_trend = np.linspace(last_val, last_val + 20, future_steps)
-            forecast_seasonal = 10 * np.sin(2 * np.pi * np.arange(150, 150+future_steps) / 7)
-            
-            forecast_values = forecast_trend + forecast_seasonal
-            
-            # P10/P90 Confidence Intervals
-            sigma = 5
-            confidence_lower = forecast_values - 1.645 * sigma
-            confidence_upper = forecast_values + 1.645 * sigma
-
-        # Real Analysis on History
-        if step == "Preprocessing":
-             # STL for XAI
-            res = STL(df['y'], period=7).fit()
-            df['trend'] = res.trend
-            df['seasonal'] = res.seasonal
-            df['resid'] = res.resid
-            
-            # Anomaly Detection
-            resid_mu = df['resid'].mean()
-            resid_std = df['resid'].std()
-            df['is_anomaly'] = (np.abs(df['resid'] - resid_mu) > 3 * resid_std)
+    levels = sorted(set(quantiles or intervals.DEFAULT_QUANTILES) | set(intervals.INTERVAL_BOUNDS))
 
+    async def publish_progress(step, progress, **extra):
         await r.publish(channel, json.dumps({
              "type": "run.progress",
              "run_id": run_id,
-             "payload": {"step": step, "progress": progress}
+             "payload": {"step": step, "progress": progress, **extra}
         }))
-    
+
+    # Preprocessing, three members, interval calibration and blending; progress reflects finished steps
+    finished = []
+    total_steps = len(MODELS) + 3
+
+    async def member_done(member, done, total):
+        finished.append(member["model"])
+        await publish_progress(
+            f"Ensemble Training ({MODELS[member['model']]})", int(len(finished) / total_steps * 100),
+            model=member["model"], seconds=member["seconds"], error=member.get("error"), cached=member.get("cached", False)
+        )
+
+    async def decompose(history):
+        result = await decompose_series(history)
+        finished.append("decomposition")
+        await publish_progress("Preprocessing", int(len(finished) / total_steps * 100), periods=result[1]["periods"])
+        return result
+
+    async def calibrate(history):
+        try:
+            result = await calibrate_intervals(history, horizon)
+        except Exception as e:
+            logger.error(f"Interval calibration failed for run {run_id}: {e}")
+            result = None
+        finished.append("calibration")
+        await publish_progress("Calibrating Intervals", int(len(finished) / total_steps * 100), conformal=result is not None)
+        return result
+
+    # Real Analysis on History: decomposition, backtest calibration and the three ensemble members run concurrently
+    decomposition = asyncio.create_task(decompose(df))
+    calibration = asyncio.create_task(calibrate(df))
+    try:
+        ensemble = await run_ensemble(df, horizon=horizon, run_id=run_id, on_member=member_done, refit=refit)
+        df, components = await decomposition
+        residuals = await calibration
+    except ComputeBusyError:
+        # Transient: the job queue retries the run with backoff
+        decomposition.cancel()
+        calibration.cancel()
+        raise
+    except Exception as e:
+        decomposition.cancel()
+        calibration.cancel()
+        logger.error(f"Forecast failed for run {run_id}: {e}")
+        await get_compute().run_local(results_store.save_run, run_id, "failed", {"error": str(e)})
+        await r.publish(channel, json.dumps({
+            "type": "run.failed",
+            "run_id": run_id,
+            "payload": {"message": f"Forecast failed: {e}"}
+        }))
+        return
+
+    # Blending & Confidence (weights learned on the holdout; bands from out-of-sample residuals)
+    forecast_values = ensemble["forecast"]
+    if residuals is not None:
+        bands = intervals.conformal_bands(forecast_values, residuals, levels)
+    else:
+        bands = intervals.gaussian_bands(forecast_values, ensemble["holdout_rmse"], levels)
+    confidence_lower = bands[intervals.INTERVAL_BOUNDS[0]]
+    confidence_upper = bands[intervals.INTERVAL_BOUNDS[1]]
+    future_dates = ensemble["dates"]
+    await publish_progress("Blending & Confidence", 100, weights=ensemble["weights"])
     
     # Reliability Check (Tier 5)
     forecast_df = pd.DataFrame({
@@ -294,7 +480,9 @@ async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None
         "confidence_upper": confidence_upper
     })
     
-    reliability = check_reliability(forecast_df, df) # Compare forecast with history
+    # Compare forecast with history: the dataset's stored sketch, else the values in hand
+    reference = await history_sketch(dataset_id, "y" if is_time_series else "value")
+    reliability = check_reliability(forecast_df, reference if reference is not None else df['y'].to_numpy(dtype=float))
     
     # Analysis Metrics
     growth_pct = ((forecast_values[-1] - forecast_values[0]) / forecast_values[0]) * 100
@@ -313,25 +501,48 @@ async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None
     history_limit = 100
     history_df = df.tail(history_limit)
     
-    results = {
-        "history": {
-            "dates": history_df['ds'].dt.strftime('%Y-%m-%d').tolist() if is_time_series else history_df['ds'].tolist(),
-            "values": history_df['y'].tolist()
-        },
-        "forecast": forecast_values.tolist(),
+    # Numeric series go to the binary results store; the row keeps the small summary fields
+    series = {
+        "history/dates": history_df['ds'].dt.strftime('%Y-%m-%d').tolist() if labels is None else labels[-history_limit:],
+        "history/values": history_df['y'].to_numpy(dtype=float),
+        "forecast": forecast_values,
         "dates": future_dates.strftime('%Y-%m-%d').tolist(),
-        "confidence_lower": confidence_lower.tolist(), 
-        "confidence_upper": confidence_upper.tolist(),
+        "confidence_lower": confidence_lower,
+        "confidence_upper": confidence_upper,
+        **{f"quantiles/{intervals.quantile_name(level)}": values for level, values in bands.items()},
         "anomalies": df[df['is_anomaly']].ds.dt.strftime('%Y-%m-%d').tolist(),
-        "decomposition": {
-            "trend": df['trend'].tail(30).tolist(),
-            "seasonal": df['seasonal'].tail(30).tolist()
+        "decomposition/trend": df['trend'].tail(30).to_numpy(dtype=float),
+        "decomposition/seasonal": df['seasonal'].tail(30).to_numpy(dtype=float),
+        **{f"decomposition/seasonals/{p}": values[-30:] for p, values in components["seasonals"].items()},
+    }
+    if residuals is not None:
+        series["intervals/residuals"] = residuals  # any other quantile set is derived from these later
+    summary = {
+        "horizon": horizon,
+        "intervals": {
+            "method": "conformal" if residuals is not None else "gaussian",
+            "folds": len(residuals) if residuals is not None else 0,
+            "coverage": round(intervals.INTERVAL_BOUNDS[1] - intervals.INTERVAL_BOUNDS[0], 4),
+            "levels": levels
         },
+        "decomposition": {"periods": components["periods"]},
         "metrics": {
             "growth": f"{growth_pct:+.1f}%",
             "seasonality": seasonality_strength
         },
-        "model_info": "Ensemble (Prophet 40% + XGBoost 40% + ARIMA 20%)",
+        "model_info": describe_weights(ensemble["weights"]),
+        "ensemble": {
+            "weights": ensemble["weights"],
+            "members": ensemble["members"],
+            "holdout": ensemble["holdout"],
+            "holdout_rmse": ensemble["holdout_rmse"],
+            "frequency": ensemble["frequency"],
+            "fingerprint": ensemble["fingerprint"],
+            "reused": ensemble["reused"],
+            "updated": ensemble["updated"],
+            "rows": len(df)
+        },
+        "dataset_rows": rows,
         "reliability": reliability,
         "analysis": {
             "recommended_viz": "line" if is_time_series else "bar",
@@ -343,6 +554,23 @@ async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None
             "dataset_type": "Time Series" if is_time_series else "Categorical"
         }
     }
+    try:
+        await results_store.store_results(run_id, summary, series, reliability)
+    except Exception as e:
+        logger.error(f"Failed to store results for run {run_id}: {e}")
+        await get_compute().run_local(results_store.save_run, run_id, "failed", {"error": f"Results could not be stored: {e}"})
+        await r.publish(channel, json.dumps({
+            "type": "run.failed",
+            "run_id": run_id,
+            "payload": {"message": f"Results could not be stored: {e}"}
+        }))
+        return
+    await schedule_precompute(run_id)
+
+    series.pop("intervals/residuals", None)
+    results = results_store.merge_series(summary, {
+        name: values.tolist() if isinstance(values, np.ndarray) else values for name, values in series.items()
+    })
 
     # Notify Completion
     await r.publish(channel, json.dumps({
@@ -353,7 +581,7 @@ async def run_forecast_task(run_id: int, dataset_id: int, overrides: dict = None
     
     # Executive Summary (Tier 3)
     summary = (
-        f"Ensemble Forecast predicts a {((forecast_values[-1] - forecast_values[0])/forecast_values[0]*100):.1f}% growth over 30 days. "
+        f"Ensemble Forecast predicts a {((forecast_values[-1] - forecast_values[0])/forecast_values[0]*100):.1f}% growth over {horizon} periods. "
         f"Reliability Score: {reliability['score']}/1.0. "
     )
     if reliability['warnings']:
@@ -0,0 +1,552 @@
+import io
+import csv
+import asyncio
+import json
+import uuid
+import hashlib
+import logging
+import pandas as pd
+from collections import OrderedDict
+from app.services import data_service
+from app.services.storage import get_storage
+from app.services.compute import get_compute
+from app.services.analysis import analyze_csv, analysis_from_profile, smart_downsample, preprocess_dataframe
+from app.services.columnar import ColumnarWriter, columnar_key, iter_columnar, pyramid_key, save_pyramid
+from app.services.downsampling import PyramidBuilder, build_pyramid
+from app.services.serialization import frame_columns, window_columns
+from app.services.profiling import StreamingProfile
+from app.services.drift import DriftMonitor, dataset_monitor, save_monitor
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB read size for request bodies
+MAX_SAMPLE_ROWS = 200_000  # Rows retained in memory for analysis/preview
+INGEST_CACHE_SIZE = 128
+PROFILE_NAMES = {"ds": "date", "y": "value"}  # columnar role names -> the names analysis expects
+
+# Upload results per content hash (in-process front of the stored analysis cache)
+_ingest_cache = OrderedDict()
+# Appends to the same dataset are serialized per process
+_append_locks = {}
+
+
+class AppendError(ValueError):
+    """The rows cannot be appended to the dataset."""
+
+
+class CsvChunkParser:
+    """
+    Incremental CSV parser. Raw byte chunks are fed in as they arrive and complete
+    records are parsed into DataFrame batches. Only the trailing partial record is carried
+    between chunks, so memory is bounded by the chunk size.
+    """
+    def __init__(self):
+        self.header = None
+        self.carry = b""
+
+    def feed(self, chunk: bytes):
+        data = self.carry + chunk
+        cut = self._record_boundary(data)
+        if cut < 0:
+            self.carry = data
+            return None
+        self.carry = data[cut + 1:]
+        return self._parse(data[:cut + 1])
+
+    def close(self):
+        data, self.carry = self.carry, b""
+        if not data.strip():
+            return None
+        return self._parse(data)
+
+    @staticmethod
+    def _record_boundary(data: bytes) -> int:
+        # Last newline that is not inside a quoted field (even number of quotes before it)
+        cut = data.rfind(b"\n")
+        while cut >= 0 and data.count(b'"', 0, cut) % 2 == 1:
+            cut = data.rfind(b"\n", 0, cut)
+        return cut
+
+    def _parse(self, block: bytes):
+        if self.header is None:
+            end = block.find(b"\n")
+            header_line = block if end < 0 else block[:end]
+            self.header = next(csv.reader([header_line.decode("utf-8-sig").strip("\r")]))
+            block = b"" if end < 0 else block[end + 1:]
+        if not block.strip():
+            return None
+        return pd.read_csv(io.BytesIO(block), header=None, names=self.header)
+
+
+class RowSampler:
+    """
+    Keeps an order-preserving, evenly strided sample of at most `max_rows` rows.
+    When the sample overflows every other row is dropped and the stride doubles,
+    which matches `df.iloc[::step]` over the full stream.
+    """
+    def __init__(self, max_rows: int = MAX_SAMPLE_ROWS):
+        self.max_rows = max_rows
+        self.stride = 1
+        self.offset = 0
+        self.frames = []
+        self.count = 0
+
+    def add(self, batch: pd.DataFrame):
+        n = len(batch)
+        start = (-self.offset) % self.stride
+        if start < n:
+            kept = batch.iloc[start::self.stride]
+            self.frames.append(kept)
+            self.count += len(kept)
+        self.offset += n
+
+        if self.count > self.max_rows:
+            merged = pd.concat(self.frames).iloc[::2]
+            self.frames = [merged]
+            self.count = len(merged)
+            self.stride *= 2
+
+    def to_frame(self) -> pd.DataFrame:
+        if not self.frames:
+            return pd.DataFrame()
+        return pd.concat(self.frames, ignore_index=True)
+
+
+class StreamingIngest:
+    """
+    Single pass ingest pipeline: every chunk is hashed, written to object storage (multipart
+    upload, under a temporary key until the content hash is known) and parsed incrementally
+    for sampling, the typed columnar copy, the exact streaming profile and the chart
+    pyramid, without ever holding the whole file.
+    """
+    def __init__(self, key: str = None, bucket: str = "datasets", content_type: str = "text/csv"):
+        self.key = key or f"incoming/{uuid.uuid4().hex}"
+        self.bucket = bucket
+        self.storage = get_storage(bucket)
+        self.digest = hashlib.sha256()
+        self.writer = self.storage.multipart(self.key, content_type=content_type)
+        self.parser = CsvChunkParser()
+        self.sampler = RowSampler()
+        self.columnar = ColumnarWriter(self.key, storage=self.storage)
+        self.columnar_key = None
+        self.profile = StreamingProfile()
+        self.drift = DriftMonitor()
+        self.pyramid_builder = PyramidBuilder()
+        self.pyramid = None
+        self.pyramid_key = None
+        self.rows = 0
+
+    async def feed(self, chunk: bytes):
+        self.digest.update(chunk)
+        await self.writer.write(chunk)
+        # Parsing, typing and profiling are CPU work: keep them off the event loop
+        await get_compute().run_local(self._parse_chunk, chunk)
+
+    def _parse_chunk(self, chunk: bytes):
+        self._consume(self.parser.feed(chunk))
+
+    def _consume(self, batch):
+        if batch is not None and len(batch) > 0:
+            self.rows += len(batch)
+            self.sampler.add(batch)
+            self._write_columnar(batch)
+
+    def _write_columnar(self, batch):
+        if self.columnar is None:
+            return
+        try:
+            frame = self.columnar.write(batch)
+        except Exception as e:
+            # The raw CSV remains the source of truth; readers fall back to it
+            logger.error(f"Columnar conversion failed for {self.key}: {e}")
+            self.columnar.abort()
+            self.columnar = None
+            self.profile = None
+            self.drift = None
+            return
+        # Typed batches feed the profiler under the names analysis expects
+        self.profile.update(frame.rename(columns=PROFILE_NAMES))
+        self.drift.update(frame)
+        if "ds" in frame.columns:
+            self.pyramid_builder.add(frame["ds"], frame["y"])
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the chunks fed so far."""
+        return self.digest.hexdigest()
+
+    async def finish(self, key: str = None):
+        """
+        Completes the ingest with every object stored under `key` (by default the content
+        hash). A raw object already streamed as a multipart upload is copied there from its
+        temporary key.
+        """
+        key = key or self.content_hash
+        compute = get_compute()
+        await compute.run_local(self._consume, self.parser.close())
+        await close_as(self.writer, key)
+        self.key = key
+        if self.columnar is not None:
+            self.columnar.finalize()
+            await self._finish_pyramid(compute)
+            self.columnar_key = await self.columnar.close(columnar_key(key))
+
+    async def _finish_pyramid(self, compute):
+        if self.columnar.roles is None or self.columnar.roles["kind"] != "time_series":
+            return
+        try:
+            if self.pyramid_builder.sorted:
+                self.pyramid = await compute.run_local(self.pyramid_builder.finish)
+            else:
+                # Out-of-order timestamps: rebuild from the local columnar file, sorted
+                self.pyramid = await compute.run(rebuild_pyramid, self.columnar.path)
+            self.pyramid_key = await save_pyramid(pyramid_key(self.key), self.pyramid, storage=self.storage)
+        except Exception as e:
+            logger.error(f"Pyramid build failed for {self.key}: {e}")
+            self.pyramid = None
+
+    async def abort(self):
+        await self.writer.abort()
+        if self.columnar is not None:
+            self.columnar.abort()
+
+    def profile_batches(self):
+        """
+        The profiled rows again (target and date only), streamed from the stored columnar
+        copy. Blocking.
+        """
+        wanted = (self.profile.target, "date")
+        columns = [c for c in self.columnar.schema.names if PROFILE_NAMES.get(c, c) in wanted]
+        for frame in iter_columnar(self.columnar_key, columns=columns):
+            yield frame.rename(columns=PROFILE_NAMES)
+
+    @property
+    def roles(self):
+        return self.columnar.roles if self.columnar is not None and self.columnar_key else None
+
+    @property
+    def size(self) -> int:
+        return self.writer.size
+
+
+async def close_as(writer, key: str):
+    """
+    Completes a multipart writer under `key`: a multipart upload already started under a
+    temporary key is copied there (server-side) and the temporary object deleted.
+    """
+    stored = await writer.close(key=key)
+    if stored != key:
+        await writer.storage.acopy(stored, key)
+        await writer.storage.adelete(stored)
+
+
+def rebuild_pyramid(path: str):
+    series = pd.read_parquet(path, columns=["ds", "y"])
+    return build_pyramid(series["ds"], series["y"])
+
+
+def analysis_cache_key(content_hash: str) -> str:
+    return f"{content_hash}.analysis.json"
+
+
+async def summarize_ingest(ingest: StreamingIngest) -> dict:
+    """
+    Builds the upload response body (analysis, metrics, radar, preview) from a finished ingest.
+    The preview is stored column-oriented; endpoints render it with `render_preview`.
+    """
+    compute = get_compute()
+
+    # Preprocess (Identify/Parse Dates, Sort)
+    df = await compute.run(preprocess_dataframe, ingest.sampler.to_frame())
+    
+    # Exact profile over every row (anomalies from a second, streamed pass); sample-based analysis if typing failed
+    if ingest.profile is not None:
+        analysis_result = await compute.run_local(analysis_from_profile, ingest.profile, ingest.profile_batches())
+    else:
+        analysis_result = await analyze_csv(df)
+    
+    preview_data = await compute.run_local(preview_columns, df, ingest.pyramid)
+
+    return {
+        "analysis": analysis_result["analysis"],
+        "metrics": analysis_result["metrics"],
+        "radar": analysis_result["radar"],
+        "preview": preview_data,
+        "total_rows": ingest.rows
+    }
+
+
+def preview_columns(df: pd.DataFrame, pyramid=None) -> dict:
+    """
+    Preview Data, column-oriented: min/max over the full series from the pyramid when available,
+    otherwise a shape-preserving downsample of the sample. NaN/Inf become None (vectorized).
+    """
+    window = pyramid.window(points=1000) if pyramid is not None else None
+    if window is not None:
+        return window_columns(window)
+    return frame_columns(smart_downsample(df, max_points=1000))
+
+
+async def load_cached_ingest(content_hash: str, bucket: str = "datasets"):
+    """
+    Cached ingest outcome (dataset metadata + response body) for identical content, if any.
+    """
+    if content_hash in _ingest_cache:
+        _ingest_cache.move_to_end(content_hash)
+        return _ingest_cache[content_hash]
+    storage = get_storage(bucket)
+    try:
+        body = await storage.aget(analysis_cache_key(content_hash))
+    except Exception:
+        return None
+    cached = json.loads(body)
+    _remember(content_hash, cached)
+    return cached
+
+
+async def store_cached_ingest(content_hash: str, cached: dict, bucket: str = "datasets"):
+    storage = get_storage(bucket)
+    await storage.aput(
+        analysis_cache_key(content_hash), json.dumps(cached, default=str).encode(), "application/json"
+    )
+    _remember(content_hash, cached)
+
+
+def _remember(content_hash: str, cached: dict):
+    _ingest_cache[content_hash] = cached
+    if len(_ingest_cache) > INGEST_CACHE_SIZE:
+        _ingest_cache.popitem(last=False)
+
+
+async def ingest_upload(file, filename: str, db, content_type: str = "text/csv"):
+    """
+    Streams an uploaded file into content-addressed storage while hashing and parsing it
+    chunk by chunk. Identical content is stored once; re-uploads are answered from the
+    analysis cache. Returns the dataset record and the upload response body.
+    """
+    async def chunks():
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    return await ingest_stream(chunks(), filename, db, content_type)
+
+
+async def ingest_stream(chunks, filename: str, db, content_type: str = "text/csv"):
+    """
+    ingest_upload over an async iterator of byte chunks, e.g. an HTTP response body.
+    """
+    content_type = content_type or "text/csv"
+    # Bucket existence is checked once at startup
+    ingest = StreamingIngest(content_type=content_type)
+    try:
+        async for chunk in chunks:
+            await ingest.feed(chunk)
+        content_hash = ingest.content_hash
+        cached = await load_cached_ingest(content_hash)
+        if cached is None:
+            await ingest.finish(content_hash)
+    except BaseException:
+        await ingest.abort()
+        raise
+
+    if cached is not None:
+        # Already stored: drop what was written under the temporary key
+        await ingest.abort()
+        logger.info(f"Dedup hit for {filename} ({content_hash[:12]}); reusing stored objects and analysis")
+        dataset_record = data_service.create_dataset_record(
+            db, filename, content_hash, size=cached["metadata"]["size"], content_type=content_type,
+            metadata=cached["metadata"], content_hash=content_hash
+        )
+        return dataset_record, cached["result"]
+
+    logger.info(f"Ingested {filename}: {ingest.size} bytes, {ingest.rows} rows (sample stride {ingest.sampler.stride})")
+
+    metadata = {
+        "size": ingest.size,
+        "rows": ingest.rows,
+        "columnar_key": ingest.columnar_key,
+        "roles": ingest.roles,
+        "pyramid_key": ingest.pyramid_key,
+        "drift_key": None
+    }
+    if ingest.drift is not None and ingest.columnar_key:
+        try:
+            metadata["drift_key"] = await save_monitor(ingest.key, ingest.drift)
+        except Exception as e:
+            logger.error(f"Failed to store drift monitor for {ingest.key}: {e}")
+    result = await summarize_ingest(ingest)
+    await store_cached_ingest(content_hash, {"metadata": metadata, "result": result})
+
+    dataset_record = data_service.create_dataset_record(
+        db, filename, ingest.key, size=ingest.size, content_type=content_type,
+        metadata=metadata, content_hash=content_hash
+    )
+    return dataset_record, result
+
+
+class StreamingAppend:
+    """
+    Appends the rows of an uploaded CSV (with the dataset's header) to a stored dataset in
+    one pass: the raw copy is rewritten as the stored bytes followed by the new rows, the
+    columnar copy as its row groups followed by the new typed batches, and the drift monitor
+    is updated with the new rows only. New objects go under the new content hash; the
+    previous ones are left untouched (other records may share them).
+    """
+    def __init__(self, dataset, monitor: DriftMonitor = None, bucket: str = "datasets"):
+        meta = dataset.metadata_info or {}
+        self.dataset = dataset
+        self.storage = get_storage(bucket)
+        self.key = f"incoming/{uuid.uuid4().hex}"
+        self.digest = hashlib.sha256()
+        self.writer = self.storage.multipart(self.key, content_type=meta.get("content_type") or "text/csv")
+        self.columnar = ColumnarWriter(self.key, storage=self.storage, roles=meta["roles"])
+        self.parser = CsvChunkParser()
+        self.monitor = monitor
+        self.header = None
+        self.pending = b""   # the upload's header line, until it is complete
+        self.stored_rows = 0
+        self.rows = 0
+
+    async def _write(self, chunk: bytes):
+        self.digest.update(chunk)
+        await self.writer.write(chunk)
+
+    async def copy_stored(self):
+        """
+        Streams the stored raw and columnar copies into the new ones.
+        """
+        compute = get_compute()
+        self.stored_rows = await compute.run_local(self.columnar.extend, self.dataset.metadata_info["columnar_key"])
+        reader = self.storage.open_range_reader(self.dataset.s3_key)
+        first, last = b"", b""
+        while True:
+            chunk = await self.storage.offload(reader.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            first = first or chunk
+            last = chunk[-1:]
+            await self._write(chunk)
+        if last and last != b"\n":
+            await self._write(b"\n")
+        self.header = parse_header(first.split(b"\n", 1)[0])
+
+    async def feed(self, chunk: bytes):
+        # The upload's header line is checked against the dataset's, not stored again
+        if self.pending is not None:
+            data = self.pending + chunk
+            end = data.find(b"\n")
+            if end < 0:
+                self.pending = data
+                return
+            self.pending = None
+            self._check_header(data[:end + 1])
+            chunk = data
+            body = data[end + 1:]
+        else:
+            body = chunk
+        if body:
+            await self._write(body)
+        await get_compute().run_local(self._parse_chunk, chunk)
+
+    def _check_header(self, line: bytes):
+        header = parse_header(line)
+        if header != self.header:
+            raise AppendError(f"Columns {header} do not match the dataset's {self.header}")
+
+    def _parse_chunk(self, chunk: bytes):
+        self._consume(self.parser.feed(chunk))
+
+    def _consume(self, batch):
+        if batch is None or len(batch) == 0:
+            return
+        frame = self.columnar.write(batch)
+        self.rows += len(batch)
+        if self.monitor is not None:
+            self.monitor.update(frame)
+
+    async def finish(self) -> dict:
+        """
+        Stores every copy under the new content hash; returns the dataset's new metadata.
+        """
+        compute = get_compute()
+        if self.pending is not None:
+            # No newline at all: an empty or header-only file
+            if not self.pending.strip():
+                raise AppendError("The upload has no rows to append")
+            self._check_header(self.pending)
+        await compute.run_local(self._consume, self.parser.close())
+        if self.rows == 0:
+            raise AppendError("The upload has no rows to append")
+        key = self.digest.hexdigest()
+        await close_as(self.writer, key)
+        self.key = key
+
+        meta = self.dataset.metadata_info
+        self.columnar.finalize()
+        pyramid = None
+        if meta["roles"]["kind"] == "time_series":
+            try:
+                pyramid = await save_pyramid(pyramid_key(key), await compute.run(rebuild_pyramid, self.columnar.path), storage=self.storage)
+            except Exception as e:
+                logger.error(f"Pyramid rebuild failed for {key}: {e}")
+        stored_columnar = await self.columnar.close(columnar_key(key))
+        drift_key = None
+        if self.monitor is not None:
+            try:
+                drift_key = await save_monitor(key, self.monitor)
+            except Exception as e:
+                logger.error(f"Failed to store drift monitor for {key}: {e}")
+        return {
+            **meta,
+            "size": self.writer.size,
+            "rows": self.stored_rows + self.rows,
+            "columnar_key": stored_columnar,
+            "pyramid_key": pyramid,
+            "drift_key": drift_key,
+        }
+
+    async def abort(self):
+        await self.writer.abort()
+        self.columnar.abort()
+
+
+def parse_header(line: bytes) -> list:
+    return next(csv.reader([line.decode("utf-8-sig").strip("\r\n")]))
+
+
+async def append_upload(dataset, file, db):
+    """
+    Streams an uploaded CSV onto the end of a dataset (see StreamingAppend) and points the
+    record at the extended copies: its row count grows, so the retrain scheduler sees the
+    new rows, and the drift monitor windows them. Returns (dataset, appended row count).
+    """
+    lock = _append_locks.setdefault(dataset.id, asyncio.Lock())
+    async with lock:
+        # Another append may have committed while this one waited
+        db.refresh(dataset)
+        meta = dataset.metadata_info or {}
+        if not meta.get("columnar_key") or not meta.get("roles"):
+            raise AppendError("The dataset has no columnar copy to append to; upload it again")
+
+        append = StreamingAppend(dataset, monitor=await dataset_monitor(dataset))
+        try:
+            await append.copy_stored()
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await append.feed(chunk)
+            metadata = await append.finish()
+        except BaseException:
+            await append.abort()
+            raise
+
+        dataset.s3_key = dataset.content_hash = append.key
+        dataset.metadata_info = metadata
+        db.commit()
+        db.refresh(dataset)
+    logger.info(f"Appended {append.rows} rows to dataset {dataset.id} ({metadata['rows']} rows)")
+    return dataset, append.rows
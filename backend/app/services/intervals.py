@@ -0,0 +1,76 @@
+import numpy as np
+from scipy.stats import norm
+
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+INTERVAL_BOUNDS = (0.05, 0.95)  # confidence_lower / confidence_upper: central 90% band
+MIN_SAMPLES = 20  # residuals per step below which neighbouring steps are pooled in
+
+
+def quantile_name(level: float) -> str:
+    return f"p{level * 100:g}"
+
+
+def _conformal_levels(levels: np.ndarray, n: int) -> np.ndarray:
+    # Split-conformal finite-sample correction: levels move away from the median by (n + 1) / n
+    return np.clip(0.5 + (levels - 0.5) * (n + 1) / n, 0.0, 1.0)
+
+
+def has_spread(residuals) -> bool:
+    """
+    Whether residuals can calibrate a band: a single one (one fold of a one-step backtest)
+    has no spread, so every quantile would coincide.
+    """
+    return residuals is not None and int(np.isfinite(np.asarray(residuals, dtype=float)).sum()) >= 2
+
+
+def residual_quantiles(residuals: np.ndarray, levels, steps: int) -> np.ndarray:
+    """
+    Quantiles of out-of-sample residuals (actual - forecast; rows = backtest folds, columns =
+    horizon steps) for every level and step in one vectorized pass: shape (levels, steps).
+    With fewer than MIN_SAMPLES folds, each step pools the residuals of just enough neighbouring
+    steps on either side. Steps past the residuals' horizon reuse the last step's deviations
+    from its median (the bias is kept), widened with the square root of the distance.
+    """
+    residuals = np.asarray(residuals, dtype=float)
+    if not has_spread(residuals):
+        raise ValueError("At least two residuals are needed for a band")
+    # The median rides along as the last level
+    levels = np.append(np.asarray(levels, dtype=float), 0.5)
+    folds, width = residuals.shape
+    pool = min(int(np.ceil((MIN_SAMPLES / folds - 1) / 2)), width - 1) if folds < MIN_SAMPLES else 0
+    padded = np.pad(residuals, ((0, 0), (pool, pool)), constant_values=np.nan)
+    # windows[h] holds the (folds, 2 * pool + 1) residuals around step h
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * pool + 1, axis=1).transpose(1, 0, 2)
+    ordered = np.sort(windows.reshape(width, -1), axis=1)  # NaN padding sorts last
+    counts = np.isfinite(ordered).sum(axis=1)
+    # Linear-interpolated order statistics at each (level, step)
+    position = _conformal_levels(levels[:, None], counts[None, :]) * (counts - 1)[None, :]
+    lo = np.floor(position).astype(int)
+    hi = np.ceil(position).astype(int)
+    frac = position - lo
+    steps_index = np.arange(width)[None, :]
+    quantiles = ordered[steps_index, lo] * (1 - frac) + ordered[steps_index, hi] * frac
+    quantiles, median = quantiles[:-1], quantiles[-1]
+    if steps <= width:
+        return quantiles[:, :steps]
+    extra = np.sqrt(np.arange(width + 1, steps + 1) / width)
+    spread = quantiles[:, -1:] - median[-1]
+    return np.hstack([quantiles, median[-1] + spread * extra[None, :]])
+
+
+def conformal_bands(forecast, residuals, levels=DEFAULT_QUANTILES) -> dict:
+    """
+    Quantile forecasts {level: values} from stored backtest residuals, without refitting.
+    """
+    forecast = np.asarray(forecast, dtype=float)
+    quantiles = residual_quantiles(residuals, levels, len(forecast))
+    return {float(level): forecast + quantiles[i] for i, level in enumerate(levels)}
+
+
+def gaussian_bands(forecast, sigma: float, levels=DEFAULT_QUANTILES) -> dict:
+    """
+    Fallback when no residuals are available: normal quantiles of a single error scale.
+    """
+    forecast = np.asarray(forecast, dtype=float)
+    z = norm.ppf(np.asarray(levels, dtype=float))
+    return {float(level): forecast + z[i] * sigma for i, level in enumerate(levels)}
@@ -0,0 +1,571 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PREFIX = "insightx:jobs:"
+MAX_PRIORITY = 9          # 0 (lowest) .. 9 (highest)
+PRIORITY_SPAN = 1e13      # ready score = (MAX_PRIORITY - priority) * span + enqueue time (ms): FIFO per priority
+CLAIM_SCAN = 50           # queued jobs inspected per claim when tenants are at their limit
+ACTIVE = ("queued", "retrying", "running")
+RUN_KINDS = ("forecast", "multi_series")  # jobs that own a forecast run row
+PRECOMPUTE_TENANT = "precompute"  # background derivations, kept off the users' tenant limits
+
+
+def dedup_key(kind: str, payload: dict, tenant: str) -> str:
+    """
+    Identity of a job for deduplication: the same kind, payload and tenant.
+    """
+    body = json.dumps({"kind": kind, "payload": payload, "tenant": tenant}, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def ready_score(priority: int, now: float) -> float:
+    return (MAX_PRIORITY - priority) * PRIORITY_SPAN + now * 1000
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with jitter for the given number of attempts made so far.
+    """
+    return min(settings.JOB_RETRY_MAX, settings.JOB_RETRY_BASE * 2 ** max(attempts - 1, 0)) * random.uniform(0.5, 1.0)
+
+
+def new_job(kind: str, payload: dict, tenant: str = "default", priority: int = 0, dedup: str = None,
+            max_attempts: int = None, tenant_limit: int = None) -> dict:
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "payload": payload,
+        "tenant": tenant or "default",
+        "priority": max(0, min(int(priority), MAX_PRIORITY)),
+        "dedup": dedup or "",
+        "max_attempts": max_attempts or settings.JOB_MAX_ATTEMPTS,
+        "tenant_limit": tenant_limit or settings.JOB_TENANT_CONCURRENCY,
+        "attempts": 0,
+        "status": "queued",
+        "error": "",
+        "cancel": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class JobBroker(ABC):
+    """
+    Durable job queue. Queued jobs are ordered by priority then age; a claim skips jobs whose
+    tenant is at its concurrency limit and leases the job to the worker until `lease_until`
+    (extended by heartbeats; expired leases are reclaimed). All transitions are atomic.
+    """
+    @abstractmethod
+    async def enqueue(self, job: dict) -> dict:
+        """Queues the job, or returns the active job with the same dedup key instead."""
+
+    @abstractmethod
+    async def claim(self, lease_until: float) -> dict: ...
+
+    @abstractmethod
+    async def heartbeat(self, job_id: str, lease_until: float) -> bool:
+        """Extends the lease; True when cancellation was requested."""
+
+    @abstractmethod
+    async def release(self, job_id: str, status: str, error: str = "", retry_at: float = None):
+        """Ends a lease: a terminal status, or 'retrying' until `retry_at`."""
+
+    @abstractmethod
+    async def cancel(self, job_id: str) -> str:
+        """Cancels a queued job, or flags a running one; returns the resulting status."""
+
+    @abstractmethod
+    async def expired(self, now: float) -> list:
+        """Takes back leases that ran out (crashed workers) and returns those job ids."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> dict: ...
+
+    @abstractmethod
+    async def find_active(self, dedup: str) -> dict: ...
+
+    @abstractmethod
+    async def stats(self) -> dict:
+        """Queue depth: {queued, retrying, running, tenants: {tenant: running}}."""
+
+
+class MemoryBroker(JobBroker):
+    """
+    In-process stand-in with the same semantics, for development and tests without Redis.
+    """
+    def __init__(self):
+        self.jobs = {}
+        self.ready = {}     # id -> score
+        self.delayed = {}   # id -> retry time
+        self.running = {}   # id -> lease deadline
+        self.tenants = {}
+        self.dedup = {}
+        self.lock = threading.Lock()
+
+    def _finish(self, job: dict):
+        if job["dedup"] and self.dedup.get(job["dedup"]) == job["id"]:
+            del self.dedup[job["dedup"]]
+
+    def _take_lease(self, job_id: str) -> bool:
+        if self.running.pop(job_id, None) is None:
+            return False
+        tenant = self.jobs[job_id]["tenant"]
+        self.tenants[tenant] -= 1
+        if self.tenants[tenant] <= 0:
+            del self.tenants[tenant]
+        return True
+
+    async def enqueue(self, job):
+        with self.lock:
+            if job["dedup"]:
+                existing = self.jobs.get(self.dedup.get(job["dedup"]))
+                if existing is not None and existing["status"] in ACTIVE:
+                    return dict(existing)
+                self.dedup[job["dedup"]] = job["id"]
+            self.jobs[job["id"]] = dict(job)
+            self.ready[job["id"]] = ready_score(job["priority"], time.time())
+            return dict(job)
+
+    async def claim(self, lease_until):
+        now = time.time()
+        with self.lock:
+            for job_id, at in list(self.delayed.items()):
+                if at <= now:
+                    del self.delayed[job_id]
+                    self.ready[job_id] = ready_score(self.jobs[job_id]["priority"], now)
+                    self.jobs[job_id]["status"] = "queued"
+            for job_id in sorted(self.ready, key=self.ready.get)[:CLAIM_SCAN]:
+                job = self.jobs[job_id]
+                if self.tenants.get(job["tenant"], 0) >= job["tenant_limit"]:
+                    continue
+                del self.ready[job_id]
+                self.tenants[job["tenant"]] = self.tenants.get(job["tenant"], 0) + 1
+                self.running[job_id] = lease_until
+                job.update(status="running", attempts=job["attempts"] + 1, updated_at=now)
+                return dict(job)
+        return None
+
+    async def heartbeat(self, job_id, lease_until):
+        with self.lock:
+            if job_id in self.running:
+                self.running[job_id] = lease_until
+            return bool(self.jobs.get(job_id, {}).get("cancel"))
+
+    async def release(self, job_id, status, error="", retry_at=None):
+        with self.lock:
+            job = self.jobs[job_id]
+            self._take_lease(job_id)
+            job.update(status=status, error=error or "", updated_at=time.time())
+            if retry_at is not None:
+                self.delayed[job_id] = retry_at
+            else:
+                self._finish(job)
+
+    async def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "running":
+                job["cancel"] = 1
+                return "cancelling"
+            if job["status"] in ("queued", "retrying"):
+                self.ready.pop(job_id, None)
+                self.delayed.pop(job_id, None)
+                job.update(status="cancelled", updated_at=time.time())
+                self._finish(job)
+            return job["status"]
+
+    async def expired(self, now):
+        with self.lock:
+            ids = [job_id for job_id, deadline in self.running.items() if deadline <= now]
+            for job_id in ids:
+                self._take_lease(job_id)
+                self.jobs[job_id]["status"] = "interrupted"
+            return ids
+
+    async def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    async def find_active(self, dedup):
+        with self.lock:
+            job = self.jobs.get(self.dedup.get(dedup))
+            return dict(job) if job is not None and job["status"] in ACTIVE else None
+
+    async def stats(self):
+        with self.lock:
+            return {
+                "queued": len(self.ready),
+                "retrying": len(self.delayed),
+                "running": len(self.running),
+                "tenants": dict(self.tenants),
+            }
+
+
+# Lua scripts keep each transition atomic across API replicas and workers.
+# Job hashes live at PREFIX .. "job:" .. id, dedup keys at PREFIX .. "dedup:" .. key.
+_ENQUEUE = """
+local prefix = ARGV[1]
+if ARGV[3] ~= '' then
+  local existing = redis.call('GET', prefix .. 'dedup:' .. ARGV[3])
+  if existing then
+    local status = redis.call('HGET', prefix .. 'job:' .. existing, 'status')
+    if status == 'queued' or status == 'retrying' or status == 'running' then return existing end
+  end
+  redis.call('SET', prefix .. 'dedup:' .. ARGV[3], ARGV[2])
+end
+redis.call('HSET', prefix .. 'job:' .. ARGV[2], unpack(ARGV, 5))
+redis.call('ZADD', prefix .. 'ready', ARGV[4], ARGV[2])
+return ARGV[2]
+"""
+
+_CLAIM = """
+local prefix, now, lease_until = ARGV[1], tonumber(ARGV[2]), ARGV[3]
+local max_priority, span = tonumber(ARGV[5]), tonumber(ARGV[6])
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', prefix .. 'delayed', '-inf', now, 'LIMIT', 0, 100)) do
+  redis.call('ZREM', prefix .. 'delayed', id)
+  local priority = tonumber(redis.call('HGET', prefix .. 'job:' .. id, 'priority') or '0')
+  redis.call('ZADD', prefix .. 'ready', (max_priority - priority) * span + now * 1000, id)
+  redis.call('HSET', prefix .. 'job:' .. id, 'status', 'queued')
+end
+for _, id in ipairs(redis.call('ZRANGE', prefix .. 'ready', 0, tonumber(ARGV[4]) - 1)) do
+  local key = prefix .. 'job:' .. id
+  local tenant = redis.call('HGET', key, 'tenant')
+  local limit = tonumber(redis.call('HGET', key, 'tenant_limit'))
+  if tonumber(redis.call('HGET', prefix .. 'tenants', tenant) or '0') < limit then
+    redis.call('ZREM', prefix .. 'ready', id)
+    redis.call('HINCRBY', prefix .. 'tenants', tenant, 1)
+    redis.call('ZADD', prefix .. 'running', lease_until, id)
+    redis.call('HINCRBY', key, 'attempts', 1)
+    redis.call('HSET', key, 'status', 'running', 'updated_at', ARGV[2])
+    return id
+  end
+end
+return false
+"""
+
+_TAKE_LEASE = """
+local function take_lease(prefix, id)
+  if redis.call('ZREM', prefix .. 'running', id) == 0 then return 0 end
+  local tenant = redis.call('HGET', prefix .. 'job:' .. id, 'tenant')
+  if redis.call('HINCRBY', prefix .. 'tenants', tenant, -1) <= 0 then redis.call('HDEL', prefix .. 'tenants', tenant) end
+  return 1
+end
+local function finish(prefix, id, ttl)
+  local key = prefix .. 'job:' .. id
+  local dedup = redis.call('HGET', key, 'dedup')
+  if dedup and dedup ~= '' and redis.call('GET', prefix .. 'dedup:' .. dedup) == id then
+    redis.call('DEL', prefix .. 'dedup:' .. dedup)
+  end
+  redis.call('EXPIRE', key, ttl)
+end
+"""
+
+_RELEASE = _TAKE_LEASE + """
+local prefix, id = ARGV[1], ARGV[2]
+take_lease(prefix, id)
+redis.call('HSET', prefix .. 'job:' .. id, 'status', ARGV[3], 'error', ARGV[4], 'updated_at', ARGV[5])
+if ARGV[6] ~= '' then
+  redis.call('ZADD', prefix .. 'delayed', ARGV[6], id)
+else
+  finish(prefix, id, ARGV[7])
+end
+return 1
+"""
+
+_CANCEL = _TAKE_LEASE + """
+local prefix, id = ARGV[1], ARGV[2]
+local key = prefix .. 'job:' .. id
+local status = redis.call('HGET', key, 'status')
+if not status then return false end
+if status == 'running' then
+  redis.call('HSET', key, 'cancel', 1)
+  return 'cancelling'
+end
+if status == 'queued' or status == 'retrying' then
+  redis.call('ZREM', prefix .. 'ready', id)
+  redis.call('ZREM', prefix .. 'delayed', id)
+  redis.call('HSET', key, 'status', 'cancelled', 'updated_at', ARGV[3])
+  finish(prefix, id, ARGV[4])
+  return 'cancelled'
+end
+return status
+"""
+
+_EXPIRED = _TAKE_LEASE + """
+local prefix = ARGV[1]
+local ids = redis.call('ZRANGEBYSCORE', prefix .. 'running', '-inf', ARGV[2], 'LIMIT', 0, 100)
+for _, id in ipairs(ids) do
+  take_lease(prefix, id)
+  redis.call('HSET', prefix .. 'job:' .. id, 'status', 'interrupted')
+end
+return ids
+"""
+
+_HEARTBEAT = """
+local prefix, id = ARGV[1], ARGV[2]
+redis.call('ZADD', prefix .. 'running', 'XX', ARGV[3], id)
+return redis.call('HGET', prefix .. 'job:' .. id, 'cancel')
+"""
+
+_NUMERIC = ("priority", "max_attempts", "tenant_limit", "attempts", "cancel")
+_FLOATS = ("created_at", "updated_at")
+
+
+def _decode(raw: dict) -> dict:
+    if not raw:
+        return None
+    job = dict(raw)
+    job["payload"] = json.loads(job.get("payload") or "{}")
+    for field in _NUMERIC:
+        job[field] = int(job.get(field) or 0)
+    for field in _FLOATS:
+        job[field] = float(job.get(field) or 0)
+    return job
+
+
+class RedisBroker(JobBroker):
+    """
+    Redis-backed queue shared by the API and the worker processes: job hashes plus sorted
+    sets for queued (by priority, then age), retrying (by due time) and running (by lease
+    deadline) jobs, and a hash of running jobs per tenant.
+    """
+    def __init__(self, url: str, prefix: str = PREFIX):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url, encoding="utf-8", decode_responses=True)
+        self.prefix = prefix
+        self.scripts = {
+            name: self.redis.register_script(source)
+            for name, source in (("enqueue", _ENQUEUE), ("claim", _CLAIM), ("release", _RELEASE),
+                                 ("cancel", _CANCEL), ("expired", _EXPIRED), ("heartbeat", _HEARTBEAT))
+        }
+
+    async def enqueue(self, job):
+        fields = {**job, "payload": json.dumps(job["payload"], default=str)}
+        flat = [str(item) for pair in fields.items() for item in pair]
+        job_id = await self.scripts["enqueue"](args=[self.prefix, job["id"], job["dedup"], ready_score(job["priority"], time.time()), *flat])
+        return job if job_id == job["id"] else await self.get(job_id)
+
+    async def claim(self, lease_until):
+        job_id = await self.scripts["claim"](args=[self.prefix, time.time(), lease_until, CLAIM_SCAN, MAX_PRIORITY, PRIORITY_SPAN])
+        return await self.get(job_id) if job_id else None
+
+    async def heartbeat(self, job_id, lease_until):
+        return bool(int(await self.scripts["heartbeat"](args=[self.prefix, job_id, lease_until]) or 0))
+
+    async def release(self, job_id, status, error="", retry_at=None):
+        await self.scripts["release"](args=[self.prefix, job_id, status, error or "", time.time(),
+                                            "" if retry_at is None else retry_at, settings.JOB_RESULT_TTL])
+
+    async def cancel(self, job_id):
+        return await self.scripts["cancel"](args=[self.prefix, job_id, time.time(), settings.JOB_RESULT_TTL])
+
+    async def expired(self, now):
+        return await self.scripts["expired"](args=[self.prefix, now])
+
+    async def get(self, job_id):
+        return _decode(await self.redis.hgetall(f"{self.prefix}job:{job_id}"))
+
+    async def find_active(self, dedup):
+        job_id = await self.redis.get(f"{self.prefix}dedup:{dedup}")
+        job = await self.get(job_id) if job_id else None
+        return job if job is not None and job["status"] in ACTIVE else None
+
+    async def stats(self):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zcard(f"{self.prefix}ready")
+            pipe.zcard(f"{self.prefix}delayed")
+            pipe.zcard(f"{self.prefix}running")
+            pipe.hgetall(f"{self.prefix}tenants")
+            queued, retrying, running, tenants = await pipe.execute()
+        return {"queued": queued, "retrying": retrying, "running": running, "tenants": {t: int(n) for t, n in tenants.items()}}
+
+
+@lru_cache()
+def get_broker() -> JobBroker:
+    if settings.JOB_BROKER == "memory":
+        return MemoryBroker()
+    return RedisBroker(settings.REDIS_URL)
+
+
+class Worker:
+    """
+    Runs queued jobs with `handlers[kind](payload)`, up to `concurrency` at a time. A
+    heartbeat keeps each lease alive and delivers cancellation (the handler's task is
+    cancelled). Failures are retried with exponential backoff up to the job's max attempts;
+    `on_final(job, status, error)` is awaited once a job ends cancelled or failed for good.
+    """
+    def __init__(self, broker: JobBroker, handlers: dict, concurrency: int = None, lease: float = None,
+                 poll_interval: float = None, on_final=None):
+        self.broker = broker
+        self.handlers = handlers
+        self.concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+        self.lease = lease or settings.JOB_LEASE_SECONDS
+        self.poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+        self.on_final = on_final
+        self.tasks = set()
+        self.stopping = asyncio.Event()
+
+    async def _settle(self, job: dict, error: str, cancelled: bool = False):
+        if not cancelled and job["attempts"] < job["max_attempts"]:
+            delay = retry_delay(job["attempts"])
+            logger.warning(f"Job {job['id'][:8]} ({job['kind']}) attempt {job['attempts']} failed, retrying in {delay:.1f}s: {error}")
+            await self.broker.release(job["id"], "retrying", error, retry_at=time.time() + delay)
+            return
+        status = "cancelled" if cancelled else "failed"
+        logger.error(f"Job {job['id'][:8]} ({job['kind']}) {status}: {error}")
+        await self.broker.release(job["id"], status, error)
+        if self.on_final is not None:
+            try:
+                await self.on_final(job, status, error)
+            except Exception as e:
+                logger.error(f"Final hook failed for job {job['id'][:8]}: {e}")
+
+    async def execute(self, job: dict):
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await self._settle({**job, "attempts": job["max_attempts"]}, f"Unknown job kind '{job['kind']}'")
+            return
+        task = asyncio.create_task(handler(job["payload"]))
+        cancelled = False
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=self.lease / 3)
+                if not task.done() and await self.broker.heartbeat(job["id"], time.time() + self.lease):
+                    cancelled = True
+                    task.cancel()
+        except asyncio.CancelledError:
+            # Worker shutdown: hand the job straight back to the queue
+            task.cancel()
+            await self.broker.release(job["id"], "retrying", "Worker shut down", retry_at=time.time())
+            raise
+        try:
+            task.result()
+        except asyncio.CancelledError:
+            await self._settle(job, "Cancelled" if cancelled else "Task cancelled", cancelled=cancelled)
+        except Exception as e:
+            await self._settle(job, str(e) or type(e).__name__)
+        else:
+            await self.broker.release(job["id"], "succeeded")
+
+    async def reap(self):
+        for job_id in await self.broker.expired(time.time()):
+            job = await self.broker.get(job_id)
+            if job is not None:
+                await self._settle(job, "Lease expired (worker lost)", cancelled=bool(job["cancel"]))
+
+    async def run(self):
+        logger.info(f"Job worker started ({self.concurrency} slots)")
+        while not self.stopping.is_set():
+            try:
+                await self.reap()
+                job = await self.broker.claim(time.time() + self.lease) if len(self.tasks) < self.concurrency else None
+            except Exception as e:
+                logger.error(f"Job broker unavailable: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self.execute(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def stop(self):
+        """
+        Stops claiming; running jobs are interrupted and queued again.
+        """
+        self.stopping.set()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def _forecast_job(payload: dict):
+    from app.services import forecasting, results_store
+    from app.services.compute import get_compute
+    await get_compute().run_local(results_store.save_run, payload["run_id"], "running")
+    await forecasting.run_forecast_task(
+        payload["run_id"], payload["dataset_id"], payload.get("overrides"), payload.get("horizon", 30), payload.get("quantiles"),
+        payload.get("refit")
+    )
+
+
+async def _multi_series_job(payload: dict):
+    from app.services import multiseries, results_store
+    from app.services.compute import get_compute
+    await get_compute().run_local(results_store.save_run, payload["run_id"], "running")
+    await multiseries.run_multi_series_task(payload["run_id"], payload["dataset_id"], payload["series_column"], payload.get("horizon", 30),
+                                            payload.get("value_column"), payload.get("refit"))
+
+
+async def _stress_job(payload: dict):
+    from app.services import forecasting
+    await forecasting.precompute_stress(payload["run_id"])
+
+
+async def _surface_job(payload: dict):
+    from app.services import response_surface
+    await response_surface.precompute_surface(payload["run_id"])
+
+
+HANDLERS = {"forecast": _forecast_job, "multi_series": _multi_series_job, "stress": _stress_job, "surface": _surface_job}
+
+
+async def _record_final(job: dict, status: str, error: str):
+    from app.services import results_store
+    from app.services.compute import get_compute
+    if job["kind"] in RUN_KINDS and "run_id" in job["payload"]:
+        await get_compute().run_local(results_store.save_run, job["payload"]["run_id"], status, {"error": error})
+
+
+def create_worker(broker: JobBroker = None, concurrency: int = None) -> Worker:
+    """
+    Worker for the run handlers; cancelled or failed jobs are recorded on their run.
+    """
+    return Worker(broker or get_broker(), HANDLERS, concurrency=concurrency, on_final=_record_final)
+
+
+async def submit_run(db, kind: str, spec: dict, tenant: str = "default", priority: int = 0, parameters: dict = None,
+                     model_type: str = "prophet", tenant_limit: int = None, broker: JobBroker = None) -> dict:
+    """
+    Creates a queued run row and enqueues its job. An identical job of the same tenant that is
+    still queued or running is returned instead ("duplicate"); the new row is then dropped.
+    """
+    from app.db import models
+    broker = broker or get_broker()
+    key = dedup_key(kind, spec, tenant)
+    existing = await broker.find_active(key)
+    if existing is not None:
+        return {"run_id": existing["payload"]["run_id"], "job_id": existing["id"], "status": "duplicate"}
+
+    db_run = models.ForecastRun(dataset_id=spec["dataset_id"], horizon=spec["horizon"], model_type=model_type,
+                                status="queued", parameters=parameters)
+    db.add(db_run)
+    db.commit()
+    db.refresh(db_run)
+
+    job = await broker.enqueue(new_job(kind, {**spec, "run_id": db_run.id}, tenant, priority, key, tenant_limit=tenant_limit))
+    if job["payload"]["run_id"] != db_run.id:
+        # An identical submission won the race
+        db.delete(db_run)
+        db.commit()
+        return {"run_id": job["payload"]["run_id"], "job_id": job["id"], "status": "duplicate"}
+    return {"run_id": db_run.id, "job_id": job["id"], "status": "queued"}
@@ -0,0 +1,252 @@
+import os
+import json
+import uuid
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from app.core.config import get_settings
+from app.services.compute import get_compute
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+ARTIFACT_SUFFIX = ".pkl"
+LINEAGE_SUFFIX = ".lineage.json"
+MLFLOW_EXPERIMENT = "insightx-models"
+ANCHOR_ROWS = 64    # leading rows that identify a series across appends
+LINEAGE_KEEP = 8    # most recent versions remembered per lineage
+
+
+def training_fingerprint(data_fingerprint: str, params: dict) -> str:
+    """
+    Identity of a fitted model: the exact training data plus every parameter that affects the fit.
+    """
+    payload = json.dumps({"data": data_fingerprint, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def lineage_key(history, params: dict) -> str:
+    """
+    Identity shared by every appended version of a series under the same parameters:
+    the leading rows plus the parameters. Blocking (hashes rows).
+    """
+    from app.services.analysis import dataframe_fingerprint
+    return training_fingerprint(dataframe_fingerprint(history.iloc[:ANCHOR_ROWS]), params)
+
+
+class MlflowMirror:
+    """
+    Optional durable copy of artifacts in MLflow: one run per fingerprint (tagged), with the
+    artifact file, parameters and metrics logged. Used when the local store misses.
+    """
+    def __init__(self, tracking_uri: str):
+        import mlflow
+        self.mlflow = mlflow
+        self.client = mlflow.tracking.MlflowClient(tracking_uri)
+        experiment = self.client.get_experiment_by_name(MLFLOW_EXPERIMENT)
+        self.experiment_id = experiment.experiment_id if experiment else self.client.create_experiment(MLFLOW_EXPERIMENT)
+
+    def _find(self, fingerprint: str):
+        runs = self.client.search_runs([self.experiment_id], filter_string=f"tags.fingerprint = '{fingerprint}'", max_results=1)
+        return runs[0] if runs else None
+
+    def log(self, fingerprint: str, path: str, metadata: dict):
+        run = self.client.create_run(self.experiment_id, tags={"fingerprint": fingerprint})
+        run_id = run.info.run_id
+        for key, value in (metadata.get("params") or {}).items():
+            self.client.log_param(run_id, key, str(value)[:250])
+        for key, value in (metadata.get("metrics") or {}).items():
+            if value is not None:
+                self.client.log_metric(run_id, key, float(value))
+        self.client.log_artifact(run_id, path)
+        self.client.set_terminated(run_id)
+
+    def fetch(self, fingerprint: str, dest_dir: str):
+        run = self._find(fingerprint)
+        if run is None:
+            return None
+        return self.client.download_artifacts(run.info.run_id, f"{fingerprint}{ARTIFACT_SUFFIX}", dest_dir)
+
+    def delete(self, fingerprint: str):
+        run = self._find(fingerprint)
+        if run is not None:
+            self.client.delete_run(run.info.run_id)
+
+
+class ModelRegistry:
+    """
+    Fitted-model store keyed by training fingerprint.
+    An in-memory LRU sits in front of a file-backed store (one pickle per fingerprint; file
+    mtime is the recency used for LRU eviction by count and total bytes). With an MLflow
+    mirror, new artifacts are also logged there and local misses are fetched from it.
+    Blocking methods do file I/O; async callers use `get`/`put`.
+    """
+    def __init__(self, root: str, memory_items: int = 16, max_models: int = 200, max_bytes: int = 2 * 1024 ** 3, mirror: MlflowMirror = None):
+        self.root = root
+        self.memory_items = memory_items
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.mirror = mirror
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()  # memory is touched from the event loop and I/O threads
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.root, f"{fingerprint}{ARTIFACT_SUFFIX}")
+
+    def _remember(self, fingerprint: str, artifact):
+        with self.lock:
+            self.memory[fingerprint] = artifact
+            self.memory.move_to_end(fingerprint)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def load(self, fingerprint: str):
+        path = self._path(fingerprint)
+        if not os.path.exists(path) and self.mirror is not None:
+            try:
+                fetched = self.mirror.fetch(fingerprint, tempfile.mkdtemp())
+                if fetched:
+                    os.replace(fetched, path)
+            except Exception as e:
+                logger.error(f"MLflow fetch failed for {fingerprint[:12]}: {e}")
+        try:
+            with open(path, "rb") as f:
+                artifact = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Discarding unreadable model artifact {fingerprint[:12]}: {e}")
+            self.delete(fingerprint)
+            return None
+        os.utime(path)  # mark as recently used
+        return artifact
+
+    def _lineage_path(self, anchor: str) -> str:
+        return os.path.join(self.root, f"{anchor}{LINEAGE_SUFFIX}")
+
+    def lineage(self, anchor: str) -> list:
+        """
+        Registered versions of a series: [{fingerprint, rows, data}] (data = hash of those rows).
+        """
+        try:
+            with open(self._lineage_path(anchor)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def record_lineage(self, anchor: str, entry: dict):
+        with self.lock:
+            # A refit on the same rows supersedes the earlier version
+            entries = [e for e in self.lineage(anchor)
+                       if e["fingerprint"] != entry["fingerprint"] and (e["rows"], e["data"]) != (entry["rows"], entry["data"])]
+            entries = sorted(entries + [entry], key=lambda e: e["rows"])[-LINEAGE_KEEP:]
+            path = self._lineage_path(anchor)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp, path)
+
+    def find_base(self, anchor: str, history):
+        """
+        Latest registered artifact trained on a strict prefix of `history` (rows were appended
+        since), as (artifact, rows), or (None, 0). Prefixes are verified by content hash. Blocking.
+        """
+        from app.services.analysis import dataframe_fingerprint
+        for entry in sorted(self.lineage(anchor), key=lambda e: -e["rows"]):
+            if entry["rows"] >= len(history):
+                continue
+            if dataframe_fingerprint(history.iloc[:entry["rows"]]) != entry["data"]:
+                continue
+            with self.lock:
+                artifact = self.memory.get(entry["fingerprint"])
+            artifact = artifact if artifact is not None else self.load(entry["fingerprint"])
+            if artifact is not None:
+                return artifact, entry["rows"]
+        return None, 0
+
+    def save(self, fingerprint: str, artifact, metadata: dict = None, lineage: dict = None):
+        path = self._path(fingerprint)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        if self.mirror is not None:
+            try:
+                self.mirror.log(fingerprint, path, metadata or {})
+            except Exception as e:
+                logger.error(f"MLflow logging failed for {fingerprint[:12]}: {e}")
+        if lineage is not None:
+            self.record_lineage(lineage["anchor"], {"fingerprint": fingerprint, "rows": lineage["rows"], "data": lineage["data"]})
+        self.evict(keep=fingerprint)
+
+    def delete(self, fingerprint: str):
+        with self.lock:
+            self.memory.pop(fingerprint, None)
+        try:
+            os.remove(self._path(fingerprint))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, keep: str = None):
+        """
+        Removes least recently used artifacts until the store is within its count and size limits.
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith(ARTIFACT_SUFFIX):
+                stat = os.stat(os.path.join(self.root, name))
+                entries.append((stat.st_mtime, stat.st_size, name[:-len(ARTIFACT_SUFFIX)]))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        count = len(entries)
+        for _, size, fingerprint in entries:
+            if count <= self.max_models and total <= self.max_bytes:
+                break
+            if fingerprint == keep:
+                continue
+            logger.info(f"Evicting model {fingerprint[:12]} ({size} bytes)")
+            self.delete(fingerprint)
+            total -= size
+            count -= 1
+
+    async def get(self, fingerprint: str):
+        with self.lock:
+            if fingerprint in self.memory:
+                self.memory.move_to_end(fingerprint)
+                return self.memory[fingerprint]
+        artifact = await get_compute().run_local(self.load, fingerprint)
+        if artifact is not None:
+            self._remember(fingerprint, artifact)
+        return artifact
+
+    async def put(self, fingerprint: str, artifact, metadata: dict = None, lineage: dict = None):
+        """
+        `lineage` ({anchor, rows, data}) makes the artifact findable as the base for later appends.
+        """
+        self._remember(fingerprint, artifact)
+        await get_compute().run_local(self.save, fingerprint, artifact, metadata, lineage)
+
+    async def afind_base(self, anchor: str, history):
+        return await get_compute().run_local(self.find_base, anchor, history)
+
+
+@lru_cache()
+def get_model_registry() -> ModelRegistry:
+    mirror = None
+    if settings.MODEL_REGISTRY_BACKEND == "mlflow":
+        try:
+            mirror = MlflowMirror(settings.MLFLOW_TRACKING_URI)
+        except Exception as e:
+            logger.error(f"MLflow unavailable, using the local model store only: {e}")
+    return ModelRegistry(
+        settings.MODEL_REGISTRY_ROOT,
+        memory_items=settings.MODEL_REGISTRY_MEMORY_ITEMS,
+        max_models=settings.MODEL_REGISTRY_MAX_MODELS,
+        max_bytes=settings.MODEL_REGISTRY_MAX_BYTES,
+        mirror=mirror,
+    )
@@ -0,0 +1,350 @@
+import time
+import json
+import logging
+import numpy as np
+import pandas as pd
+import redis.asyncio as redis
+from app.core.config import get_settings
+from app.services.compute import get_compute, ComputeBusyError
+from app.services import results_store
+from app.services.analysis import find_target_column
+from app.services.ensemble import Z_90, infer_frequency
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SERIES_LAGS = (2, 3, 4, 5, 6, 7, 14, 21, 28)  # relative to the last value (lag 1)
+ROLLING_WINDOWS = (7, 28)
+WINDOW = max(max(SERIES_LAGS), max(ROLLING_WINDOWS))
+FEATURE_CHUNK = 200_000  # training rows materialized per window block
+MIN_SERIES_ROWS = 2
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+ENGINE_VERSION = 1
+
+
+class SeriesColumnError(ValueError):
+    """The chosen series-id column is not usable for grouped forecasting."""
+
+
+def prepare_panel(df: pd.DataFrame, series_column: str) -> pd.DataFrame:
+    """
+    Long-format frame as (series, ds, y), sorted by series then date. Duplicate
+    (series, date) rows are summed; series with too little history are dropped.
+    """
+    if series_column not in df.columns:
+        raise SeriesColumnError(f"Column '{series_column}' not found")
+    panel = pd.DataFrame({
+        "series": df[series_column].astype("string"),
+        "ds": pd.to_datetime(df["ds"], errors="coerce"),
+        "y": pd.to_numeric(df["y"], errors="coerce"),
+    }).dropna()
+    panel = panel.groupby(["series", "ds"], sort=True, observed=True)["y"].sum().reset_index()
+    sizes = panel.groupby("series", observed=True)["y"].transform("size")
+    return panel[sizes >= MIN_SERIES_ROWS].reset_index(drop=True)
+
+
+def _calendar(ds) -> np.ndarray:
+    ds = pd.DatetimeIndex(ds)
+    return np.column_stack([ds.dayofweek, ds.month, ds.day]).astype(float)
+
+
+def _window_features(window: np.ndarray, calendar: np.ndarray) -> np.ndarray:
+    """
+    Features from the last WINDOW scaled values of each row (most recent last, NaN before
+    the series starts): the level, lag differences, rolling means relative to the level,
+    short-window volatility and calendar fields. Missing values stay NaN for the trees.
+    """
+    last = window[:, -1:]
+    with np.errstate(invalid="ignore"):
+        parts = [
+            last,
+            window[:, [-k for k in SERIES_LAGS]] - last,
+            *[window[:, -w:].mean(axis=1, keepdims=True) - last for w in ROLLING_WINDOWS],
+            window[:, -ROLLING_WINDOWS[0]:].std(axis=1, keepdims=True),
+            calendar,
+        ]
+    return np.hstack(parts)
+
+
+def _windows(values: np.ndarray, ends: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    The WINDOW values before each position in `ends` (positions into `values`), masked
+    with NaN where they precede the start of that position's series (`lengths` = values
+    of the same series available before the position).
+    """
+    padded = np.concatenate([np.full(WINDOW, np.nan), values])
+    window = padded[ends[:, None] + np.arange(WINDOW)]
+    window[np.arange(WINDOW)[None, :] < (WINDOW - lengths)[:, None]] = np.nan
+    return window
+
+
+def panel_arrays(panel: pd.DataFrame) -> dict:
+    """
+    Flat arrays for a sorted panel: series codes, per-series scale, scaled values and
+    the position of each row within its series.
+    """
+    codes, ids = pd.factorize(panel["series"], sort=True)
+    counts = np.bincount(codes, minlength=len(ids))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    y = panel["y"].to_numpy(dtype=float)
+    scale = np.bincount(codes, weights=np.abs(y), minlength=len(ids)) / counts
+    scale[scale == 0] = 1.0
+    return {
+        "ids": np.asarray(ids, dtype=object),
+        "codes": codes,
+        "counts": counts,
+        "starts": starts,
+        "scale": scale,
+        "values": y / scale[codes],
+        "position": np.arange(len(y)) - starts[codes],
+        "ds": panel["ds"].to_numpy(),
+    }
+
+
+def training_matrix(arrays: dict):
+    """
+    Features and one-step targets for every row after the first of its series, built for
+    all series at once in blocks of FEATURE_CHUNK rows.
+    """
+    rows = np.flatnonzero(arrays["position"] >= 1)
+    blocks = []
+    for lo in range(0, len(rows), FEATURE_CHUNK):
+        chunk = rows[lo:lo + FEATURE_CHUNK]
+        window = _windows(arrays["values"], chunk, arrays["position"][chunk])
+        blocks.append(_window_features(window, _calendar(arrays["ds"][chunk])))
+    features = np.vstack(blocks) if blocks else np.empty((0, 0))
+    values = arrays["values"]
+    return features, values[rows] - values[rows - 1], arrays["codes"][rows]
+
+
+def fit_global_model(features: np.ndarray, target: np.ndarray):
+    import xgboost as xgb
+    model = xgb.XGBRegressor(n_estimators=300, max_depth=6, learning_rate=0.05, subsample=0.8, n_jobs=1)
+    model.fit(features, target)
+    return model
+
+
+def forecast_panel(panel: pd.DataFrame, horizon: int, freq: str, model=None) -> dict:
+    """
+    Trains one global gradient-boosted model over every series of the panel (unless a
+    fitted `model` is given) and forecasts all series together: each recursive step is a
+    single batched predict call over the series. Blocking; runs in a compute worker.
+    """
+    started = time.perf_counter()
+    arrays = panel_arrays(panel)
+    features, target, codes = training_matrix(arrays)
+    if model is None:
+        model = fit_global_model(features, target)
+    fit_seconds = time.perf_counter() - started
+
+    # One-step residual spread per series (scaled), widened with the horizon
+    resid = target - model.predict(features)
+    n_series = len(arrays["ids"])
+    resid_count = np.maximum(np.bincount(codes, minlength=n_series), 1)
+    sigma = np.sqrt(np.bincount(codes, weights=resid ** 2, minlength=n_series) / resid_count)
+
+    ends = arrays["starts"] + arrays["counts"]
+    window = _windows(arrays["values"], ends, arrays["counts"])
+    last_dates = pd.DatetimeIndex(arrays["ds"][ends - 1])
+    offset = pd.tseries.frequencies.to_offset(freq)
+    forecast = np.empty((n_series, horizon))
+    for h in range(horizon):
+        step = model.predict(_window_features(window, _calendar(last_dates + offset * (h + 1))))
+        level = window[:, -1] + step
+        window = np.hstack([window[:, 1:], level[:, None]])
+        forecast[:, h] = level
+
+    width = Z_90 * sigma[:, None] * np.sqrt(np.arange(1, horizon + 1))[None, :]
+    scale = arrays["scale"][:, None]
+    return {
+        "model": model,
+        "ids": arrays["ids"].tolist(),
+        "rows": arrays["counts"].tolist(),
+        "start": [d.strftime("%Y-%m-%d") for d in last_dates + offset],
+        "forecast": forecast * scale,
+        "confidence_lower": (forecast - width) * scale,
+        "confidence_upper": (forecast + width) * scale,
+        "fit_rmse": float(np.sqrt(np.mean(resid ** 2))) if len(resid) else None,
+        "training_rows": int(len(target)),
+        "fit_seconds": fit_seconds,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _series_frame(frame: pd.DataFrame, series_column: str, value_column: str = None) -> pd.DataFrame:
+    # (ds, y, series column) with the target inferred among the numeric columns other than the series
+    if series_column not in frame.columns:
+        raise SeriesColumnError(f"Column '{series_column}' not found")
+    if value_column is not None and value_column not in frame.columns:
+        raise SeriesColumnError(f"Column '{value_column}' not found")
+    if value_column == series_column:
+        raise SeriesColumnError("The value column cannot be the series column")
+    target = value_column or find_target_column(frame, exclude=["ds", series_column])
+    if target is None:
+        raise SeriesColumnError(f"No numeric value column besides '{series_column}'")
+    return pd.DataFrame({"ds": frame["ds"], "y": frame[target], series_column: frame[series_column]})
+
+
+def _original_names(roles: dict) -> dict:
+    # Columns stored under a suffix (see columnar.stored_names) back to their own names,
+    # which only clash with the role columns ds/y when they are named so
+    return {stored: column for column, stored in (roles.get("renamed") or {}).items() if column not in ("ds", "y")}
+
+
+def load_series_frame(dataset, series_column: str, value_column: str = None) -> pd.DataFrame:
+    """
+    (ds, y, series column) of a time-series dataset, from its columnar copy when there is
+    one, otherwise by resolving roles on the raw CSV. The value is `value_column`, or else
+    the dataset's target unless that is the series column (e.g. numeric SKU ids), in which
+    case it is inferred from the other numeric columns. Blocking.
+    """
+    from io import BytesIO
+    from app.services.storage import get_storage
+    from app.services.columnar import load_columnar, resolve_roles, to_columnar, stored_name
+
+    if series_column in ("ds", "y"):
+        raise SeriesColumnError(f"Cannot group by a column named '{series_column}'")
+    meta = dataset.metadata_info or {}
+    roles = meta.get("roles")
+    if meta.get("columnar_key") and roles:
+        if roles["kind"] != "time_series":
+            raise SeriesColumnError("Grouped forecasting needs a dataset with a date column")
+        stored_target = [roles["y"]] if roles["y"] is not None else []
+        if series_column not in roles["numeric"] + roles["text"] + stored_target:
+            raise SeriesColumnError(f"Column '{series_column}' not found")
+        if value_column is None and series_column != roles["y"]:
+            frame = load_columnar(meta["columnar_key"], columns=["ds", "y", stored_name(roles, series_column)])
+            return frame.rename(columns=_original_names(roles))
+        # The stored target column is "y"; back to its own name among the candidates
+        wanted = ["ds"] + (["y"] if stored_target else []) + [stored_name(roles, c) for c in roles["numeric"] if c != series_column]
+        wanted += [stored_name(roles, series_column)] if series_column in roles["text"] else []
+        frame = load_columnar(meta["columnar_key"], columns=wanted).rename(columns={"y": roles["y"], **_original_names(roles)})
+        return _series_frame(frame, series_column, value_column)
+
+    raw = pd.read_csv(BytesIO(get_storage("datasets").get(dataset.s3_key)))
+    for column in (series_column, value_column):
+        if column is not None and column not in raw.columns:
+            raise SeriesColumnError(f"Column '{column}' not found")
+    roles = resolve_roles(raw, exclude=[series_column], target=value_column)
+    if roles["kind"] != "time_series":
+        raise SeriesColumnError("Grouped forecasting needs a dataset with a date column")
+    if roles["y"] is None:
+        raise SeriesColumnError(f"No numeric value column besides '{series_column}'")
+    return to_columnar(raw, roles).rename(columns=_original_names(roles))
+
+
+SERIES_FIELDS = ("ids", "rows", "start", "forecast", "confidence_lower", "confidence_upper")
+
+
+def series_page(results: dict, page: int = 1, page_size: int = PAGE_SIZE) -> dict:
+    """
+    One page of a grouped run's per-series forecasts, with forecast dates expanded. Only the
+    page's rows of each stored array are read. Blocking.
+    """
+    total = results["series_count"]
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    offset = (max(page, 1) - 1) * page_size
+    horizon = results["horizon"]
+    columns = {field: results_store.read_series(results, f"series/{field}", offset, offset + page_size) for field in SERIES_FIELDS}
+    items = []
+    for i, series_id in enumerate(columns["ids"]):
+        item = {"id": series_id, **{field: columns[field][i] for field in SERIES_FIELDS[1:]}}
+        dates = pd.date_range(start=item["start"], periods=horizon, freq=results["frequency"])
+        items.append({**item, "dates": dates.strftime("%Y-%m-%d").tolist()})
+    return {
+        "total": total,
+        "page": max(page, 1),
+        "page_size": page_size,
+        "pages": (total + page_size - 1) // page_size,
+        "series": items,
+    }
+
+
+async def run_multi_series_task(run_id: int, dataset_id: int, series_column: str, horizon: int = 30, value_column: str = None,
+                                refit: str = None):
+    """
+    Grouped forecasting task for long-format datasets: one global model over every series
+    identified by `series_column` (of `value_column`, inferred by default), forecasts stored
+    on the run and served in pages. A `refit` token (a retrain's trigger time) is part of
+    the model's fingerprint, so a registered model of the same data is not reused.
+    """
+    from app.db.session import SessionLocal
+    from app.db.models import Dataset
+    from app.services.analysis import dataframe_fingerprint
+    from app.services.model_registry import get_model_registry, training_fingerprint
+
+    r = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    channel = "insightx:events"
+    compute = get_compute()
+
+    async def publish(event_type, payload):
+        await r.publish(channel, json.dumps({"type": event_type, "run_id": run_id, "payload": payload}))
+
+    await publish("run.started", {"message": f"Grouped forecasting by '{series_column}' started..."})
+    try:
+        db = SessionLocal()
+        try:
+            dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+        finally:
+            db.close()
+        if dataset is None:
+            raise SeriesColumnError(f"Dataset {dataset_id} not found")
+
+        frame = await compute.run_local(load_series_frame, dataset, series_column, value_column)
+        panel = await compute.run_local(prepare_panel, frame, series_column)
+        if panel.empty:
+            raise SeriesColumnError(f"No series in '{series_column}' have at least {MIN_SERIES_ROWS} dated values")
+        longest = panel.groupby("series", observed=True).size().idxmax()
+        freq = await compute.run_local(infer_frequency, panel.loc[panel["series"] == longest, "ds"])
+        await publish("run.progress", {"step": "Feature Engineering", "progress": 20, "series": int(panel["series"].nunique())})
+
+        # The global model is registered like the ensemble, keyed by data + parameters
+        registry = get_model_registry()
+        params = {"engine": ENGINE_VERSION, "kind": "global_gbm", "lags": SERIES_LAGS, "windows": ROLLING_WINDOWS, "frequency": freq}
+        if refit:
+            params["refit"] = refit
+        fingerprint = training_fingerprint(await compute.run_local(dataframe_fingerprint, panel), params)
+        model = await registry.get(fingerprint)
+        await publish("run.progress", {"step": "Global Model Training", "progress": 40, "cached": model is not None})
+
+        batch = await compute.run(forecast_panel, panel, horizon, freq, model)
+        if model is None:
+            try:
+                await registry.put(fingerprint, batch["model"], metadata={"params": params, "metrics": {"fit_rmse": batch["fit_rmse"]}})
+            except Exception as e:
+                logger.error(f"Failed to register global model {fingerprint[:12]}: {e}")
+        await publish("run.progress", {"step": "Batched Prediction", "progress": 90})
+    except ComputeBusyError:
+        raise  # transient: the job queue retries the run with backoff
+    except Exception as e:
+        logger.error(f"Grouped forecast failed for run {run_id}: {e}")
+        await compute.run_local(results_store.save_run, run_id, "failed", {"error": str(e)})
+        await publish("run.failed", {"message": f"Forecast failed: {e}"})
+        return
+
+    summary = {
+        "mode": "multi_series",
+        "series_column": series_column,
+        "value_column": value_column,
+        "series_count": len(batch["ids"]),
+        "horizon": horizon,
+        "frequency": freq,
+        "fit_rmse": batch["fit_rmse"],
+        "training_rows": batch["training_rows"],
+        "fingerprint": fingerprint,
+        "reused": model is not None,
+        "dataset_rows": (dataset.metadata_info or {}).get("rows"),
+        "model_info": "Global XGBoost (all series)",
+    }
+    # Per-series arrays (forecasts as series x horizon matrices) go to the binary results store
+    try:
+        results = await results_store.store_results(run_id, summary, {f"series/{field}": batch[field] for field in SERIES_FIELDS})
+    except Exception as e:
+        logger.error(f"Failed to store results for run {run_id}: {e}")
+        await compute.run_local(results_store.save_run, run_id, "failed", {"error": f"Results could not be stored: {e}"})
+        await publish("run.failed", {"message": f"Results could not be stored: {e}"})
+        return
+    logger.info(f"Run {run_id}: {results['series_count']} series forecast in {batch['seconds']:.2f}s")
+
+    await publish("run.completed", {"results": {**summary, "page": await compute.run_local(series_page, results)}})
@@ -0,0 +1,335 @@
+import numpy as np
+import pandas as pd
+
+PROFILE_BATCH_ROWS = 100_000
+SKETCH_K = 2048
+_NAT_KEY = np.iinfo(np.int64).max
+
+
+class QuantileSketch:
+    """
+    Mergeable KLL-style quantile sketch. Level h holds items of weight 2**h; a full level
+    is sorted and every other item (random offset) is promoted to the next level.
+    Memory is O(k log(n/k)); while nothing has been compacted the sketch is exact.
+    """
+    def __init__(self, k: int = SKETCH_K, seed: int = None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other: "QuantileSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if items.size > 2 * self.k:
+                items = np.sort(items)
+                # Keep an even number at this level's boundary so weight is preserved exactly
+                spill = items.size - (items.size % 2)
+                promoted = items[self.rng.integers(2):spill:2]
+                self.levels[h] = items[spill:]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    @property
+    def is_exact(self) -> bool:
+        return all(items.size == 0 for items in self.levels[1:])
+
+    def _weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(lvl.size, 2.0 ** h) for h, lvl in enumerate(self.levels)])
+        order = np.argsort(items, kind="mergesort")
+        return items[order], weights[order]
+
+    def quantile(self, q):
+        """
+        Quantile(s) for q in [0, 1]. Exact (linear interpolation, as pandas) until the first compaction.
+        """
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float("nan")
+        if self.is_exact:
+            return _interpolated_quantile(np.sort(self.levels[0]), q)
+        items, weights = self._weighted()
+        cum = np.cumsum(weights)
+        ranks = np.asarray(q, dtype=float) * cum[-1]
+        idx = np.clip(np.searchsorted(cum, ranks, side="left"), 0, items.size - 1)
+        result = items[idx]
+        return result if np.ndim(q) else float(result)
+
+    def cdf(self, points):
+        """
+        Estimated fraction of items <= each point.
+        """
+        points = np.asarray(points, dtype=float)
+        if self.count == 0:
+            return np.zeros_like(points)
+        items, weights = self._weighted()
+        cum = np.concatenate([[0.0], np.cumsum(weights)])
+        return cum[np.searchsorted(items, points, side="right")] / cum[-1]
+
+    def items(self) -> np.ndarray:
+        """
+        Every retained item (unsorted, unweighted): the candidate points of CDF comparisons.
+        """
+        return np.concatenate(self.levels)
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "count": self.count, "levels": [lvl.tolist() for lvl in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(k=data["k"])
+        sketch.levels = [np.asarray(lvl, dtype=float) for lvl in data["levels"]] or [np.empty(0)]
+        sketch.count = data["count"]
+        return sketch
+
+
+class ColumnProfile:
+    """
+    One-pass statistics for a numeric column: count/sum/mean/variance (Chan's parallel
+    update), min/max with their row labels, first/last values in order and a quantile sketch.
+    Ordered fields use an (order key, row position) pair so partial profiles merge in any order.
+    """
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max = None   # (value, key, pos)
+        self.min = None
+        self.first = None  # (key, pos, value)
+        self.last = None
+        self.sketch = QuantileSketch()
+
+    def update(self, values: np.ndarray, keys: np.ndarray, positions: np.ndarray):
+        if values.size == 0:
+            return
+        # First/last in order include missing values, as iloc[0] / iloc[-1] would.
+        # Positions increase within a batch, so argmin/argmax ties resolve by position.
+        first = int(np.argmin(keys))
+        last = keys.size - 1 - int(np.argmax(keys[::-1]))
+        self.first = _earliest(self.first, (keys[first], positions[first], values[first]))
+        self.last = _latest(self.last, (keys[last], positions[last], values[last]))
+
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return
+        v, k, p = values[valid], keys[valid], positions[valid]
+
+        n_b = v.size
+        mean_b = v.mean()
+        m2_b = ((v - mean_b) ** 2).sum()
+        self._combine(n_b, v.sum(), mean_b, m2_b)
+
+        i_max = np.flatnonzero(v == v.max())
+        i_max = i_max[np.argmin(k[i_max])]
+        i_min = np.flatnonzero(v == v.min())
+        i_min = i_min[np.argmin(k[i_min])]
+        self.max = _pick_extreme(self.max, (v[i_max], k[i_max], p[i_max]), largest=True)
+        self.min = _pick_extreme(self.min, (v[i_min], k[i_min], p[i_min]), largest=False)
+
+        self.sketch.update(v)
+
+    def _combine(self, n_b, total_b, mean_b, m2_b):
+        n_a = self.n
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * n_b / n
+        self.m2 = self.m2 + m2_b + delta ** 2 * n_a * n_b / n
+        self.total += total_b
+        self.n = n
+
+    def merge(self, other: "ColumnProfile"):
+        if other.n:
+            self._combine(other.n, other.total, other.mean, other.m2)
+            self.max = _pick_extreme(self.max, other.max, largest=True)
+            self.min = _pick_extreme(self.min, other.min, largest=False)
+            self.sketch.merge(other.sketch)
+        if other.first is not None:
+            self.first = _earliest(self.first, other.first)
+            self.last = _latest(self.last, other.last)
+        return self
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else float("nan")
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+
+class OutlierSample:
+    """
+    The first `limit` rows (by order key, then position) with a value outside [lower, upper],
+    kept while row batches stream past in any order.
+    """
+    def __init__(self, lower: float, upper: float, limit: int = 5):
+        self.lower = lower
+        self.upper = upper
+        self.limit = limit
+        self.rows = _empty_candidates()
+
+    def update(self, values: np.ndarray, keys: np.ndarray, positions: np.ndarray):
+        outside = (values < self.lower) | (values > self.upper)
+        if not outside.any():
+            return self
+        v = np.concatenate([self.rows[0], values[outside]])
+        k = np.concatenate([self.rows[1], keys[outside]])
+        p = np.concatenate([self.rows[2], positions[outside]])
+        order = np.lexsort((p, k))[:self.limit]
+        self.rows = (v[order], k[order], p[order])
+        return self
+
+    def to_list(self) -> list:
+        """(value, order key, row position) tuples, in order."""
+        return [(float(v), int(k), int(p)) for v, k, p in zip(*self.rows)]
+
+
+class StreamingProfile:
+    """
+    Bounded-memory dataset profile built from row batches in a single pass.
+    Batches are preprocessed frames (optional 'date' column, numeric target = first numeric column).
+    Partial profiles over disjoint row ranges (pass `offset`) can be merged.
+    """
+    def __init__(self, offset: int = 0):
+        self.offset = offset
+        self.rows = 0
+        self.columns = None
+        self.target = None
+        self.has_date = False
+        self.null_cells = 0
+        self.total_cells = 0
+        self.column = ColumnProfile()
+
+    def update(self, batch: pd.DataFrame):
+        if self.columns is None:
+            self.columns = list(batch.columns)
+            self.has_date = 'date' in batch.columns
+            numeric_cols = batch.select_dtypes(include=[np.number]).columns
+            self.target = numeric_cols[0] if len(numeric_cols) > 0 else None
+
+        start = self.offset + self.rows
+        self.rows += len(batch)
+        self.null_cells += int(batch.isnull().sum().sum())
+        self.total_cells += batch.size
+
+        if self.target is None or self.target not in batch.columns:
+            return
+        self.column.update(*self._ordered(batch, start))
+        return self
+
+    def _ordered(self, batch: pd.DataFrame, start: int) -> tuple:
+        # (target values, order keys, row positions) of a batch starting at row `start`
+        positions = np.arange(start, start + len(batch))
+        values = pd.to_numeric(batch[self.target], errors='coerce').to_numpy(dtype=float)
+        if self.has_date:
+            # Rows are ordered by date (NaT last), then by position, as sort_values would
+            dates = pd.to_datetime(batch['date'], errors='coerce')
+            keys = dates.to_numpy(dtype='datetime64[ns]').view(np.int64).copy()
+            keys[dates.isna().to_numpy()] = _NAT_KEY
+        else:
+            keys = positions.copy()
+        return values, keys, positions
+
+    def outliers(self, batches, lower: float, upper: float, limit: int = 5) -> list:
+        """
+        First `limit` rows (in order) outside [lower, upper]: a second pass over the row
+        batches the profile was built from (only the target and date columns are needed),
+        once the bounds are known from the first. Returns (value, order key, row position)
+        tuples.
+        """
+        sample = OutlierSample(lower, upper, limit)
+        start = self.offset
+        for batch in batches:
+            if self.target in batch.columns:
+                sample.update(*self._ordered(batch, start))
+            start += len(batch)
+        return sample.to_list()
+
+    def label(self, key: int, pos: int):
+        """
+        Row label for reporting: its date when the dataset is dated, otherwise 'Row N'.
+        """
+        if not self.has_date:
+            return f"Row {pos}"
+        return pd.NaT if key == _NAT_KEY else pd.Timestamp(key)
+
+    def merge(self, other: "StreamingProfile"):
+        if self.columns is None:
+            self.columns, self.target, self.has_date = other.columns, other.target, other.has_date
+        self.offset = min(self.offset, other.offset)
+        self.rows += other.rows
+        self.null_cells += other.null_cells
+        self.total_cells += other.total_cells
+        self.column.merge(other.column)
+        return self
+
+
+def frame_batches(df: pd.DataFrame, batch_rows: int = PROFILE_BATCH_ROWS):
+    for start in range(0, max(len(df), 1), batch_rows):
+        yield df.iloc[start:start + batch_rows]
+
+
+def profile_dataframe(df: pd.DataFrame, batch_rows: int = PROFILE_BATCH_ROWS) -> StreamingProfile:
+    profile = StreamingProfile()
+    for batch in frame_batches(df, batch_rows):
+        profile.update(batch)
+    return profile
+
+
+def _interpolated_quantile(items: np.ndarray, q):
+    # Linear interpolation that keeps exact order statistics when the position is integral (inf-safe)
+    pos = np.asarray(q, dtype=float) * (items.size - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.ceil(pos).astype(int)
+    frac = pos - lo
+    with np.errstate(invalid='ignore'):
+        result = np.where(frac == 0, items[lo], items[lo] + frac * (items[hi] - items[lo]))
+    return result if np.ndim(q) else float(result)
+
+
+def _empty_candidates():
+    return (np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+
+def _pick_extreme(a, b, largest: bool):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a[0] != b[0]:
+        return a if (a[0] > b[0]) == largest else b
+    return a if (a[1], a[2]) <= (b[1], b[2]) else b
+
+
+def _earliest(a, b):
+    if a is None:
+        return b
+    return a if (a[0], a[1]) <= (b[0], b[1]) else b
+
+
+def _latest(a, b):
+    if a is None:
+        return b
+    return a if (a[0], a[1]) >= (b[0], b[1]) else b
@@ -1,50 +1,314 @@
-import logging
-import json
+import time
 import asyncio
-from app.services.forecasting import run_forecast_task  # We'll use this to run sims
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+from app.services import results_store
+from app.services.compute import get_compute
+from app.services.ensemble import MODELS, predict_ensemble, predict_xgboost_paths
 
 logger = logging.getLogger(__name__)
 
-async def generate_recommendations(run_id: int):
-    """
-    Simulates "What-If" scenarios to find optimal actions.
-    Returns a list of recommended actions sorted by Impact/Risk.
-    """
-    logger.info(f"Generating recommendations for Run {run_id}...")
-    
-    # define candidate actions
-    candidates = [
-        {"name": "Increase Marketing Spend", "override": {"marketing_boost": 10}, "risk": "Medium", "cost": "High"},
-        {"name": "Aggressive Discounting", "override": {"price_discount": 15}, "risk": "High", "cost": "Medium"},
-        {"name": "Optimize Inventory", "override": {"inventory_optimization": True}, "risk": "Low", "cost": "Low"}
-    ]
-    
-    recommendations = []
-    
-    # In a real system, we'd run these in parallel. For now, simulate.
-    baseline_revenue = 100000 # Dummy baseline
-    
-    for action in candidates:
-        # Simulate Uplift (Mock Logic)
-        if "marketing_boost" in action["override"]:
-            uplift_pct = 8.5
-        elif "price_discount" in action["override"]:
-            uplift_pct = 5.2
-        else:
-            uplift_pct = 2.1
-            
-        uplift_val = baseline_revenue * (uplift_pct / 100)
-        
-        recommendations.append({
-            "action": action["name"],
-            "impact": f"+${uplift_val:,.0f} Revenue",
-            "uplift_percent": uplift_pct,
-            "risk": action["risk"],
-            "confidence": "High" if action["risk"] == "Low" else "Medium",
-            "reasoning": f"Simulated run showed {uplift_pct}% lift. Primary driver: {list(action['override'].keys())[0]}."
+LOOKBACK = 30  # recent history rows an action acts on, as run overrides do
+DEFAULT_BUDGET = 40  # candidate evaluations per request
+MAX_BUDGET = 200
+GRID_POINTS = 4  # first-round magnitudes per lever
+MIN_GAIN = 0.001  # a lever stops refining once a round improves its score by less than this share of baseline revenue
+RISK_AVERSION = 0.5  # score = net uplift - RISK_AVERSION * uplift standard deviation
+
+# Response assumptions of each lever, applied to the recent history the fitted models
+# forecast from: marketing lifts demand with diminishing returns (spend is a cost, as a
+# share of baseline revenue), a discount trades price for volume at a constant elasticity,
+# inventory optimization recovers sales lost to stockouts at a holding cost that rises
+# with the square of the recovery rate.
+MARKETING_MAX_LIFT = 0.25
+MARKETING_SATURATION = 5.0  # spend (% of revenue) reaching ~63% of the maximum lift
+PRICE_ELASTICITY = 1.8
+STOCKOUT_WINDOW = 7  # rows of the rolling median that unconstrained demand is read from
+HOLDING_COST = 0.02
+
+LEVERS = {
+    "marketing_boost": {"name": "Increase Marketing Spend", "range": (0.0, 20.0), "unit": "% of revenue"},
+    "price_discount": {"name": "Price Discount", "range": (0.0, 30.0), "unit": "%"},
+    "inventory_optimization": {"name": "Optimize Inventory", "range": (0.0, 1.0), "unit": "share of stockouts recovered"},
+}
+
+
+class RecommendationError(ValueError):
+    """The run or request does not allow recommendations."""
+
+
+class ModelUnavailableError(RecommendationError):
+    """The run's fitted ensemble is no longer in the model registry."""
+
+
+def apply_levers(recent: np.ndarray, override: dict):
+    """
+    The recent history under an action, as (values, cost share of baseline revenue).
+    """
+    values = np.asarray(recent, dtype=float).copy()
+    cost = 0.0
+    recovery = float(override.get("inventory_optimization") or 0.0)
+    if recovery:
+        demand = pd.Series(values).rolling(STOCKOUT_WINDOW, min_periods=1, center=True).median().to_numpy()
+        values += recovery * np.maximum(demand - values, 0.0)
+        cost += HOLDING_COST * recovery ** 2
+    spend = float(override.get("marketing_boost") or 0.0)
+    if spend:
+        values *= 1 + MARKETING_MAX_LIFT * (1 - np.exp(-spend / MARKETING_SATURATION))
+        cost += spend / 100
+    discount = float(override.get("price_discount") or 0.0) / 100
+    if discount:
+        values *= (1 - discount) * (1 + PRICE_ELASTICITY * discount)
+    return values, cost
+
+
+def _arima_paths(state: dict, deltas: np.ndarray, steps: int) -> np.ndarray:
+    # The state-space model is re-filtered over the changed history with its parameters fixed
+    endog = np.asarray(state["model"].model.endog, dtype=float).ravel()
+    out = np.empty((len(deltas), steps))
+    for i, delta in enumerate(deltas):
+        changed = endog.copy()
+        changed[-delta.size:] += delta
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            out[i] = state["model"].apply(changed, refit=False).forecast(steps)
+    return out
+
+
+def _xgboost_paths(state: dict, deltas: np.ndarray, steps: int) -> np.ndarray:
+    tails = np.repeat(state["tail"][None, :], len(deltas), axis=0)
+    width = min(state["lags"], deltas.shape[1])
+    tails[:, -width:] += deltas[:, -width:]
+    return predict_xgboost_paths(state, tails, steps)
+
+
+# Members whose forecast depends on the recent history; the others (Prophet: trend and
+# seasonality of the dates) keep their baseline forecast under any action.
+COUNTERFACTUALS = {
+    "xgboost": _xgboost_paths,
+    "arima": _arima_paths,
+}
+
+
+def member_paths(states: dict, baseline: dict, weights: dict, deltas: np.ndarray) -> dict:
+    """
+    Every member's forecasts, shape (len(deltas), horizon), after each change of the recent
+    history (a row of `deltas`, aligned to its end), without refitting.
+    """
+    steps = len(next(iter(baseline.values())))
+    paths = {name: np.repeat(baseline[name][None, :], len(deltas), axis=0) for name in weights}
+    for name, state in states.items():
+        paths[name] = COUNTERFACTUALS[name](state, deltas, steps)
+    return paths
+
+
+def score_candidates(states: dict, baseline: dict, weights: dict, recent: np.ndarray, overrides: list) -> list:
+    """
+    Forecasts of every member under each override, without refitting (runs in a compute
+    worker), reduced to the blended uplift, cost and net over the horizon and the spread of
+    the members' uplifts.
+    """
+    applied = [apply_levers(recent, o) for o in overrides]
+    paths = member_paths(states, baseline, weights, np.stack([values - recent for values, _ in applied]))
+    revenue = float(sum(weights[n] * baseline[n] for n in weights).sum())
+    member_uplift = np.column_stack([(paths[n] - baseline[n][None, :]).sum(axis=1) for n in weights])
+    w = np.array([weights[n] for n in weights])
+    uplift = member_uplift @ w
+    # Weighted spread of the members' uplifts: how far the models disagree about the action
+    spread = np.sqrt(np.maximum(((member_uplift - uplift[:, None]) ** 2) @ w, 0.0))
+    forecast = sum(weights[n] * paths[n] for n in weights)
+    scored = []
+    for i, override in enumerate(overrides):
+        cost = applied[i][1] * revenue
+        net = float(uplift[i] - cost)
+        scored.append({
+            "override": override,
+            "uplift": float(uplift[i]),
+            "cost": cost,
+            "net": net,
+            "std": float(spread[i]),
+            "score": net - RISK_AVERSION * float(spread[i]),
+            "members": {n: float(member_uplift[i, j]) for j, n in enumerate(weights)},
+            "forecast": forecast[i],
         })
-    
-    # Sort by Uplift
-    recommendations.sort(key=lambda x: x["uplift_percent"], reverse=True)
-    
-    return recommendations
+    return scored
+
+
+def _risk(std: float, uplift: float) -> str:
+    ratio = std / abs(uplift) if uplift else np.inf
+    if ratio < 0.25:
+        return "Low"
+    if ratio < 0.6:
+        return "Medium"
+    return "High"
+
+
+def _confidence(probability: float) -> str:
+    if probability >= 0.9:
+        return "High"
+    if probability >= 0.7:
+        return "Medium"
+    return "Low"
+
+
+def _describe(candidate: dict, revenue: float) -> dict:
+    from scipy.stats import norm
+
+    override = candidate["override"]
+    levers = [lever for lever in LEVERS if override.get(lever)]
+    net, std = candidate["net"], candidate["std"]
+    probability = float(norm.cdf(net / std)) if std > 0 else float(net > 0)
+    uplift_pct = candidate["uplift"] / abs(revenue) * 100 if revenue else 0.0
+    net_pct = net / abs(revenue) * 100 if revenue else 0.0
+    settings = ", ".join(f"{LEVERS[lever]['name'].lower()} {override[lever]:g} {LEVERS[lever]['unit']}" for lever in levers)
+    drivers = sorted(candidate["members"].items(), key=lambda item: -abs(item[1]))
+    return {
+        "action": " + ".join(LEVERS[lever]["name"] for lever in levers),
+        "override": override,
+        "impact": f"{'+' if net >= 0 else '-'}${abs(net):,.0f} Revenue",
+        "uplift": candidate["uplift"],
+        "uplift_percent": round(uplift_pct, 2),
+        "cost": candidate["cost"],
+        "net": net,
+        "net_percent": round(net_pct, 2),
+        "uplift_std": std,
+        "downside_5": net - 1.6449 * std,
+        "probability_positive": probability,
+        "score": candidate["score"],
+        "risk": _risk(std, candidate["uplift"]),
+        "confidence": _confidence(probability),
+        "recommended": candidate["score"] > 0,
+        "forecast": np.round(candidate["forecast"], 4).tolist(),
+        "reasoning": (
+            f"With {settings}, the fitted ensemble forecasts {uplift_pct:+.1f}% revenue over the horizon "
+            f"({net_pct:+.1f}% net of cost); member uplifts: "
+            + ", ".join(f"{MODELS[n]} {v:+,.0f}" for n, v in drivers) + "."
+        ),
+    }
+
+
+async def search_levers(evaluate, levers: list, budget: int, revenue: float) -> tuple:
+    """
+    Budgeted search over lever magnitudes. Each round is one batch for `evaluate`: first a
+    grid over every lever's range, then the two midpoints around each lever's best magnitude
+    (the spacing halves every round). A lever stops once a round gains less than MIN_GAIN of
+    baseline revenue; the search stops when no lever is left or the budget is spent. Returns
+    (best candidate per lever, evaluations, rounds).
+    """
+    best, step, active, seen = {}, {}, list(levers), set()
+    pending = []
+    for lever in levers:
+        lo, hi = LEVERS[lever]["range"]
+        step[lever] = (hi - lo) / GRID_POINTS
+        pending += [(lever, float(m)) for m in np.linspace(lo + step[lever], hi, GRID_POINTS)]
+    evaluations = rounds = 0
+    while pending and evaluations < budget:
+        pending = pending[:budget - evaluations]
+        seen.update(pending)
+        scored = await evaluate([{lever: round(m, 4)} for lever, m in pending])
+        evaluations += len(pending)
+        rounds += 1
+        previous = {lever: best[lever]["score"] for lever in best}
+        for (lever, magnitude), candidate in zip(pending, scored):
+            if lever not in best or candidate["score"] > best[lever]["score"]:
+                best[lever] = {**candidate, "magnitude": magnitude}
+        # A budget smaller than the first grid leaves some levers unevaluated
+        active = [lever for lever in active if lever in best]
+        if rounds > 1:
+            active = [lever for lever in active if best[lever]["score"] - previous[lever] >= MIN_GAIN * abs(revenue)]
+        pending = []
+        for lever in active:
+            step[lever] /= 2
+            lo, hi = LEVERS[lever]["range"]
+            centre = best[lever]["magnitude"]
+            pending += [(lever, m) for m in (centre - step[lever], centre + step[lever])
+                        if lo < m <= hi and (lever, m) not in seen]
+    return best, evaluations, rounds
+
+
+async def load_fitted(run_id: int) -> tuple:
+    """
+    A completed run and its fitted ensemble from the model registry, as (run, fitted):
+    the recent history the models forecast from, the horizon, the blend weights, every
+    member's baseline forecast and the states of the members that respond to the history.
+    """
+    from app.db.session import SessionLocal
+    from app.db.models import ForecastRun
+    from app.services.model_registry import get_model_registry
+
+    db = SessionLocal()
+    try:
+        run = db.query(ForecastRun).filter(ForecastRun.id == run_id).first()
+    finally:
+        db.close()
+    fingerprint = ((run.results or {}).get("ensemble") or {}).get("fingerprint") if run is not None else None
+    if run is None or run.status != "completed" or not fingerprint:
+        raise RecommendationError(f"Run {run_id} has no completed ensemble forecast")
+    artifact = await get_model_registry().get(fingerprint)
+    if artifact is None:
+        raise ModelUnavailableError(f"The fitted models of run {run_id} are no longer cached; re-run the forecast")
+
+    compute = get_compute()
+    history = await compute.run_local(results_store.read_array, run.results, "history/values")
+    horizon = int(run.results.get("horizon") or len(run.results.get("dates", [])) or 30)
+    weights = {n: w for n, w in artifact["weights"].items() if w > 0 and n in artifact["states"]}
+    baseline = (await compute.run(predict_ensemble, {"states": {n: artifact["states"][n] for n in weights}}, horizon))["forecasts"]
+    return run, {
+        "recent": np.asarray(history[-LOOKBACK:], dtype=float),
+        "horizon": horizon,
+        "weights": weights,
+        "baseline": {n: np.asarray(f, dtype=float) for n, f in baseline.items()},
+        "states": {n: artifact["states"][n] for n in weights if n in COUNTERFACTUALS},
+    }
+
+
+async def generate_recommendations(run_id: int, levers: list = None, budget: int = DEFAULT_BUDGET) -> dict:
+    """
+    What-if optimizer: searches the magnitudes of each lever (and then their combination)
+    against the run's fitted ensemble from the model registry. Candidates are scored as
+    counterfactual forecasts from the changed recent history, in parallel batches on the
+    compute tier, without retraining. Returns the actions ranked by risk-adjusted net uplift.
+    """
+    started = time.perf_counter()
+    levers = levers or list(LEVERS)
+    unknown = [lever for lever in levers if lever not in LEVERS]
+    if unknown:
+        raise RecommendationError(f"Unknown levers: {', '.join(unknown)}")
+    if budget < 1:
+        raise RecommendationError("budget must be positive")
+
+    compute = get_compute()
+    _, fitted = await load_fitted(run_id)
+    recent, horizon, weights, baseline, states = (fitted[k] for k in ("recent", "horizon", "weights", "baseline", "states"))
+    revenue = float(sum(weights[n] * baseline[n] for n in weights).sum())
+
+    async def evaluate(overrides: list) -> list:
+        # One round: the candidates are split into a chunk per compute worker
+        chunks = np.array_split(np.arange(len(overrides)), min(compute.workers, len(overrides)))
+        scored = await asyncio.gather(*(
+            compute.run(score_candidates, states, baseline, weights, recent, [overrides[i] for i in chunk])
+            for chunk in chunks
+        ))
+        return [candidate for batch in scored for candidate in batch]
+
+    best, evaluations, rounds = await search_levers(evaluate, levers, max(budget - 1, 1), revenue)
+    candidates = list(best.values())
+    # The best magnitudes together, when more than one lever pays off on its own
+    combined = {lever: round(c["magnitude"], 4) for lever, c in best.items() if c["score"] > 0}
+    if len(combined) > 1 and evaluations < budget:
+        candidates += await evaluate([combined])
+        evaluations += 1
+
+    actions = sorted((_describe(c, revenue) for c in candidates), key=lambda a: -a["score"])
+    logger.info(f"Recommendations for run {run_id}: {evaluations} candidates in {rounds} rounds")
+    return {
+        "run_id": run_id,
+        "baseline_revenue": revenue,
+        "horizon": horizon,
+        "evaluations": evaluations,
+        "rounds": rounds,
+        "seconds": time.perf_counter() - started,
+        "recommendations": actions,
+    }
@@ -0,0 +1,205 @@
+import time
+import base64
+import asyncio
+import logging
+import numpy as np
+from app.services import results_store
+from app.services.compute import get_compute
+from app.services.recommendations import LOOKBACK, RecommendationError, load_fitted, member_paths
+
+logger = logging.getLogger(__name__)
+
+# Run overrides with a precomputed surface: the grid of values the fitted models are
+# evaluated at. Values are what run_forecast_task applies, e.g. marketing_boost is added to
+# the last LOOKBACK rows of history, so a surface point and an exact re-run agree up to refitting.
+SURFACE_OVERRIDES = {
+    "marketing_boost": {"name": "Marketing Boost (%)", "range": (0.0, 100.0), "points": 21},
+}
+NON_OVERRIDES = ("retrain", "series_column", "value_column")  # run parameters that are not scenario overrides
+
+
+class SurfaceError(RecommendationError):
+    """The override or value has no response surface."""
+
+
+def run_overrides(run) -> dict:
+    return {k: v for k, v in (run.parameters or {}).items() if k not in NON_OVERRIDES}
+
+
+def surface_grid(override: str) -> np.ndarray:
+    if override not in SURFACE_OVERRIDES:
+        raise SurfaceError(f"No response surface for override '{override}'; available: {', '.join(SURFACE_OVERRIDES)}")
+    spec = SURFACE_OVERRIDES[override]
+    return np.linspace(*spec["range"], spec["points"])
+
+
+def pack(values: np.ndarray) -> dict:
+    arr = np.ascontiguousarray(values, dtype="<f4")
+    return {"shape": list(arr.shape), "data": base64.b64encode(arr.tobytes()).decode()}
+
+
+def unpack(packed: dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(packed["data"]), dtype="<f4").reshape(packed["shape"])
+
+
+def blended_shift(states: dict, baseline: dict, weights: dict, deltas: np.ndarray) -> np.ndarray:
+    """
+    Change of the blended forecast, shape (len(deltas), horizon), after each change of the
+    recent history. Blocking; runs in a compute worker.
+    """
+    paths = member_paths(states, baseline, weights, deltas)
+    return sum(weights[n] * (paths[n] - baseline[n][None, :]) for n in weights)
+
+
+async def build_surface(run_id: int, override: str = "marketing_boost") -> dict:
+    """
+    Evaluates the run's fitted ensemble at every grid value of an override (relative to the
+    value the run itself was made with), without refitting, in a chunk per compute worker.
+    The surface is the stored forecast and band plus the float32 change of the blended
+    forecast per grid value.
+    """
+    started = time.perf_counter()
+    grid = surface_grid(override)
+    run, fitted = await load_fitted(run_id)
+    current = float(run_overrides(run).get(override) or 0.0)
+    deltas = np.repeat((grid - current)[:, None], min(LOOKBACK, len(fitted["recent"])), axis=1)
+
+    compute = get_compute()
+    chunks = np.array_split(np.arange(len(grid)), min(compute.workers, len(grid)))
+    shifts = await asyncio.gather(*(
+        compute.run(blended_shift, fitted["states"], fitted["baseline"], fitted["weights"], deltas[chunk])
+        for chunk in chunks
+    ))
+    forecast, dates, lower, upper = await asyncio.gather(*(
+        compute.run_local(results_store.read_series, run.results, name)
+        for name in ("forecast", "dates", "confidence_lower", "confidence_upper")
+    ))
+    return {
+        "run_id": run_id,
+        "override": override,
+        "grid": grid.tolist(),
+        "current": current,
+        "dates": dates,
+        "forecast": forecast,
+        "lower": lower,
+        "upper": upper,
+        "shift": pack(np.concatenate(shifts)),
+        "members": sorted(fitted["states"]),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def interpolate(surface: dict, values) -> np.ndarray:
+    """
+    Change of the forecast at each value, shape (len(values), horizon): linear between the
+    two neighbouring grid values, for all values in one pass.
+    """
+    grid = np.asarray(surface["grid"], dtype=float)
+    values = np.asarray(values, dtype=float)
+    outside = values[(values < grid[0]) | (values > grid[-1])]
+    if outside.size:
+        raise SurfaceError(f"{surface['override']} must be between {grid[0]:g} and {grid[-1]:g}")
+    shift = unpack(surface["shift"])
+    i = np.clip(np.searchsorted(grid, values, side="right") - 1, 0, len(grid) - 2)
+    w = ((values - grid[i]) / (grid[i + 1] - grid[i]))[:, None]
+    return shift[i] * (1 - w) + shift[i + 1] * w
+
+
+async def get_surface(run_id: int, override: str = "marketing_boost") -> tuple:
+    """
+    The run's surface for an override as (surface, cached): from the scenario cache (filled
+    in the background when the run completes, see precompute_surface), built on a miss.
+    """
+    from app.services.scenario_cache import get_scenario_cache
+
+    surface_grid(override)
+    cache = get_scenario_cache()
+    params = {"surface": override}
+    try:
+        cached = await cache.get(run_id, params)
+        generation = await cache.generation(run_id) if cached is None else None
+    except Exception as e:
+        logger.error(f"Scenario cache unavailable: {e}")
+        cached = generation = None
+    if cached is not None:
+        return cached, True
+    surface = await build_surface(run_id, override)
+    if generation is not None:
+        try:
+            await cache.put(run_id, params, surface, generation)
+        except Exception as e:
+            logger.error(f"Failed to cache response surface of run {run_id}: {e}")
+    return surface, False
+
+
+async def preview(run_id: int, override: str, values: list) -> dict:
+    """
+    Forecasts of the run with an override at each value, interpolated on its response surface.
+    """
+    started = time.perf_counter()
+    surface, cached = await get_surface(run_id, override)
+    shift = interpolate(surface, values)
+    forecast = np.asarray(surface["forecast"], dtype=float)
+    lower = None if surface["lower"] is None else np.asarray(surface["lower"], dtype=float)
+    upper = None if surface["upper"] is None else np.asarray(surface["upper"], dtype=float)
+    revenue = float(forecast.sum())
+    previews = []
+    for value, change in zip(values, shift):
+        # The band moves with the forecast: the residual spread does not depend on the override
+        previews.append({
+            "value": value,
+            "forecast": np.round(forecast + change, 4).tolist(),
+            "lower": None if lower is None else np.round(lower + change, 4).tolist(),
+            "upper": None if upper is None else np.round(upper + change, 4).tolist(),
+            "total": float(revenue + change.sum()),
+            "uplift": float(change.sum()),
+            "uplift_percent": round(float(change.sum()) / abs(revenue) * 100, 2) if revenue else 0.0,
+        })
+    return {
+        "run_id": run_id,
+        "override": override,
+        "current": surface["current"],
+        "range": [surface["grid"][0], surface["grid"][-1]],
+        "dates": surface["dates"],
+        "members": surface["members"],
+        "method": "interpolated",
+        "cached": cached,
+        "seconds": time.perf_counter() - started,
+        "previews": previews,
+    }
+
+
+async def precompute_surface(run_id: int):
+    """
+    Fills the scenario cache with the response surface of every override of a completed
+    run. Runs as a background job after the run's results are stored.
+    """
+    for override in SURFACE_OVERRIDES:
+        try:
+            surface, _ = await get_surface(run_id, override)
+        except RecommendationError as e:
+            # Nothing to retry: the run has no fitted ensemble (any longer)
+            logger.info(f"No response surface for run {run_id}: {e}")
+            return
+        logger.info(f"Response surface of run {run_id} ({override}) precomputed in {surface['seconds']:.2f}s")
+
+
+async def submit_exact(db, run_id: int, override: str, value: float, tenant: str = "default", priority: int = 0) -> dict:
+    """
+    Queues an exact re-run: the run's forecast refitted with the override at `value` (and
+    its other overrides unchanged).
+    """
+    from app.db.models import ForecastRun
+    from app.services import jobs
+
+    grid = surface_grid(override)
+    if not grid[0] <= value <= grid[-1]:
+        raise SurfaceError(f"{override} must be between {grid[0]:g} and {grid[-1]:g}")
+    run = db.query(ForecastRun).filter(ForecastRun.id == run_id).first()
+    if run is None or run.dataset_id is None:
+        raise SurfaceError(f"Run {run_id} has no dataset to re-run")
+    if (run.parameters or {}).get("series_column"):
+        raise SurfaceError("Grouped runs have no scenario overrides")
+    overrides = {**run_overrides(run), override: value}
+    spec = {"dataset_id": run.dataset_id, "overrides": overrides, "horizon": run.horizon, "quantiles": None}
+    return await jobs.submit_run(db, "forecast", spec, tenant, priority, overrides, model_type=run.model_type)
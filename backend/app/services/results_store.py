@@ -0,0 +1,181 @@
+import logging
+import numpy as np
+from app.services.compute import get_compute
+from app.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "datasets"
+ALIGNMENT = 8  # every array starts on an 8-byte boundary of the blob
+
+
+def results_key(run_id: int) -> str:
+    return f"results/run-{run_id}.bin"
+
+
+def encode_array(values) -> np.ndarray:
+    """
+    Typed little-endian array for a series: float64 for numbers (missing values as NaN),
+    datetime64[D] for ISO dates, fixed-width unicode for other labels.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind == "O":
+        try:
+            arr = arr.astype(float)  # None -> NaN
+        except (TypeError, ValueError):
+            arr = arr.astype(str)
+    if arr.dtype.kind == "U":
+        try:
+            dates = arr.astype("datetime64[D]")
+            if (np.datetime_as_string(dates, unit="D") == arr).all():
+                return dates
+        except (TypeError, ValueError):
+            pass
+        return arr.astype(arr.dtype.newbyteorder("<"))
+    if arr.dtype.kind == "b":
+        return arr
+    if arr.dtype.kind in "iu":
+        return arr.astype("<i8")
+    return arr.astype("<f8")
+
+
+def decode_array(arr: np.ndarray) -> list:
+    """
+    JSON-ready list of a stored array (NaN -> None, dates as YYYY-MM-DD).
+    """
+    if arr.dtype.kind == "M":
+        return np.datetime_as_string(arr, unit="D").tolist()
+    if arr.dtype.kind == "f":
+        out = arr.astype(object)
+        out[np.isnan(arr)] = None
+        return out.tolist()
+    return arr.tolist()
+
+
+def pack_series(series: dict):
+    """
+    Concatenates named series into one blob, as (bytes, index); the index maps each name
+    to {offset, nbytes, dtype, shape} so a series (or a row range of it) is one range read.
+    """
+    chunks, index, offset = [], {}, 0
+    for name, values in series.items():
+        arr = np.ascontiguousarray(encode_array(values))
+        data = arr.tobytes()
+        index[name] = {"offset": offset, "nbytes": len(data), "dtype": arr.dtype.str, "shape": list(arr.shape)}
+        padding = -len(data) % ALIGNMENT
+        chunks.append(data + b"\0" * padding)
+        offset += len(data) + padding
+    return b"".join(chunks), index
+
+
+def _unpack(data: bytes, entry: dict, rows: int = None) -> np.ndarray:
+    shape = list(entry["shape"])
+    if rows is not None:
+        shape[0] = rows
+    return np.frombuffer(data, dtype=np.dtype(entry["dtype"])).reshape(shape)
+
+
+def save_run(run_id: int, status: str, results: dict = None, reliability: dict = None):
+    """
+    Updates a run's row (status, summary results, reliability score and warnings). Blocking.
+    """
+    from app.db.session import SessionLocal
+    from app.db.models import ForecastRun
+    db = SessionLocal()
+    try:
+        run = db.query(ForecastRun).filter(ForecastRun.id == run_id).first()
+        if run is not None:
+            run.status = status
+            if results is not None:
+                run.results = results
+            if reliability is not None:
+                run.reliability_score = reliability["score"]
+                run.warnings = reliability["warnings"]
+            db.commit()
+    finally:
+        db.close()
+
+
+def write_results(run_id: int, summary: dict, series: dict, reliability: dict = None) -> dict:
+    """
+    Stores a completed run: the series as one binary object, the summary (plus the series
+    index) in the row. Returns the row's results. Blocking.
+    """
+    data, index = pack_series(series)
+    key = results_key(run_id)
+    get_storage(BUCKET).put(key, data)
+    results = {**summary, "store": {"key": key, "series": index}}
+    save_run(run_id, "completed", results, reliability)
+    return results
+
+
+async def store_results(run_id: int, summary: dict, series: dict, reliability: dict = None) -> dict:
+    """
+    write_results, then invalidates what was derived from the run's previous results.
+    """
+    from app.services.scenario_cache import get_scenario_cache
+    results = await get_compute().run_local(write_results, run_id, summary, series, reliability)
+    try:
+        await get_scenario_cache().invalidate(run_id)
+    except Exception as e:
+        logger.error(f"Failed to invalidate cached stress tests of run {run_id}: {e}")
+    return results
+
+
+def series_names(results: dict) -> list:
+    return list(((results or {}).get("store") or {}).get("series", {}))
+
+
+def read_array(results: dict, name: str, start: int = None, stop: int = None) -> np.ndarray:
+    """
+    One stored series, or rows [start, stop) of it, fetched with a single range read.
+    Raises KeyError for an unknown name. Blocking.
+    """
+    store = (results or {}).get("store") or {}
+    entry = store.get("series", {}).get(name)
+    if entry is None:
+        raise KeyError(name)
+    length = entry["shape"][0] if entry["shape"] else 1
+    start, stop, _ = slice(start, stop).indices(length)
+    stop = max(start, stop)
+    row_bytes = entry["nbytes"] // length if length else 0
+    if stop == start or row_bytes == 0:
+        return np.empty([0] + entry["shape"][1:], dtype=np.dtype(entry["dtype"]))
+    first = entry["offset"] + start * row_bytes
+    data = get_storage(BUCKET).get_range(store["key"], first, first + (stop - start) * row_bytes - 1)
+    return _unpack(data, entry, stop - start)
+
+
+def read_series(results: dict, name: str, start: int = None, stop: int = None) -> list:
+    return decode_array(read_array(results, name, start, stop))
+
+
+def merge_series(summary: dict, series: dict) -> dict:
+    """
+    Summary with the series put back in place ("quantiles/p10" -> ["quantiles"]["p10"]).
+    """
+    full = {k: v for k, v in summary.items() if k != "store"}
+    for name, values in series.items():
+        node = full
+        *parents, leaf = name.split("/")
+        for part in parents:
+            child = dict(node.get(part) or {})
+            node[part] = child
+            node = child
+        node[leaf] = values
+    return full
+
+
+def load_results(results: dict) -> dict:
+    """
+    The full results of a run, with one read of the whole blob. Blocking.
+    """
+    store = (results or {}).get("store")
+    if not store:
+        return results
+    data = get_storage(BUCKET).get(store["key"])
+    series = {
+        name: decode_array(_unpack(data[entry["offset"]:entry["offset"] + entry["nbytes"]], entry))
+        for name, entry in store["series"].items()
+    }
+    return merge_series(results, series)
@@ -0,0 +1,187 @@
+import json
+import time
+import zlib
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PREFIX = "insightx:stress:"
+
+
+def params_key(params: dict) -> str:
+    """
+    Identity of a cached request: stress paths, scenarios (in the order returned) and seed,
+    or the override of a response surface.
+    """
+    body = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()[:24]
+
+
+class ScenarioCache(ABC):
+    """
+    War Games results and response surfaces per run and parameters, with a TTL and least-recently-used
+    eviction beyond `max_entries`. Every run has a generation, bumped by `invalidate` when
+    its results change: entries are stored under the generation read before they were
+    computed, so a simulation of superseded results is never served.
+    """
+    def __init__(self, ttl: int = None, max_entries: int = None):
+        self.ttl = ttl or settings.STRESS_CACHE_TTL
+        self.max_entries = max_entries or settings.STRESS_CACHE_MAX_ENTRIES
+
+    @abstractmethod
+    async def generation(self, run_id: int) -> int: ...
+
+    @abstractmethod
+    async def get(self, run_id: int, params: dict) -> dict:
+        """The cached result for the run's current generation, or None."""
+
+    @abstractmethod
+    async def put(self, run_id: int, params: dict, result: dict, generation: int) -> bool:
+        """Stores a result computed at `generation`; False if the run has moved on since."""
+
+    @abstractmethod
+    async def invalidate(self, run_id: int):
+        """Drops the run's entries and bumps its generation."""
+
+    @abstractmethod
+    async def stats(self) -> dict: ...
+
+
+class MemoryScenarioCache(ScenarioCache):
+    """
+    In-process cache, for a single API process (JOB_BROKER=memory) and tests.
+    """
+    def __init__(self, ttl: int = None, max_entries: int = None):
+        super().__init__(ttl, max_entries)
+        self.entries = OrderedDict()  # (run_id, generation, params key) -> (expires_at, result), oldest access first
+        self.generations = {}
+
+    async def generation(self, run_id):
+        return self.generations.get(run_id, 0)
+
+    async def get(self, run_id, params):
+        key = (run_id, self.generations.get(run_id, 0), params_key(params))
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    async def put(self, run_id, params, result, generation):
+        if generation != self.generations.get(run_id, 0):
+            return False
+        key = (run_id, generation, params_key(params))
+        self.entries[key] = (time.time() + self.ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return True
+
+    async def invalidate(self, run_id):
+        self.generations[run_id] = self.generations.get(run_id, 0) + 1
+        for key in [k for k in self.entries if k[0] == run_id]:
+            del self.entries[key]
+
+    async def stats(self):
+        return {"entries": len(self.entries), "max_entries": self.max_entries, "ttl": self.ttl}
+
+
+# KEYS: generation, run's entry set, LRU index. ARGV: prefix, run id, params key, now
+_GET = """
+local gen = redis.call('GET', KEYS[1]) or '0'
+local key = ARGV[1] .. 'entry:' .. ARGV[2] .. ':' .. gen .. ':' .. ARGV[3]
+local value = redis.call('GET', key)
+if value then
+    redis.call('ZADD', KEYS[3], ARGV[4], key)
+end
+return value
+"""
+
+# KEYS: generation, run's entry set, LRU index. ARGV: prefix, run id, params key, now, generation, value, ttl, max entries
+_PUT = """
+local gen = redis.call('GET', KEYS[1]) or '0'
+if gen ~= ARGV[5] then
+    return 0
+end
+local key = ARGV[1] .. 'entry:' .. ARGV[2] .. ':' .. gen .. ':' .. ARGV[3]
+redis.call('SET', key, ARGV[6], 'EX', ARGV[7])
+redis.call('SADD', KEYS[2], key)
+redis.call('EXPIRE', KEYS[2], ARGV[7])
+redis.call('ZADD', KEYS[3], ARGV[4], key)
+-- Entries not read within the TTL have expired; the least recently used go beyond max entries
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', tonumber(ARGV[4]) - tonumber(ARGV[7]))
+local excess = redis.call('ZCARD', KEYS[3]) - tonumber(ARGV[8])
+if excess > 0 then
+    local popped = redis.call('ZPOPMIN', KEYS[3], excess)
+    for i = 1, #popped, 2 do
+        redis.call('DEL', popped[i])
+    end
+end
+return 1
+"""
+
+# KEYS: generation, run's entry set, LRU index
+_INVALIDATE = """
+local keys = redis.call('SMEMBERS', KEYS[2])
+for _, key in ipairs(keys) do
+    redis.call('DEL', key)
+    redis.call('ZREM', KEYS[3], key)
+end
+redis.call('DEL', KEYS[2])
+return redis.call('INCR', KEYS[1])
+"""
+
+
+class RedisScenarioCache(ScenarioCache):
+    """
+    Redis-backed cache shared by the API and the workers that precompute it: one
+    zlib-compressed JSON value per entry (expiring after the TTL), a sorted set of entries
+    by last access for LRU eviction, and per run a generation counter and its entry set.
+    """
+    def __init__(self, url: str, prefix: str = PREFIX, ttl: int = None, max_entries: int = None):
+        import redis.asyncio as redis
+        super().__init__(ttl, max_entries)
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+        self.scripts = {
+            name: self.redis.register_script(source)
+            for name, source in (("get", _GET), ("put", _PUT), ("invalidate", _INVALIDATE))
+        }
+
+    def _keys(self, run_id: int) -> list:
+        return [f"{self.prefix}gen:{run_id}", f"{self.prefix}run:{run_id}", f"{self.prefix}lru"]
+
+    async def generation(self, run_id):
+        return int(await self.redis.get(f"{self.prefix}gen:{run_id}") or 0)
+
+    async def get(self, run_id, params):
+        value = await self.scripts["get"](keys=self._keys(run_id), args=[self.prefix, run_id, params_key(params), time.time()])
+        return json.loads(zlib.decompress(value)) if value else None
+
+    async def put(self, run_id, params, result, generation):
+        value = zlib.compress(json.dumps(result, default=str).encode())
+        stored = await self.scripts["put"](keys=self._keys(run_id), args=[
+            self.prefix, run_id, params_key(params), time.time(), generation, value, self.ttl, self.max_entries])
+        return bool(stored)
+
+    async def invalidate(self, run_id):
+        await self.scripts["invalidate"](keys=self._keys(run_id))
+
+    async def stats(self):
+        return {"entries": await self.redis.zcard(f"{self.prefix}lru"), "max_entries": self.max_entries, "ttl": self.ttl}
+
+
+@lru_cache()
+def get_scenario_cache() -> ScenarioCache:
+    if settings.STRESS_CACHE == "memory":
+        return MemoryScenarioCache()
+    return RedisScenarioCache(settings.REDIS_URL)
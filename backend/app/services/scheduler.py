@@ -1,20 +1,256 @@
+import time
 import logging
+from datetime import datetime, timezone
+from functools import lru_cache
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from app.core.config import get_settings
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
 
+RETRAIN_TENANT = "retrain"  # retrain runs share one tenant: its concurrency limit is the worker budget
+ACTIVE_RUNS = ("pending", "queued", "running")
+# Order of service when a tick cannot submit every retrain
+REASON_URGENCY = {"manual": 3, "drift": 2, "new_rows": 1, "stale": 0}
+# Reasons the model itself is suspect: the retrain refits it from scratch instead of reusing
+# the registered model of the same data (new rows alone roll the model forward)
+REFIT_REASONS = ("manual", "drift", "stale")
+
+
 def start_scheduler():
     if not scheduler.running:
         scheduler.start()
         logger.info("Job Scheduler Started")
 
-        # Example: Schedule daily retraining
-        # scheduler.add_job(retrain_models, CronTrigger(hour=0, minute=0))
+        if settings.RETRAIN_ENABLED:
+            scheduler.add_job(retrain_models, IntervalTrigger(seconds=settings.RETRAIN_INTERVAL), id="retrain",
+                              coalesce=True, max_instances=1, replace_existing=True)
+
+
+def _timestamp(value: datetime) -> float:
+    # Rows store naive UTC datetimes
+    return value.replace(tzinfo=timezone.utc).timestamp() if value.tzinfo is None else value.timestamp()
+
+
+def _retrain_spec(run) -> tuple:
+    """
+    (kind, spec, parameters) of a run repeating `run`'s configuration on the current data.
+    """
+    parameters = run.parameters or {}
+    series_column = parameters.get("series_column")
+    if series_column:
+        grouping = {k: parameters[k] for k in ("series_column", "value_column") if parameters.get(k)}
+        spec = {"dataset_id": run.dataset_id, "value_column": None, **grouping, "horizon": run.horizon}
+        return "multi_series", spec, grouping
+    return "forecast", {"dataset_id": run.dataset_id, "overrides": None, "horizon": run.horizon, "quantiles": None}, {}
+
+
+def _is_scenario(run) -> bool:
+    # Runs with overrides are what-if scenarios, not models of the data
+    return bool({k for k in (run.parameters or {}) if k not in ("retrain", "series_column", "value_column")})
+
+
+class RetrainScheduler:
+    """
+    Decides which datasets to retrain, on every tick: those whose latest model (the most
+    recent completed run) was trained on fewer ingested rows than the dataset now has,
+    whose drift monitor reports a drifted window not yet acted on (PSI past `drift_psi`),
+    or whose model is older than `max_age`. All triggers of a dataset, including requests
+    made since the last tick, coalesce into one run; a dataset with a run already queued
+    or running is left to it. Retrains go to the run queue under one tenant limited to
+    `workers` concurrent runs, at most `max_per_tick` per tick (most urgent first), and
+    refit the model for any of REFIT_REASONS. Each run records its reasons in its
+    parameters and in the audit log. `clock` returns epoch seconds.
+    """
+    def __init__(self, clock=time.time, session_factory=None, broker=None, max_age: float = None, min_new_rows: int = None,
+                 drift_psi: float = None, workers: int = None, max_per_tick: int = None):
+        self.clock = clock
+        self.session_factory = session_factory
+        self.broker = broker
+        self.max_age = max_age if max_age is not None else settings.RETRAIN_MAX_AGE
+        self.min_new_rows = min_new_rows if min_new_rows is not None else settings.RETRAIN_MIN_NEW_ROWS
+        self.drift_psi = drift_psi if drift_psi is not None else settings.RETRAIN_DRIFT_PSI
+        self.workers = workers or settings.RETRAIN_WORKERS
+        self.max_per_tick = max_per_tick or settings.RETRAIN_MAX_PER_TICK
+        self.pending = {}  # dataset_id -> {reason: detail} requested since the last tick
+
+    def request(self, dataset_id: int, reason: str = "manual", detail: dict = None):
+        """
+        Asks for a retrain at the next tick; repeated requests for a dataset coalesce.
+        """
+        self.pending.setdefault(dataset_id, {})[reason] = {**(detail or {}), "requested_at": self.clock()}
+
+    def _session(self):
+        if self.session_factory is None:
+            from app.db.session import SessionLocal
+            return SessionLocal()
+        return self.session_factory()
+
+    def scan(self) -> list:
+        """
+        Per dataset with a trained model: row counts, the model's age and configuration, the
+        last drift window acted on and any active run. Blocking.
+        """
+        from app.db.models import Dataset, ForecastRun
+        db = self._session()
+        try:
+            datasets = {d.id: d for d in db.query(Dataset).all()}
+            states = {}
+            for run in db.query(ForecastRun).filter(ForecastRun.dataset_id.isnot(None)).order_by(ForecastRun.created_at.desc()):
+                dataset = datasets.get(run.dataset_id)
+                if dataset is None or _is_scenario(run):
+                    continue
+                metadata = dataset.metadata_info or {}
+                state = states.setdefault(run.dataset_id, {
+                    "dataset_id": run.dataset_id,
+                    "rows": int(metadata.get("rows") or 0),
+                    "drift_key": metadata.get("drift_key"),
+                    "active_run": None,
+                    "drift_window": None,
+                    "basis": None,
+                })
+                retrain = (run.parameters or {}).get("retrain") or {}
+                if state["drift_window"] is None and retrain.get("drift_window"):
+                    state["drift_window"] = retrain["drift_window"]
+                if run.status in ACTIVE_RUNS and state["active_run"] is None:
+                    state["active_run"] = run.id
+                if run.status == "completed" and state["basis"] is None:
+                    # Ingested rows (dataset metadata) the run read, or saw when it was triggered
+                    trained_rows = (run.results or {}).get("dataset_rows") or retrain.get("rows")
+                    kind, spec, parameters = _retrain_spec(run)
+                    state["basis"] = {
+                        "run_id": run.id,
+                        "trained_at": _timestamp(run.created_at),
+                        "trained_rows": int(trained_rows) if trained_rows else state["rows"],
+                        "kind": kind,
+                        "spec": spec,
+                        "parameters": parameters,
+                        "model_type": run.model_type,
+                    }
+            return list(states.values())
+        finally:
+            db.close()
+
+    def triggers(self, state: dict, report: dict, now: float) -> dict:
+        """
+        Reasons to retrain a dataset's model ({reason: detail}), from its scanned state and
+        drift report.
+        """
+        reasons = {}
+        basis = state["basis"]
+        new_rows = state["rows"] - basis["trained_rows"]
+        if new_rows >= self.min_new_rows:
+            reasons["new_rows"] = {"new_rows": new_rows, "trained_rows": basis["trained_rows"]}
+        drifted = [c for c in (report or {}).get("columns", []) if c["drift_detected"] and c["psi"] >= self.drift_psi]
+        if drifted and report["window"] != state["drift_window"]:
+            reasons["drift"] = {"window": report["window"], "columns": [c["column"] for c in drifted],
+                                "max_psi": round(max(c["psi"] for c in drifted), 4)}
+        age = now - basis["trained_at"]
+        if age >= self.max_age:
+            reasons["stale"] = {"age_hours": round(age / 3600, 1), "trained_run": basis["run_id"]}
+        return reasons
+
+    async def _drift_report(self, state: dict) -> dict:
+        from app.services.drift import load_monitor
+        if not state["drift_key"]:
+            return None
+        try:
+            monitor = await load_monitor(state["drift_key"])
+            return monitor.report() if monitor is not None else None
+        except Exception as e:
+            logger.error(f"Drift report of dataset {state['dataset_id']} failed: {e}")
+            return None
+
+    async def tick(self) -> list:
+        """
+        One scheduling pass. Returns the decisions: queued (with the run), coalesced into an
+        active run, deferred to the next tick by the per-tick limit, or skipped.
+        """
+        from app.services import jobs
+        from app.services.compute import get_compute
+
+        now = self.clock()
+        pending, self.pending = self.pending, {}
+        states = await get_compute().run_local(self.scan)
+        decisions, candidates = [], []
+        for state in states:
+            requested = pending.pop(state["dataset_id"], {})
+            if state["basis"] is None:
+                decisions.append({"dataset_id": state["dataset_id"], "action": "skipped", "reasons": requested,
+                                  "detail": "No completed run to retrain"})
+                continue
+            report = await self._drift_report(state)
+            reasons = {**self.triggers(state, report, now), **requested}
+            if not reasons:
+                continue
+            if state["active_run"] is not None:
+                decisions.append({"dataset_id": state["dataset_id"], "action": "coalesced", "reasons": reasons,
+                                  "run_id": state["active_run"]})
+                continue
+            candidates.append((state, report, reasons))
+        decisions += [{"dataset_id": dataset_id, "action": "skipped", "reasons": reasons, "detail": "No completed run to retrain"}
+                      for dataset_id, reasons in pending.items()]
+
+        candidates.sort(key=lambda c: (-max(REASON_URGENCY.get(r, 0) for r in c[2]), c[0]["basis"]["trained_at"]))
+        broker = self.broker or jobs.get_broker()
+        db = self._session()
+        try:
+            for i, (state, report, reasons) in enumerate(candidates):
+                if i >= self.max_per_tick:
+                    # Triggers are re-derived at the next tick; requests are kept for it
+                    if "manual" in reasons:
+                        self.pending.setdefault(state["dataset_id"], {})["manual"] = reasons["manual"]
+                    decisions.append({"dataset_id": state["dataset_id"], "action": "deferred", "reasons": reasons})
+                    continue
+                basis = state["basis"]
+                record = {
+                    "reasons": sorted(reasons, key=lambda r: -REASON_URGENCY.get(r, 0)),
+                    "details": reasons,
+                    "triggered_at": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+                    "rows": state["rows"],
+                    "drift_window": report["window"] if report and report.get("window") else state["drift_window"],
+                    "previous_run": basis["run_id"],
+                }
+                spec = basis["spec"]
+                if any(r in REFIT_REASONS for r in reasons):
+                    spec = {**spec, "refit": record["triggered_at"]}
+                    record["refit"] = True
+                try:
+                    submitted = await jobs.submit_run(
+                        db, basis["kind"], spec, RETRAIN_TENANT, 0, {**basis["parameters"], "retrain": record},
+                        model_type=basis["model_type"], tenant_limit=self.workers, broker=broker)
+                except Exception as e:
+                    logger.error(f"Retrain of dataset {state['dataset_id']} could not be queued: {e}")
+                    decisions.append({"dataset_id": state["dataset_id"], "action": "failed", "reasons": reasons, "detail": str(e)})
+                    continue
+                action = "queued" if submitted["status"] == "queued" else "coalesced"
+                decisions.append({"dataset_id": state["dataset_id"], "action": action, "reasons": reasons, "run_id": submitted["run_id"]})
+            self._record(db, decisions)
+        finally:
+            db.close()
+        for decision in decisions:
+            logger.info(f"Retrain {decision['action']} for dataset {decision['dataset_id']}: {', '.join(decision['reasons']) or '-'}")
+        return decisions
+
+    def _record(self, db, decisions: list):
+        from app.db.models import AuditLog
+        for decision in decisions:
+            db.add(AuditLog(action=f"retrain.{decision['action']}", details=decision,
+                            timestamp=datetime.fromtimestamp(self.clock(), timezone.utc).replace(tzinfo=None)))
+        db.commit()
+
+
+@lru_cache()
+def get_retrain_scheduler() -> RetrainScheduler:
+    return RetrainScheduler()
+
 
 async def retrain_models():
     logger.info("Executing scheduled retraining job...")
-    # Logic to trigger retraining would go here
-    pass
+    try:
+        await get_retrain_scheduler().tick()
+    except Exception as e:
+        logger.error(f"Scheduled retraining failed: {e}")
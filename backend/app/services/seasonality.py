@@ -0,0 +1,174 @@
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ENGINE_VERSION = 1  # bump when detection or decomposition changes, so cached components are not reused
+MAX_PERIODS = 2
+MAX_DETECT_ROWS = 20_000  # detection looks at the most recent rows only
+SPECTRAL_CANDIDATES = 5   # strongest periodogram peaks checked against the ACF
+ACF_THRESHOLD = 0.2       # minimum autocorrelation at the period lag
+ACF_GAIN = 0.05           # a multiple of an accepted period must correlate this much better
+STL_MAX_ROWS = 10_000     # longer (or multi-seasonal) histories use the moving-average decomposition
+REFIT_CYCLES = 10         # trailing cycles of the longest period re-fitted on append
+CALENDAR_CYCLES = (60, 3600, 86400, 7 * 86400, 365.25 * 86400)  # seconds in a minute .. year
+
+
+def sampling_step(ds: pd.Series) -> float:
+    """
+    Median spacing of a date column in seconds (None when it cannot be determined).
+    """
+    step = pd.to_datetime(ds).diff().median()
+    return step.total_seconds() if pd.notnull(step) and step > pd.Timedelta(0) else None
+
+
+def _autocorrelation(x: np.ndarray) -> np.ndarray:
+    n = len(x)
+    spectrum = np.fft.rfft(x, 2 * n)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    return acf / acf[0] if acf[0] > 0 else np.zeros(n)
+
+
+def detect_periods(y: np.ndarray, step_seconds: float = None, max_periods: int = MAX_PERIODS) -> list:
+    """
+    Dominant seasonal periods (in rows), strongest first. Candidates are the strongest
+    periodogram peaks plus the calendar cycles (hour, day, week, year) implied by the sampling
+    step; each is refined to the nearby autocorrelation maximum and kept if the correlation at
+    that lag is high enough and the series covers at least two cycles. A multiple of an
+    accepted period (e.g. 168 after 24 on hourly data) is kept only if it correlates better.
+    """
+    y = np.asarray(y, dtype=float)[-MAX_DETECT_ROWS:]
+    y = y[np.isfinite(y)]
+    n = len(y)
+    if n < 8:
+        return []
+    t = np.arange(n)
+    x = y - np.polyval(np.polyfit(t, y, 1), t)
+    if not np.any(x):
+        return []
+    acf = _autocorrelation(x)
+
+    power = np.abs(np.fft.rfft(x)) ** 2
+    power[0] = 0
+    peaks = np.argsort(power)[::-1][:SPECTRAL_CANDIDATES]
+    candidates = {int(round(n / k)) for k in peaks if k > 0}
+    if step_seconds:
+        candidates |= {int(round(cycle / step_seconds)) for cycle in CALENDAR_CYCLES}
+
+    scored = {}
+    for p in candidates:
+        if p < 2 or 2 * p > n:
+            continue
+        lo, hi = max(2, int(p * 0.95)), min(n // 2, int(np.ceil(p * 1.05)))
+        lag = lo + int(np.argmax(acf[lo:hi + 1]))
+        # Must be a genuine ACF peak: smooth series correlate highly at every short lag
+        if acf[lag] >= ACF_THRESHOLD and acf[lag - 1] < acf[lag] >= acf[lag + 1]:
+            scored[lag] = max(scored.get(lag, -1.0), float(acf[lag]))
+
+    accepted = []
+    for p in sorted(scored):
+        base = [q for q in accepted if abs(p / q - round(p / q)) < 0.05]
+        if any(scored[p] < scored[q] + ACF_GAIN for q in base):
+            continue
+        accepted.append(p)
+    return sorted(accepted, key=lambda p: -scored[p])[:max_periods]
+
+
+def _moving_average(y: np.ndarray, window: int) -> np.ndarray:
+    """
+    Centered moving average (2 x window for even windows, as in classical decomposition);
+    the edges are extended with the nearest full-window value.
+    """
+    n = len(y)
+    window = max(1, min(window, n))
+    weights = np.ones(window)
+    if window % 2 == 0:
+        weights = np.convolve(weights, [0.5, 0.5])
+    weights /= weights.sum()
+    if len(weights) > n:
+        return np.full(n, y.mean())
+    valid = np.convolve(y, weights, mode="valid")
+    pad = len(weights) // 2
+    return np.concatenate([np.full(pad, valid[0]), valid, np.full(n - len(valid) - pad, valid[-1])])
+
+
+def _fast_decompose(y: np.ndarray, periods: list, offset: int = 0) -> dict:
+    """
+    Moving-average multi-seasonal decomposition, O(n) per period: each period's seasonal
+    profile is the mean detrended value per phase (anchored at row `offset` of the series),
+    removed before the next period is estimated.
+    """
+    remainder = y.copy()
+    seasonals = {}
+    phase_of = np.arange(offset, offset + len(y))
+    for p in sorted(periods):
+        detrended = remainder - _moving_average(remainder, p)
+        phase = phase_of % p
+        profile = np.bincount(phase, weights=detrended, minlength=p) / np.maximum(np.bincount(phase, minlength=p), 1)
+        seasonals[p] = (profile - profile.mean())[phase]
+        remainder = remainder - seasonals[p]
+    trend = _moving_average(remainder, max(periods) if periods else max(3, len(y) // 20))
+    return {"trend": trend, "seasonals": seasonals}
+
+
+def _stl_decompose(y: np.ndarray, period: int) -> dict:
+    from statsmodels.tsa.seasonal import STL
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        res = STL(y, period=period).fit()
+    return {"trend": np.asarray(res.trend), "seasonals": {period: np.asarray(res.seasonal)}}
+
+
+def _decompose(y: np.ndarray, periods: list, offset: int = 0, total: int = None) -> dict:
+    # STL for one period on moderate histories (MSTL costs seconds on a few thousand hourly
+    # rows). The method follows the full series length, so re-fitted windows match the original.
+    if len(periods) == 1 and (total or len(y)) <= STL_MAX_ROWS:
+        return _stl_decompose(y, periods[0])
+    return _fast_decompose(y, periods, offset)
+
+
+def _components(y: np.ndarray, periods: list, parts: dict) -> dict:
+    seasonal = sum(parts["seasonals"].values()) if parts["seasonals"] else np.zeros(len(y))
+    return {
+        "periods": periods,
+        "trend": parts["trend"],
+        "seasonal": seasonal,
+        "seasonals": parts["seasonals"],
+        "resid": y - parts["trend"] - seasonal,
+    }
+
+
+def decompose(y: np.ndarray, step_seconds: float = None, previous: dict = None) -> dict:
+    """
+    Trend, seasonal (summed over periods, and per period) and residual arrays for a series,
+    with the detected periods. STL for a single period up to STL_MAX_ROWS rows, otherwise a
+    moving-average decomposition. `previous` holds the components of a prefix of `y`
+    (rows were appended since): its periods are kept, only a trailing window is re-fitted and
+    spliced on.
+    """
+    y = np.asarray(y, dtype=float)
+    n_prev = len(previous["trend"]) if previous is not None else 0
+    if previous is not None and n_prev == len(y):
+        return previous
+
+    periods = previous["periods"] if previous is not None else detect_periods(y, step_seconds)
+    overlap = REFIT_CYCLES * max(periods + [7])
+    if previous is None or n_prev < 2 * overlap:
+        return _components(y, periods, _decompose(y, periods))
+
+    start = n_prev - overlap
+    fresh = _components(y[start:], periods, _decompose(y[start:], periods, offset=start, total=len(y)))
+    keep = n_prev - overlap // 2  # the window's leading edge effects are discarded
+
+    def splice(old, new):
+        return np.concatenate([old[:keep], new[keep - start:]])
+
+    return {
+        "periods": periods,
+        "trend": splice(previous["trend"], fresh["trend"]),
+        "seasonal": splice(previous["seasonal"], fresh["seasonal"]),
+        "seasonals": {p: splice(previous["seasonals"][p], fresh["seasonals"][p]) for p in periods},
+        "resid": splice(previous["resid"], fresh["resid"]),
+    }
@@ -0,0 +1,79 @@
+import json
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+RESPONSE_FORMATS = "^(records|columns)$"
+
+
+def json_safe(values) -> list:
+    """
+    Array as a JSON-ready list with NaN/Inf mapped to None in one vectorized step.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        finite = np.isfinite(values)
+        if finite.all():
+            return values.tolist()
+        out = values.astype(object)
+        out[~finite] = None
+        return out.tolist()
+    if values.dtype.kind == "M":
+        return pd.Series(values).astype(str).tolist()
+    if values.dtype.kind == "O":
+        return pd.Series(values).where(pd.notnull(values), None).tolist()
+    return values.tolist()
+
+
+def frame_columns(df: pd.DataFrame) -> dict:
+    """
+    Column-oriented preview payload: {column: [values]}, dates as strings (as in records).
+    """
+    return {str(col): json_safe(df[col].to_numpy()) for col in df.columns}
+
+
+def window_columns(window: dict) -> dict:
+    """
+    Pyramid window in the column-oriented preview layout ({date, value}).
+    """
+    return {"date": json_safe(np.asarray(window["ts"]).astype("datetime64[ns]")), "value": json_safe(window["values"])}
+
+
+def columns_to_records(columns: dict) -> list:
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(columns[name] for name in names))]
+
+
+def render_preview(preview, fmt: str = "records"):
+    """
+    Preview in the requested layout. Records (one object per row) stay the default;
+    'columns' sends the arrays as stored.
+    """
+    if isinstance(preview, list):  # already records
+        return preview if fmt == "records" else {k: [row.get(k) for row in preview] for k in (preview[0] if preview else {})}
+    return columns_to_records(preview) if fmt == "records" else preview
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return json_safe(obj)
+    if isinstance(obj, (np.floating, np.integer, np.bool_)):
+        return obj.item()
+    return jsonable_encoder(obj)
+
+
+class CompactJSONResponse(JSONResponse):
+    """
+    JSON response written directly by orjson (numpy arrays natively, NaN/Inf as null),
+    bypassing FastAPI's per-value encoding walk. Falls back to the stdlib encoder.
+    """
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, default=_default, allow_nan=False, separators=(",", ":")).encode("utf-8")
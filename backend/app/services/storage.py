@@ -0,0 +1,369 @@
+import os
+import io
+import uuid
+import shutil
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKET = "datasets"
+MIN_PART_SIZE = 8 * 1024 * 1024  # S3 requires >= 5 MiB for all but the last part
+
+
+class ObjectStorage(ABC):
+    """
+    Object storage for one bucket. Backends implement blocking primitives, which are safe to
+    call from worker threads/processes; async code uses the `a*` wrappers, which run the
+    primitive on the storage's own bounded thread pool so the event loop never blocks.
+    """
+    def __init__(self, bucket: str = DEFAULT_BUCKET, max_workers: int = 16):
+        self.bucket = bucket
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"storage-{bucket}")
+
+    # Blocking primitives
+    @abstractmethod
+    def ensure_bucket(self): ...
+
+    @abstractmethod
+    def get(self, key: str) -> bytes: ...
+
+    @abstractmethod
+    def get_range(self, key: str, start: int, end: int) -> bytes:
+        """Bytes [start, end] inclusive, as an HTTP Range request."""
+
+    @abstractmethod
+    def size(self, key: str) -> int: ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def put(self, key: str, data: bytes, content_type: str = "application/octet-stream"): ...
+
+    @abstractmethod
+    def put_file(self, key: str, path: str): ...
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    @abstractmethod
+    def copy(self, source: str, key: str):
+        """Copies an object within the bucket (server-side where the backend can)."""
+
+    @abstractmethod
+    def create_multipart(self, key: str, content_type: str) -> str: ...
+
+    @abstractmethod
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> dict: ...
+
+    @abstractmethod
+    def complete_multipart(self, key: str, upload_id: str, parts: list): ...
+
+    @abstractmethod
+    def abort_multipart(self, key: str, upload_id: str): ...
+
+    # Non-blocking wrappers
+    async def offload(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def aensure_bucket(self):
+        return await self.offload(self.ensure_bucket)
+
+    async def aget(self, key: str) -> bytes:
+        return await self.offload(self.get, key)
+
+    async def aget_range(self, key: str, start: int, end: int) -> bytes:
+        return await self.offload(self.get_range, key, start, end)
+
+    async def aexists(self, key: str) -> bool:
+        return await self.offload(self.exists, key)
+
+    async def aput(self, key: str, data: bytes, content_type: str = "application/octet-stream"):
+        return await self.offload(self.put, key, data, content_type)
+
+    async def aput_file(self, key: str, path: str):
+        return await self.offload(self.put_file, key, path)
+
+    async def adelete(self, key: str):
+        return await self.offload(self.delete, key)
+
+    async def acopy(self, source: str, key: str):
+        return await self.offload(self.copy, source, key)
+
+    def multipart(self, key: str, content_type: str = "text/csv", part_size: int = MIN_PART_SIZE) -> "MultipartWriter":
+        return MultipartWriter(self, key, content_type=content_type, part_size=part_size)
+
+    def open_range_reader(self, key: str) -> "RangeReader":
+        return RangeReader(self, key)
+
+
+class S3Storage(ObjectStorage):
+    """
+    S3/MinIO backend with one long-lived client (botocore pools its HTTP connections
+    and the client is thread-safe).
+    """
+    def __init__(self, bucket: str = DEFAULT_BUCKET, max_connections: int = 16):
+        super().__init__(bucket, max_workers=max_connections)
+        import boto3
+        from botocore.config import Config
+
+        endpoint_url = settings.MINIO_ENDPOINT
+        if not endpoint_url.startswith("http"):
+            endpoint_url = f"http://{endpoint_url}"
+        self.client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=settings.MINIO_ACCESS_KEY,
+            aws_secret_access_key=settings.MINIO_SECRET_KEY,
+            config=Config(max_pool_connections=max_connections, retries={"max_attempts": 3, "mode": "standard"}),
+        )
+
+    def ensure_bucket(self):
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except Exception:
+            self.client.create_bucket(Bucket=self.bucket)
+            logger.info(f"Created bucket {self.bucket}")
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def get_range(self, key, start, end):
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end}")
+        return response["Body"].read()
+
+    def size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def put(self, key, data, content_type="application/octet-stream"):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+
+    def put_file(self, key, path):
+        self.client.upload_file(path, self.bucket, key)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def copy(self, source, key):
+        # Managed copy: multipart server-side copy for large objects
+        self.client.copy({"Bucket": self.bucket, "Key": source}, self.bucket, key)
+
+    def create_multipart(self, key, content_type):
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=content_type)
+        return response["UploadId"]
+
+    def upload_part(self, key, upload_id, part_number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    def complete_multipart(self, key, upload_id, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+
+    def abort_multipart(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+class LocalStorage(ObjectStorage):
+    """
+    Filesystem backend (root/bucket/key), for development and tests without MinIO.
+    Multipart parts are staged in a hidden directory and concatenated on completion.
+    """
+    def __init__(self, root: str, bucket: str = DEFAULT_BUCKET, max_workers: int = 4):
+        super().__init__(bucket, max_workers=max_workers)
+        self.root = os.path.join(root, bucket)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid key: {key}")
+        return path
+
+    def _staging(self, upload_id):
+        return os.path.join(self.root, ".multipart", upload_id)
+
+    def ensure_bucket(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def get(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def get_range(self, key, start, end):
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, data, content_type="application/octet-stream"):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put_file(self, key, path):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+
+    def delete(self, key):
+        if self.exists(key):
+            os.remove(self._path(key))
+
+    def copy(self, source, key):
+        self.put_file(key, self._path(source))
+
+    def create_multipart(self, key, content_type):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._staging(upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        with open(os.path.join(self._staging(upload_id), f"{part_number:05d}"), "wb") as f:
+            f.write(data)
+        return {"ETag": str(part_number), "PartNumber": part_number}
+
+    def complete_multipart(self, key, upload_id, parts):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = self._staging(upload_id)
+        tmp = f"{path}.{upload_id}.tmp"
+        with open(tmp, "wb") as out:
+            for part in sorted(parts, key=lambda p: p["PartNumber"]):
+                with open(os.path.join(staging, f"{part['PartNumber']:05d}"), "rb") as f:
+                    shutil.copyfileobj(f, out)
+        os.replace(tmp, path)
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def abort_multipart(self, key, upload_id):
+        shutil.rmtree(self._staging(upload_id), ignore_errors=True)
+
+
+class MultipartWriter:
+    """
+    Writes an object incrementally. Parts are buffered up to `part_size`, so memory use
+    stays bounded regardless of the object size; small objects become a single PUT.
+    """
+    def __init__(self, storage: ObjectStorage, key: str, content_type: str = "text/csv", part_size: int = MIN_PART_SIZE):
+        self.storage = storage
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = None
+        self.size = 0
+
+    async def write(self, data: bytes):
+        self.buffer.extend(data)
+        self.size += len(data)
+        while len(self.buffer) >= self.part_size:
+            body = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            await self._flush_part(body)
+
+    async def _flush_part(self, body: bytes):
+        if self.upload_id is None:
+            self.upload_id = await self.storage.offload(self.storage.create_multipart, self.key, self.content_type)
+        part = await self.storage.offload(self.storage.upload_part, self.key, self.upload_id, len(self.parts) + 1, body)
+        self.parts.append(part)
+
+    async def close(self, key: str = None) -> str:
+        """
+        Completes the object and returns its key: `key` when given and no multipart upload
+        was started yet (a single PUT), otherwise the key the writer was opened with.
+        """
+        if self.upload_id is None:
+            self.key = key or self.key
+            await self.storage.aput(self.key, bytes(self.buffer), self.content_type)
+        else:
+            if self.buffer:
+                await self._flush_part(bytes(self.buffer))
+            await self.storage.offload(self.storage.complete_multipart, self.key, self.upload_id, self.parts)
+        self.buffer = bytearray()
+        return self.key
+
+    async def abort(self):
+        if self.upload_id is not None:
+            try:
+                await self.storage.offload(self.storage.abort_multipart, self.key, self.upload_id)
+            except Exception as e:
+                logger.error(f"Failed to abort multipart upload {self.upload_id}: {e}")
+        self.buffer = bytearray()
+
+
+class RangeReader(io.RawIOBase):
+    """
+    Seekable, read-only file object over a stored object using range reads, so columnar
+    readers fetch only the footer and the column chunks they need.
+    """
+    def __init__(self, storage: ObjectStorage, key: str):
+        self.storage = storage
+        self.key = key
+        self.length = storage.size(key)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.length + offset
+        return self.position
+
+    def read(self, size=-1):
+        if self.position >= self.length:
+            return b""
+        end = self.length - 1 if size is None or size < 0 else min(self.position + size, self.length) - 1
+        data = self.storage.get_range(self.key, self.position, end)
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@lru_cache()
+def get_storage(bucket: str = DEFAULT_BUCKET) -> ObjectStorage:
+    """
+    Process-wide storage for a bucket (one pooled client per process).
+    """
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage(settings.STORAGE_LOCAL_ROOT, bucket=bucket)
+    return S3Storage(bucket=bucket, max_connections=settings.STORAGE_MAX_CONNECTIONS)
@@ -0,0 +1,194 @@
+import time
+import asyncio
+import numpy as np
+from scipy.signal import lfilter
+from scipy.special import ndtr
+from app.services.intervals import quantile_name
+
+DEFAULT_PATHS = 10_000
+MAX_PATHS = 50_000
+FAN_LEVELS = (0.05, 0.25, 0.5, 0.75, 0.95)
+RISK_LEVELS = (0.95, 0.99)
+NOISE_PERSISTENCE = 0.8   # AR(1) coefficient of the step-to-step forecast error
+BAND_Z = 1.6449           # confidence_lower/upper are a central 90% band
+FALLBACK_SIGMA = 0.05     # error scale (share of the forecast) without a band
+
+# Shock parameters, as (mild, severe) ranges: depth is the relative revenue change at the
+# trough, onset/duration/recovery are shares of the horizon (recovery = decay time constant
+# after the shock ends), volatility multiplies the forecast error while the shock lasts.
+SCENARIOS = {
+    "recession": {
+        "name": "Global Recession",
+        "description": "Demand collapses by 10-35% for months, then recovers slowly.",
+        "color": "#ef4444",  # Red
+        "depth": (-0.10, -0.35), "onset": (0.0, 0.3), "duration": (0.2, 0.6), "recovery": (0.1, 0.6), "volatility": (1.5, 3.0),
+    },
+    "inflation": {
+        "name": "High Inflation",
+        "description": "Purchasing power erodes: a persistent 4-12% drop with little recovery.",
+        "color": "#f97316",  # Orange
+        "depth": (-0.04, -0.12), "onset": (0.0, 0.15), "duration": (0.6, 1.0), "recovery": (0.5, 2.0), "volatility": (1.1, 1.6),
+    },
+    "blackout": {
+        "name": "Operational Blackout",
+        "description": "A sudden outage halves revenue for days to weeks, with a fast rebound.",
+        "color": "#a855f7",  # Purple
+        "depth": (-0.30, -0.70), "onset": (0.0, 0.8), "duration": (0.02, 0.1), "recovery": (0.01, 0.05), "volatility": (2.0, 4.0),
+    },
+    "supply_chain": {
+        "name": "Supply Chain Opt",
+        "description": "Optimized logistics lift revenue by 2-8% once rolled out.",
+        "color": "#10b981",  # Emerald
+        "depth": (0.02, 0.08), "onset": (0.0, 0.3), "duration": (0.7, 1.0), "recovery": (1.0, 3.0), "volatility": (0.7, 1.0),
+    },
+}
+
+# Correlation of shock severity across (depth, duration, recovery, volatility): deeper shocks
+# tend to last longer, recover more slowly and come with more volatile demand.
+SHOCK_CORRELATION = np.array([
+    [1.0, 0.6, 0.5, 0.7],
+    [0.6, 1.0, 0.4, 0.4],
+    [0.5, 0.4, 1.0, 0.3],
+    [0.7, 0.4, 0.3, 1.0],
+])
+
+
+def shock_parameters(spec: dict, paths: int, steps: int, rng: np.random.Generator) -> dict:
+    """
+    Correlated draws (Gaussian copula) of each path's shock: depth, duration, recovery and
+    volatility multiplier, plus an independent onset. Durations are in steps, shape (paths, 1).
+    """
+    z = rng.standard_normal((paths, 4)) @ np.linalg.cholesky(SHOCK_CORRELATION).T
+    u = ndtr(z)
+
+    def draw(name, column):
+        mild, severe = spec[name]
+        return (mild + (severe - mild) * u[:, column])[:, None]
+
+    onset_lo, onset_hi = spec["onset"]
+    return {
+        "depth": draw("depth", 0),
+        "duration": np.maximum(draw("duration", 1) * steps, 1.0),
+        "recovery": np.maximum(draw("recovery", 2) * steps, 1.0),
+        "volatility": draw("volatility", 3),
+        "onset": rng.uniform(onset_lo, onset_hi, (paths, 1)) * steps,
+    }
+
+
+def shock_paths(forecast: np.ndarray, sigma: np.ndarray, spec: dict, paths: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    (paths, steps) float32 revenue paths under a scenario: the forecast scaled by each path's
+    shock profile (ramp to the trough over the first quarter of the shock, hold, then
+    exponential recovery), plus AR(1) forecast error whose scale is raised while the shock lasts.
+    """
+    steps = len(forecast)
+    shock = {k: v.astype(np.float32) for k, v in shock_parameters(spec, paths, steps, rng).items()}
+    t = np.arange(steps, dtype=np.float32)[None, :]
+    since = t - shock["onset"]
+    in_shock = (since >= 0) & (since < shock["duration"])
+
+    noise = lfilter([np.sqrt(1 - NOISE_PERSISTENCE ** 2)], [1.0, -NOISE_PERSISTENCE],
+                    rng.standard_normal((paths, steps), dtype=np.float32), axis=1).astype(np.float32)
+    noise *= np.where(in_shock, shock["volatility"], np.float32(1.0))
+    noise *= sigma.astype(np.float32)[None, :]
+
+    after = np.maximum(since - shock["duration"], 0.0)
+    after /= -shock["recovery"]
+    impact = np.exp(after, out=after)
+    since /= np.maximum(0.25 * shock["duration"], 1.0)
+    impact *= np.clip(since, 0.0, 1.0, out=since)
+    impact *= shock["depth"]
+    impact += 1.0
+    impact *= forecast.astype(np.float32)[None, :]
+    impact += noise
+    return impact
+
+
+def tail_risk(revenue: np.ndarray, baseline: float) -> dict:
+    """
+    Distribution of total revenue over the horizon against the baseline forecast: VaR is the
+    loss exceeded with probability 1 - level, CVaR the mean loss beyond it.
+    """
+    loss = baseline - revenue
+    risk = {
+        "baseline_revenue": float(baseline),
+        "expected_revenue": float(revenue.mean()),
+        "expected_impact_pct": float((revenue.mean() - baseline) / abs(baseline) * 100) if baseline else 0.0,
+        "probability_of_loss": float((loss > 0).mean()),
+    }
+    ordered = np.sort(loss)
+    for level in RISK_LEVELS:
+        cut = min(int(np.floor(level * len(ordered))), len(ordered) - 1)
+        suffix = f"{level * 100:g}"
+        risk[f"var_{suffix}"] = float(ordered[cut])
+        risk[f"cvar_{suffix}"] = float(ordered[cut:].mean())
+    return risk
+
+
+def _severity(impact_pct: float) -> str:
+    if impact_pct > 0:
+        return "Positive"
+    if impact_pct <= -15:
+        return "Critical"
+    if impact_pct <= -7:
+        return "High"
+    return "Medium"
+
+
+def forecast_sigma(forecast: np.ndarray, lower=None, upper=None) -> np.ndarray:
+    """
+    Per-step forecast error scale from the 90% band (a share of the forecast without one).
+    """
+    if lower is None or upper is None:
+        return np.abs(forecast) * FALLBACK_SIGMA
+    return np.maximum((np.asarray(upper, dtype=float) - np.asarray(lower, dtype=float)) / (2 * BAND_Z), 0.0)
+
+
+def simulate_scenario(forecast, sigma, scenario_id: str, paths: int = DEFAULT_PATHS, seed=None) -> dict:
+    """
+    One scenario's Monte Carlo: `paths` shock paths as one batch of array operations, reduced
+    to the percentile fan (median path as `data`) and tail risk of total revenue. Blocking;
+    runs in a compute worker.
+    """
+    started = time.perf_counter()
+    forecast = np.asarray(forecast, dtype=float)
+    spec = SCENARIOS[scenario_id]
+    simulated = shock_paths(forecast, np.asarray(sigma, dtype=float), spec, paths, np.random.default_rng(seed))
+    fan = np.round(np.quantile(simulated, FAN_LEVELS, axis=0).astype(float), 4)
+    risk = tail_risk(simulated.sum(axis=1).astype(float), float(forecast.sum()))
+    impact = risk["expected_impact_pct"]
+    return {
+        "id": scenario_id,
+        "name": spec["name"],
+        "impact": f"{impact:+.1f}% Revenue",
+        "severity": _severity(impact),
+        "description": spec["description"],
+        "data": fan[FAN_LEVELS.index(0.5)].tolist(),
+        "fan": {quantile_name(level): fan[i].tolist() for i, level in enumerate(FAN_LEVELS)},
+        "risk": risk,
+        "color": spec["color"],
+        "seconds": time.perf_counter() - started,
+    }
+
+
+async def simulate(forecast, lower=None, upper=None, paths: int = DEFAULT_PATHS, scenarios: list = None, seed: int = None) -> dict:
+    """
+    Monte Carlo War Games over a forecast and its band: the scenarios run in parallel on the
+    compute tier, each with an independent random stream derived from `seed`.
+    """
+    from app.services.compute import get_compute
+
+    started = time.perf_counter()
+    forecast = np.asarray(forecast, dtype=float)
+    sigma = forecast_sigma(forecast, lower, upper)
+    scenarios = scenarios or list(SCENARIOS)
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)}")
+    streams = np.random.SeedSequence(seed).spawn(len(scenarios))
+    compute = get_compute()
+    results = await asyncio.gather(*(
+        compute.run(simulate_scenario, forecast, sigma, scenario_id, paths, stream)
+        for scenario_id, stream in zip(scenarios, streams)
+    ))
+    return {"paths": paths, "steps": len(forecast), "seed": seed, "seconds": time.perf_counter() - started, "scenarios": list(results)}
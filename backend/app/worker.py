@@ -0,0 +1,37 @@
+import signal
+import asyncio
+import logging
+from app.core.config import get_settings
+
+# Setup Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+async def main():
+    """
+    Worker process: runs queued forecast jobs until SIGTERM/SIGINT (`python -m app.worker`).
+    """
+    from app.init_db import init_db
+    from app.services.storage import get_storage
+    from app.services.compute import get_compute
+    from app.services.jobs import create_worker
+
+    init_db()
+    await get_storage("datasets").aensure_bucket()
+
+    worker = create_worker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: asyncio.ensure_future(worker.stop()))
+    try:
+        await worker.run()
+    finally:
+        get_compute().shutdown()
+        logger.info("Job worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
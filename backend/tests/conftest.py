@@ -0,0 +1,53 @@
+import os
+import tempfile
+import pytest
+
+# Hermetic settings, before anything imports app.core.config: SQLite and local storage
+# under a temporary directory, the in-process run queue and War Games cache.
+_root = tempfile.mkdtemp(prefix="insightx-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_root}/insightx.db",
+    "REDIS_URL": "redis://localhost:6379/15",
+    "MINIO_ENDPOINT": "localhost:9000",
+    "MINIO_ACCESS_KEY": "test",
+    "MINIO_SECRET_KEY": "test",
+    "MLFLOW_TRACKING_URI": f"file://{_root}/mlruns",
+    "STORAGE_BACKEND": "local",
+    "STORAGE_LOCAL_ROOT": f"{_root}/storage",
+    "MODEL_REGISTRY_ROOT": f"{_root}/models",
+    "JOB_BROKER": "memory",
+    "STRESS_CACHE": "memory",
+    "RETRAIN_ENABLED": "false",
+    "COMPUTE_WORKERS": "2",
+})
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def compute_slots():
+    # The compute tier's admission semaphore binds to the event loop that first waits on
+    # it; every test runs in a loop of its own
+    from app.services.compute import get_compute
+    get_compute().slots = None
+    yield
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    from app.init_db import init_db
+    init_db()
+    yield
+
+
+@pytest.fixture
+def db():
+    from app.db.session import SessionLocal
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,30 @@
+import pandas as pd
+from app.services.columnar import resolve_roles, to_columnar
+
+
+def test_columns_named_like_roles_are_kept_under_a_suffix():
+    batch = pd.DataFrame({
+        "date": ["2024-01-01", "2024-01-02"],
+        "sales": [10, 12],
+        "value": [3, 4],
+        "y": ["a", "b"],
+        "value_1": [5, 6],
+    })
+    roles = resolve_roles(batch, target="sales")
+    assert (roles["ds"], roles["y"]) == ("date", "sales")
+    assert roles["numeric"] == ["value", "value_1"]
+    assert roles["text"] == ["y"]
+    assert roles["renamed"] == {"value": "value_2", "y": "y_1"}
+
+    frame = to_columnar(batch, roles)
+    assert list(frame.columns) == ["ds", "y", "value_2", "value_1", "y_1"]
+    assert frame["y"].tolist() == [10.0, 12.0]
+    assert frame["value_2"].tolist() == [3.0, 4.0]
+    assert frame["y_1"].tolist() == ["a", "b"]
+
+
+def test_categorical_roles_keep_a_date_column():
+    batch = pd.DataFrame({"region": ["north", "south"], "revenue": [1.5, 2.5], "category": ["x", "y"]})
+    roles = resolve_roles(batch)
+    assert (roles["category"], roles["value"]) == ("region", "revenue")
+    assert list(to_columnar(batch, roles).columns) == ["category", "value", "category_1"]
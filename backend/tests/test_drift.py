@@ -0,0 +1,63 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from app.services import forecasting
+from app.services.drift import DriftMonitor, check_drift, dataset_monitor, load_monitor
+from app.services.ingest import ingest_upload
+from app.services.storage import get_storage
+
+
+class Upload:
+    def __init__(self, body: bytes):
+        self.body = io.BytesIO(body)
+
+    async def read(self, size=-1):
+        return self.body.read(size)
+
+
+def months(shift: float, rows: int = 200_000) -> pd.DataFrame:
+    # Five steady months, then a sixth shifted by `shift` standard deviations
+    rng = np.random.default_rng(3)
+    ds = pd.date_range("2024-01-01", periods=rows, freq="min")
+    ds = ds[0] + (ds - ds[0]) * (6 * 30 * 24 * 60 / rows)
+    y = rng.normal(0, 1, rows)
+    y[ds >= pd.Timestamp("2024-06-01")] += shift
+    return pd.DataFrame({"ds": ds, "y": y})
+
+
+@pytest.mark.parametrize("shift, drifted", [(0.05, False), (1.0, True)])
+def test_checks_share_one_criterion(shift, drifted):
+    frame = months(shift)
+    monitor = DriftMonitor().update(frame)
+    [column] = monitor.report()["columns"]
+    latest = frame["ds"] >= pd.Timestamp("2024-06-01")
+    direct = check_drift(frame["y"][~latest].to_numpy(), frame["y"][latest].to_numpy())
+    # A small shift over many rows is significant for KS, but not drift for either check
+    assert column["p_value"] < 0.05 and direct["p_value"] < 0.05
+    assert column["drift_detected"] == direct["drift_detected"] == drifted
+
+
+@pytest.mark.anyio
+async def test_backfill_and_reliability_read_the_stored_monitor(db):
+    await get_storage("datasets").aensure_bucket()
+    t = np.arange(3_000)
+    frame = pd.DataFrame({
+        "date": pd.date_range("2022-01-01", periods=t.size, freq="6h").strftime("%Y-%m-%d %H:%M"),
+        "sales": (50 + np.sin(t / 40) * 5 + t / 300).round(4),
+    })
+    dataset, _ = await ingest_upload(Upload(frame.to_csv(index=False).encode()), "sensor.csv", db, "text/csv")
+    stored = await load_monitor(dataset.metadata_info["drift_key"])
+
+    # A dataset ingested before monitors existed gets one built from its columnar copy
+    dataset.metadata_info = {**dataset.metadata_info, "drift_key": None}
+    db.commit()
+    backfilled = await dataset_monitor(dataset, db)
+    assert backfilled.rows == stored.rows == len(frame)
+    assert sorted(backfilled.windows) == sorted(stored.windows)
+    assert backfilled.report()["drifted_columns"] == stored.report()["drifted_columns"]
+    assert dataset.metadata_info["drift_key"]
+
+    sketch = await forecasting.history_sketch(dataset.id, "y")
+    assert sketch.count == len(frame)
+    assert abs(sketch.quantile(0.5) - frame["sales"].median()) < 0.5
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.services.ensemble import run_ensemble
+from app.services.model_registry import LINEAGE_SUFFIX, ModelRegistry
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def history():
+    t = np.arange(120)
+    return pd.DataFrame({
+        "ds": pd.date_range("2025-01-01", periods=120, freq="D"),
+        "y": 100 + 0.5 * t + 10 * np.sin(2 * np.pi * t / 7) + np.random.default_rng(0).normal(0, 2, 120),
+    })
+
+
+async def test_refit_registers_a_new_model(history, tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    fitted = await run_ensemble(history, horizon=14, registry=registry)
+    assert not fitted["reused"]
+    assert (await run_ensemble(history, horizon=14, registry=registry))["reused"]
+
+    refitted = await run_ensemble(history, horizon=14, registry=registry, refit="2026-03-02T00:00:00+00:00")
+    assert not refitted["reused"] and not refitted["updated"]
+    assert refitted["fingerprint"] != fitted["fingerprint"]
+    # A retried attempt of the same retrain reuses its own fit
+    again = await run_ensemble(history, horizon=14, registry=registry, refit="2026-03-02T00:00:00+00:00")
+    assert again["reused"] and again["fingerprint"] == refitted["fingerprint"]
+    # The refit replaces its predecessor in the lineage
+    [path] = tmp_path.glob(f"*{LINEAGE_SUFFIX}")
+    lineage = registry.lineage(path.name[:-len(LINEAGE_SUFFIX)])
+    assert [e["fingerprint"] for e in lineage] == [refitted["fingerprint"]]
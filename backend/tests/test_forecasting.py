@@ -0,0 +1,106 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from app.db.models import ForecastRun
+from app.services import forecasting, results_store
+from app.services.ingest import append_upload, ingest_upload
+from app.services.model_registry import get_model_registry
+from app.services.storage import get_storage
+
+pytestmark = pytest.mark.anyio
+
+
+class Events:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, channel, message):
+        self.published.append(json.loads(message))
+
+
+class Upload:
+    def __init__(self, body: bytes):
+        self.body = io.BytesIO(body)
+
+    async def read(self, size=-1):
+        return self.body.read(size)
+
+
+def daily_csv(start: int, days: int) -> bytes:
+    t = np.arange(start, start + days)
+    dates = pd.date_range("2023-03-01", periods=start + days, freq="D")[start:]
+    sales = 200 + 0.8 * t + 15 * np.sin(2 * np.pi * t / 7) + np.random.default_rng(start).normal(0, 3, days)
+    return pd.DataFrame({"date": dates.strftime("%Y-%m-%d"), "sales": sales.round(3)}).to_csv(index=False).encode()
+
+
+@pytest.fixture
+def events(monkeypatch):
+    events = Events()
+    monkeypatch.setattr(forecasting.redis, "from_url", lambda *args, **kwargs: events)
+    return events
+
+
+async def test_failed_store_fails_the_run(db, events, monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise OSError("storage unavailable")
+
+    monkeypatch.setattr(results_store, "store_results", unavailable)
+    run = ForecastRun(status="running", horizon=14)
+    db.add(run)
+    db.commit()
+
+    await forecasting.run_forecast_task(run.id, None, None, 14, None)
+
+    types = [event["type"] for event in events.published]
+    assert types[-1] == "run.failed"
+    assert "run.completed" not in types and "copilot.summary" not in types
+    assert "storage unavailable" in events.published[-1]["payload"]["message"]
+    db.refresh(run)
+    assert run.status == "failed"
+
+
+async def test_stress_test_needs_a_stored_forecast(db):
+    run = ForecastRun(status="running", horizon=14)
+    db.add(run)
+    db.commit()
+
+    with pytest.raises(forecasting.RunNotReadyError):
+        await forecasting.run_stress_test(run.id, paths=100)
+    with pytest.raises(forecasting.RunNotFoundError):
+        await forecasting.run_stress_test(10 ** 6, paths=100)
+
+
+async def test_appended_rows_roll_the_models_forward(db, events, monkeypatch):
+    await get_storage("datasets").aensure_bucket()
+    dataset, _ = await ingest_upload(Upload(daily_csv(0, 160)), "daily.csv", db, "text/csv")
+    registry = get_model_registry()
+    bases, find_base = [], registry.afind_base
+
+    async def recorded(anchor, history):
+        base, rows = await find_base(anchor, history)
+        bases.append(rows)
+        return base, rows
+
+    monkeypatch.setattr(registry, "afind_base", recorded)
+
+    async def forecast():
+        run = ForecastRun(dataset_id=dataset.id, status="running", horizon=14)
+        db.add(run)
+        db.commit()
+        await forecasting.run_forecast_task(run.id, dataset.id, None, 14, None)
+        db.refresh(run)
+        assert run.status == "completed"
+        return run.results
+
+    first = await forecast()
+    assert not first["ensemble"]["updated"]
+    await append_upload(dataset, Upload(daily_csv(160, 20)), db)
+    bases.clear()
+
+    second = await forecast()
+    assert second["dataset_rows"] == 180 and second["ensemble"]["rows"] == 180
+    assert second["ensemble"]["updated"] and not second["ensemble"]["reused"]
+    # The ensemble and the decomposition both found the first run's fits as their base
+    assert bases == [160, 160]
@@ -0,0 +1,107 @@
+import io
+import os
+import hashlib
+import pandas as pd
+import pytest
+from app.core.config import get_settings
+from app.services.columnar import load_columnar
+from app.services.drift import load_monitor
+from app.services.ingest import AppendError, append_upload, ingest_upload
+from app.services.storage import MultipartWriter, ObjectStorage, get_storage
+
+pytestmark = pytest.mark.anyio
+
+
+class Upload:
+    """An UploadFile stand-in that counts the bytes read from it."""
+    def __init__(self, body: bytes):
+        self.body = io.BytesIO(body)
+        self.read_bytes = 0
+
+    async def read(self, size=-1):
+        chunk = self.body.read(size)
+        self.read_bytes += len(chunk)
+        return chunk
+
+    async def seek(self, position):
+        self.body.seek(position)
+
+
+def sales_csv(rows: int, offset: int = 0, start: int = 0) -> bytes:
+    dates = pd.date_range("2024-01-01", periods=start + rows, freq="h")[start:]
+    frame = pd.DataFrame({"date": dates.strftime("%Y-%m-%d %H:%M"), "sales": [float(i + offset) for i in range(rows)]})
+    return frame.to_csv(index=False).encode()
+
+
+def incoming() -> list:
+    path = os.path.join(get_settings().STORAGE_LOCAL_ROOT, "datasets", "incoming")
+    return os.listdir(path) if os.path.isdir(path) else []
+
+
+@pytest.fixture
+async def storage():
+    storage = get_storage("datasets")
+    await storage.aensure_bucket()
+    return storage
+
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    # Multipart uploads from the first 64 KiB, so the copy off the temporary key is exercised
+    def multipart(self, key, content_type="text/csv", part_size=None):
+        return MultipartWriter(self, key, content_type=content_type, part_size=64 * 1024)
+    monkeypatch.setattr(ObjectStorage, "multipart", multipart)
+
+
+@pytest.mark.parametrize("rows", [500, 20_000])
+async def test_upload_is_read_once_and_stored_by_content(storage, db, small_parts, rows):
+    body = sales_csv(rows, offset=rows)
+    upload = Upload(body)
+    dataset, result = await ingest_upload(upload, "sales.csv", db, "text/csv")
+
+    content_hash = hashlib.sha256(body).hexdigest()
+    assert upload.read_bytes == len(body)
+    assert dataset.s3_key == dataset.content_hash == content_hash
+    assert await storage.aget(content_hash) == body
+    assert dataset.metadata_info["rows"] == rows
+    assert incoming() == []
+
+    again = Upload(body)
+    duplicate, cached = await ingest_upload(again, "copy.csv", db, "text/csv")
+    assert again.read_bytes == len(body)
+    assert duplicate.s3_key == content_hash
+    assert duplicate.metadata_info == dataset.metadata_info
+    assert cached == result
+    assert incoming() == []
+
+
+async def test_append_extends_every_copy(storage, db, small_parts):
+    body, more = sales_csv(3_000, offset=7), sales_csv(2_000, offset=7, start=3_000)
+    dataset, _ = await ingest_upload(Upload(body), "sales.csv", db, "text/csv")
+    before = dict(dataset.metadata_info)
+
+    dataset, appended = await append_upload(dataset, Upload(more), db)
+    assert appended == 2_000
+    combined = body + more.split(b"\n", 1)[1]
+    assert dataset.s3_key == dataset.content_hash == hashlib.sha256(combined).hexdigest()
+    assert await storage.aget(dataset.s3_key) == combined
+    meta = dataset.metadata_info
+    assert meta["rows"] == 5_000 and meta["size"] == len(combined)
+    frame = load_columnar(meta["columnar_key"], columns=["ds", "y"])
+    assert len(frame) == 5_000 and frame["y"].iloc[-1] == 2_006.0
+    assert meta["pyramid_key"] and meta["pyramid_key"] != before["pyramid_key"]
+    assert (await load_monitor(meta["drift_key"])).rows == 5_000
+    # The objects of the original upload are left as they were
+    assert await storage.aget(before["columnar_key"]) is not None
+    assert incoming() == []
+
+
+async def test_append_needs_the_dataset_columns(storage, db):
+    dataset, _ = await ingest_upload(Upload(sales_csv(100, offset=11)), "sales.csv", db, "text/csv")
+    with pytest.raises(AppendError, match="do not match"):
+        await append_upload(dataset, Upload(b"date,units\n2024-02-01 00:00,1\n"), db)
+    with pytest.raises(AppendError, match="no rows"):
+        await append_upload(dataset, Upload(b"date,sales\n"), db)
+    db.refresh(dataset)
+    assert dataset.metadata_info["rows"] == 100
+    assert incoming() == []
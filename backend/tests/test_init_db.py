@@ -0,0 +1,26 @@
+import sqlite3
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from app.db.models import Dataset
+from app.init_db import init_db
+
+
+def test_adds_columns_missing_from_existing_tables(tmp_path):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE uploaded_datasets (id INTEGER PRIMARY KEY, filename VARCHAR, s3_key VARCHAR, "
+                 "uploaded_at DATETIME, metadata_info JSON)")
+    conn.execute("INSERT INTO uploaded_datasets (filename) VALUES ('old.csv')")
+    conn.commit()
+    conn.close()
+    engine = create_engine(f"sqlite:///{path}")
+
+    init_db(engine)
+    init_db(engine)  # idempotent
+
+    columns = [c["name"] for c in inspect(engine).get_columns("uploaded_datasets")]
+    assert columns.count("content_hash") == 1
+    assert "ix_uploaded_datasets_content_hash" in {i["name"] for i in inspect(engine).get_indexes("uploaded_datasets")}
+    session = sessionmaker(bind=engine)()
+    assert [(d.filename, d.content_hash) for d in session.query(Dataset).all()] == [("old.csv", None)]
+    session.close()
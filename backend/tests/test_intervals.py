@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from app.services import intervals
+
+
+def biased_residuals(folds: int = 40, width: int = 5, bias: float = 10.0) -> np.ndarray:
+    return bias + np.random.default_rng(0).normal(0, 1, (folds, width))
+
+
+def test_extension_widens_around_the_median():
+    residuals = biased_residuals()
+    quantiles = intervals.residual_quantiles(residuals, [0.05, 0.5, 0.95], 20)
+    low, median, high = quantiles
+    # The bias stays where the backtest put it; only the spread grows, by sqrt(h / width)
+    assert median[-1] == pytest.approx(median[4])
+    assert (high[-1] - median[-1]) == pytest.approx((high[4] - median[4]) * 2)
+    assert (median[-1] - low[-1]) == pytest.approx((median[4] - low[4]) * 2)
+    assert np.all(np.diff(high[4:] - low[4:]) > 0)
+
+
+def test_within_the_backtest_horizon_matches_the_residuals():
+    residuals = biased_residuals()
+    median = intervals.residual_quantiles(residuals, [0.5], 5)[0]
+    assert median == pytest.approx(np.median(residuals, axis=0), abs=0.1)
+
+
+def test_single_residual_has_no_band():
+    single = np.array([[3.0]])
+    assert not intervals.has_spread(single)
+    assert not intervals.has_spread(None)
+    assert intervals.has_spread(np.array([[3.0, 4.0]]))
+    with pytest.raises(ValueError):
+        intervals.residual_quantiles(single, [0.05, 0.95], 10)
+
+
+def test_bands_keep_their_order():
+    bands = intervals.conformal_bands(np.full(12, 100.0), biased_residuals(folds=3, width=4), [0.05, 0.5, 0.95])
+    assert np.all(bands[0.05] < bands[0.5]) and np.all(bands[0.5] < bands[0.95])
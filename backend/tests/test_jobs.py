@@ -0,0 +1,168 @@
+import asyncio
+import pytest
+from app.db.models import ForecastRun
+from app.services import jobs
+from app.services.jobs import MemoryBroker, Worker, new_job, submit_run
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    """Stands in for the time module in jobs: enqueue order, leases and retries follow `now`."""
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobs, "time", clock)
+    monkeypatch.setattr(jobs.random, "uniform", lambda low, high: high)
+    return clock
+
+
+@pytest.fixture
+def broker(clock):
+    return MemoryBroker()
+
+
+async def enqueue(broker, clock, name, **options):
+    clock.now += 1
+    return await broker.enqueue(new_job("test", {"name": name}, **options))
+
+
+async def claim_names(broker, clock):
+    names = []
+    while (job := await broker.claim(clock.now + 60)) is not None:
+        names.append(job["payload"]["name"])
+    return names
+
+
+async def test_priority_then_fifo(broker, clock):
+    for name, priority in (("a", 0), ("b", 5), ("c", 0), ("d", 5), ("e", 9)):
+        await enqueue(broker, clock, name, priority=priority, tenant_limit=10)
+    assert await claim_names(broker, clock) == ["e", "b", "d", "a", "c"]
+
+
+async def test_tenant_limit_at_claim(broker, clock):
+    first = await enqueue(broker, clock, "t1", tenant="t", priority=5, tenant_limit=1)
+    await enqueue(broker, clock, "t2", tenant="t", priority=5, tenant_limit=1)
+    await enqueue(broker, clock, "u1", tenant="u", tenant_limit=1)
+    # t2 waits behind t1 although it outranks u1
+    assert await claim_names(broker, clock) == ["t1", "u1"]
+    assert (await broker.stats())["tenants"] == {"t": 1, "u": 1}
+
+    await broker.release(first["id"], "succeeded")
+    assert await claim_names(broker, clock) == ["t2"]
+
+
+async def test_dedup_of_active_jobs(broker, clock):
+    first = await enqueue(broker, clock, "a", dedup="key")
+    again = await enqueue(broker, clock, "a", dedup="key")
+    assert again["id"] == first["id"]
+    assert (await broker.find_active("key"))["id"] == first["id"]
+    assert (await broker.stats())["queued"] == 1
+
+    job = await broker.claim(clock.now + 60)
+    assert (await enqueue(broker, clock, "a", dedup="key"))["id"] == first["id"]
+    await broker.release(job["id"], "succeeded")
+    assert await broker.find_active("key") is None
+    assert (await enqueue(broker, clock, "a", dedup="key"))["id"] != first["id"]
+
+
+async def test_submit_run_returns_the_active_duplicate(db, clock):
+    broker = MemoryBroker()
+    spec = {"dataset_id": 1, "overrides": None, "horizon": 14, "quantiles": None}
+    first = await submit_run(db, "forecast", spec, broker=broker)
+    second = await submit_run(db, "forecast", spec, broker=broker)
+    assert first["status"] == "queued"
+    assert second == {**first, "status": "duplicate"}
+    assert db.query(ForecastRun).filter(ForecastRun.id == first["run_id"]).first().status == "queued"
+    # Another tenant's identical run is its own job
+    assert (await submit_run(db, "forecast", spec, tenant="other", broker=broker))["status"] == "queued"
+
+
+async def test_cancel_queued(broker, clock):
+    job = await enqueue(broker, clock, "a", dedup="key")
+    assert await broker.cancel(job["id"]) == "cancelled"
+    assert await broker.claim(clock.now + 60) is None
+    assert await broker.find_active("key") is None
+    assert await broker.cancel("missing") is None
+
+
+async def test_cancel_running(broker, clock):
+    started, finals = asyncio.Event(), []
+
+    async def handler(payload):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def on_final(job, status, error):
+        finals.append(status)
+
+    worker = Worker(broker, {"test": handler}, lease=0.3, on_final=on_final)
+    await enqueue(broker, clock, "a")
+    job = await broker.claim(clock.now + 60)
+    execution = asyncio.create_task(worker.execute(job))
+    await started.wait()
+    assert await broker.cancel(job["id"]) == "cancelling"
+    await asyncio.wait_for(execution, 5)
+
+    assert (await broker.get(job["id"]))["status"] == "cancelled"
+    assert finals == ["cancelled"]
+    assert await broker.stats() == {"queued": 0, "retrying": 0, "running": 0, "tenants": {}}
+
+
+async def test_retry_with_backoff(broker, clock, monkeypatch):
+    monkeypatch.setattr(jobs.settings, "JOB_RETRY_BASE", 5.0)
+    calls, finals = [], []
+
+    async def handler(payload):
+        calls.append(clock.now)
+        raise RuntimeError("boom")
+
+    async def on_final(job, status, error):
+        finals.append((status, error))
+
+    worker = Worker(broker, {"test": handler}, on_final=on_final)
+    job = await enqueue(broker, clock, "a", max_attempts=3)
+    for delay in (5.0, 10.0):
+        await worker.execute(await broker.claim(clock.now + 60))
+        assert (await broker.get(job["id"]))["status"] == "retrying"
+        clock.now += delay - 0.1
+        assert await broker.claim(clock.now + 60) is None
+        clock.now += 0.1
+    await worker.execute(await broker.claim(clock.now + 60))
+
+    job = await broker.get(job["id"])
+    assert len(calls) == job["attempts"] == 3
+    assert job["status"] == "failed"
+    assert finals == [("failed", "boom")]
+
+
+async def test_expired_lease_is_reaped(broker, clock):
+    finals = []
+
+    async def on_final(job, status, error):
+        finals.append(status)
+
+    worker = Worker(broker, {}, on_final=on_final)
+    retried = await enqueue(broker, clock, "retried", max_attempts=2)
+    lost = await enqueue(broker, clock, "lost", max_attempts=1)
+    assert await claim_names(broker, clock) == ["retried", "lost"]
+
+    clock.now += 30
+    await worker.reap()
+    assert (await broker.stats())["running"] == 2
+    clock.now += 31
+    await worker.reap()
+
+    assert (await broker.get(retried["id"]))["status"] == "retrying"
+    assert (await broker.get(lost["id"]))["status"] == "failed"
+    assert finals == ["failed"]
+    assert (await broker.stats())["tenants"] == {}
+    clock.now += 60
+    assert await claim_names(broker, clock) == ["retried"]
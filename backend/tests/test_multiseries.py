@@ -0,0 +1,84 @@
+import io
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from app.services.columnar import resolve_roles
+from app.services.ingest import ingest_upload
+from app.services.multiseries import SeriesColumnError, load_series_frame, prepare_panel
+from app.services.storage import get_storage
+
+
+class Upload:
+    def __init__(self, body: bytes):
+        self.body = io.BytesIO(body)
+
+    async def read(self, size=-1):
+        return self.body.read(size)
+
+    async def seek(self, position):
+        self.body.seek(position)
+
+
+def store_by_sku(days: int = 40, skus: int = 3) -> pd.DataFrame:
+    # Numeric SKU ids come before the quantity: the first numeric column is not the target
+    dates = pd.date_range("2024-01-01", periods=days)
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "date": np.tile(dates.strftime("%Y-%m-%d"), skus),
+        "sku": np.repeat(np.arange(1001, 1001 + skus), days),
+        "qty": rng.integers(5, 50, days * skus),
+    })
+
+
+def test_resolve_roles_excludes_the_series_column():
+    frame = store_by_sku()
+    assert resolve_roles(frame)["y"] == "sku"
+    assert resolve_roles(frame, exclude=["sku"])["y"] == "qty"
+    assert resolve_roles(frame, target="qty")["y"] == "qty"
+
+
+def test_raw_dataset_uses_the_other_numeric_column():
+    frame = store_by_sku()
+    get_storage("datasets").put("raw-by-sku.csv", frame.to_csv(index=False).encode())
+    dataset = SimpleNamespace(metadata_info={}, s3_key="raw-by-sku.csv")
+
+    series = load_series_frame(dataset, "sku")
+    assert series["y"].tolist() == frame["qty"].astype(float).tolist()
+    assert prepare_panel(series, "sku")["series"].nunique() == 3
+
+    with pytest.raises(SeriesColumnError):
+        load_series_frame(dataset, "store")
+    with pytest.raises(SeriesColumnError):
+        load_series_frame(dataset, "sku", value_column="units")
+
+
+@pytest.mark.anyio
+async def test_columnar_dataset_uses_the_other_numeric_column(db):
+    frame = store_by_sku()
+    await get_storage("datasets").aensure_bucket()
+    dataset, _ = await ingest_upload(Upload(frame.to_csv(index=False).encode()), "by_sku.csv", db, "text/csv")
+    assert dataset.metadata_info["roles"]["y"] == "sku"
+
+    series = load_series_frame(dataset, "sku")
+    assert series["y"].tolist() == frame["qty"].astype(float).tolist()
+    assert sorted(series["sku"].astype(int).unique()) == [1001, 1002, 1003]
+
+    explicit = load_series_frame(dataset, "sku", value_column="qty")
+    assert explicit["y"].tolist() == series["y"].tolist()
+    with pytest.raises(SeriesColumnError):
+        load_series_frame(dataset, "sku", value_column="sku")
+
+
+@pytest.mark.anyio
+async def test_group_by_a_column_named_like_a_role(db):
+    frame = store_by_sku().rename(columns={"sku": "value"})
+    frame["value"] = "store-" + frame["value"].astype(str)
+    await get_storage("datasets").aensure_bucket()
+    dataset, _ = await ingest_upload(Upload(frame.to_csv(index=False).encode()), "by_store.csv", db, "text/csv")
+    roles = dataset.metadata_info["roles"]
+    assert roles["y"] == "qty" and roles["renamed"] == {"value": "value_1"}
+
+    series = load_series_frame(dataset, "value")
+    assert sorted(series["value"].unique()) == ["store-1001", "store-1002", "store-1003"]
+    assert prepare_panel(series, "value")["series"].nunique() == 3
@@ -0,0 +1,56 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from app.services.analysis import analyze_frame
+from app.services.ingest import ingest_upload
+from app.services.storage import get_storage
+
+
+class Upload:
+    def __init__(self, body: bytes):
+        self.body = io.BytesIO(body)
+
+    async def read(self, size=-1):
+        return self.body.read(size)
+
+    async def seek(self, position):
+        self.body.seek(position)
+
+
+def spiky(rows: int = 50_000) -> pd.DataFrame:
+    # Out-of-band rows everywhere, most of them far less extreme than the largest spikes
+    rng = np.random.default_rng(1)
+    values = rng.normal(100, 5, rows)
+    spikes = rng.choice(rows, 2_000, replace=False)
+    values[spikes] += rng.uniform(30, 3_000, spikes.size)
+    dates = pd.date_range("2020-01-01", periods=rows, freq="h")
+    # Shuffled, so the first anomalies by date are not the first rows of the file
+    order = rng.permutation(rows)
+    return pd.DataFrame({"date": dates[order].strftime("%Y-%m-%d %H:%M"), "sales": values[order].round(3)})
+
+
+def first_anomalies(frame: pd.DataFrame) -> list:
+    # The original analyze_csv: IQR bounds, then the first 5 rows in date order outside them
+    df = frame.assign(date=pd.to_datetime(frame["date"])).sort_values("date")
+    q1, q3 = df["sales"].quantile([0.25, 0.75])
+    lower, upper = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    out = df[(df["sales"] < lower) | (df["sales"] > upper)].head(5)
+    return [(d.strftime("%Y-%m-%d"), float(v)) for d, v in zip(out["date"], out["sales"])]
+
+
+def listed(result: dict) -> list:
+    return [(a["date"], a["value"]) for a in result["analysis"]["anomalies"]]
+
+
+def test_anomalies_are_the_first_rows_out_of_bounds():
+    frame = spiky(20_000)
+    assert listed(analyze_frame(frame.copy())) == first_anomalies(frame)
+
+
+@pytest.mark.anyio
+async def test_ingest_lists_the_first_rows_out_of_bounds(db):
+    frame = spiky()
+    await get_storage("datasets").aensure_bucket()
+    _, result = await ingest_upload(Upload(frame.to_csv(index=False).encode()), "spiky.csv", db, "text/csv")
+    assert listed(result) == first_anomalies(frame)
@@ -0,0 +1,238 @@
+import io
+from datetime import datetime, timezone
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.models import AuditLog, Dataset, ForecastRun
+from app.init_db import init_db
+from app.services.ingest import append_upload, ingest_upload
+from app.services.jobs import MemoryBroker
+from app.services.scheduler import RetrainScheduler
+from app.services.storage import get_storage
+
+pytestmark = pytest.mark.anyio
+
+DAY = 24 * 3600
+NOW = datetime(2026, 3, 2, tzinfo=timezone.utc).timestamp()
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'retrain.db'}")
+    init_db(engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def clock():
+    return Clock(NOW)
+
+
+@pytest.fixture
+def broker():
+    return MemoryBroker()
+
+
+@pytest.fixture
+def scheduler(sessions, clock, broker):
+    return RetrainScheduler(clock=clock, session_factory=sessions, broker=broker, max_age=7 * DAY, min_new_rows=1,
+                            drift_psi=0.2, workers=1, max_per_tick=10)
+
+
+def add_dataset(sessions, rows: int, drift_key: str = None) -> int:
+    db = sessions()
+    dataset = Dataset(filename="sales.csv", metadata_info={"rows": rows, "drift_key": drift_key})
+    db.add(dataset)
+    db.commit()
+    dataset_id = dataset.id
+    db.close()
+    return dataset_id
+
+
+def add_run(sessions, dataset_id: int, age: float = 0, status: str = "completed", results: dict = None, parameters: dict = None) -> int:
+    db = sessions()
+    created = datetime.fromtimestamp(NOW - age, timezone.utc).replace(tzinfo=None)
+    run = ForecastRun(dataset_id=dataset_id, status=status, horizon=30, model_type="prophet", created_at=created,
+                      results=results, parameters=parameters)
+    db.add(run)
+    db.commit()
+    run_id = run.id
+    db.close()
+    return run_id
+
+
+def trained(rows: int, ensemble_rows: int = None) -> dict:
+    # The ensemble trains on the rows left after cleaning, fewer than were ingested
+    return {"dataset_rows": rows, "ensemble": {"rows": ensemble_rows or rows - 5}}
+
+
+class Upload:
+    def __init__(self, body: bytes):
+        self.body = io.BytesIO(body)
+
+    async def read(self, size=-1):
+        return self.body.read(size)
+
+
+def daily_csv(start: int, days: int) -> bytes:
+    # A steady weekly pattern: appended rows do not drift
+    dates = pd.date_range("2025-01-01", periods=start + days, freq="D")[start:]
+    frame = pd.DataFrame({"date": dates.strftime("%Y-%m-%d"), "sales": [100.0 + i % 7 for i in range(start, start + days)]})
+    return frame.to_csv(index=False).encode()
+
+
+def queued_job(broker, run_id: int) -> dict:
+    jobs = [j for j in broker.jobs.values() if j["payload"]["run_id"] == run_id]
+    assert len(jobs) == 1
+    return jobs[0]
+
+
+async def test_unchanged_dataset_is_left_alone(scheduler, sessions):
+    dataset_id = add_dataset(sessions, rows=100)
+    add_run(sessions, dataset_id, results=trained(100))
+    assert await scheduler.tick() == []
+
+
+async def test_new_rows_compare_ingested_rows(scheduler, sessions, broker):
+    dataset_id = add_dataset(sessions, rows=120)
+    previous = add_run(sessions, dataset_id, results=trained(100))
+
+    [decision] = await scheduler.tick()
+    assert decision["action"] == "queued"
+    assert decision["reasons"] == {"new_rows": {"new_rows": 20, "trained_rows": 100}}
+    job = queued_job(broker, decision["run_id"])
+    # New rows roll the registered model forward: no refit
+    assert "refit" not in job["payload"]
+
+    db = sessions()
+    run = db.query(ForecastRun).filter(ForecastRun.id == decision["run_id"]).first()
+    assert run.status == "queued"
+    assert run.parameters["retrain"]["reasons"] == ["new_rows"]
+    assert run.parameters["retrain"]["rows"] == 120
+    assert run.parameters["retrain"]["previous_run"] == previous
+    [entry] = db.query(AuditLog).all()
+    assert entry.action == "retrain.queued"
+    db.close()
+
+
+async def test_appended_rows_trigger_a_retrain(scheduler, sessions, broker):
+    await get_storage("datasets").aensure_bucket()
+    db = sessions()
+    dataset, _ = await ingest_upload(Upload(daily_csv(0, 120)), "daily.csv", db, "text/csv")
+    add_run(sessions, dataset.id, results=trained(120))
+    assert await scheduler.tick() == []
+
+    await append_upload(dataset, Upload(daily_csv(120, 30)), db)
+    db.close()
+    [decision] = await scheduler.tick()
+    assert decision["reasons"] == {"new_rows": {"new_rows": 30, "trained_rows": 120}}
+    assert "refit" not in queued_job(broker, decision["run_id"])["payload"]
+
+
+async def test_stale_model_is_refit(scheduler, sessions, broker, clock):
+    dataset_id = add_dataset(sessions, rows=100)
+    add_run(sessions, dataset_id, results=trained(100))
+    clock.now += 7 * DAY - 60
+    assert await scheduler.tick() == []
+
+    clock.now += 60
+    [decision] = await scheduler.tick()
+    assert list(decision["reasons"]) == ["stale"]
+    job = queued_job(broker, decision["run_id"])
+    assert job["payload"]["refit"] == datetime.fromtimestamp(clock.now, timezone.utc).isoformat()
+    assert job["payload"]["dataset_id"] == dataset_id
+
+
+async def test_drift_is_acted_on_once(scheduler, sessions, broker, clock):
+    dataset_id = add_dataset(sessions, rows=100, drift_key="drift/1")
+    add_run(sessions, dataset_id, results=trained(100))
+    report = {"window": "w-7", "columns": [
+        {"column": "y", "drift_detected": True, "psi": 0.35},
+        {"column": "price", "drift_detected": True, "psi": 0.1},
+    ]}
+
+    async def drift_report(state):
+        return report
+
+    scheduler._drift_report = drift_report
+    [decision] = await scheduler.tick()
+    assert decision["reasons"] == {"drift": {"window": "w-7", "columns": ["y"], "max_psi": 0.35}}
+    assert "refit" in queued_job(broker, decision["run_id"])["payload"]
+
+    # The retrain completes: the same window does not trigger again
+    db = sessions()
+    run = db.query(ForecastRun).filter(ForecastRun.id == decision["run_id"]).first()
+    assert run.parameters["retrain"]["drift_window"] == "w-7"
+    run.status = "completed"
+    run.results = trained(100)
+    db.commit()
+    db.close()
+    clock.now += 60
+    assert await scheduler.tick() == []
+
+
+async def test_triggers_coalesce_into_the_active_run(scheduler, sessions, broker):
+    dataset_id = add_dataset(sessions, rows=150)
+    add_run(sessions, dataset_id, age=10 * DAY, results=trained(100))
+    active = add_run(sessions, dataset_id, age=60, status="running")
+    scheduler.request(dataset_id)
+    scheduler.request(dataset_id)
+
+    [decision] = await scheduler.tick()
+    assert decision["action"] == "coalesced"
+    assert decision["run_id"] == active
+    assert set(decision["reasons"]) == {"manual", "new_rows", "stale"}
+    assert broker.jobs == {}
+
+
+async def test_requests_coalesce_into_one_run(scheduler, sessions, broker):
+    dataset_id = add_dataset(sessions, rows=120)
+    add_run(sessions, dataset_id, results=trained(100))
+    scheduler.request(dataset_id)
+    scheduler.request(dataset_id, detail={"user": "analyst"})
+
+    [decision] = await scheduler.tick()
+    assert decision["action"] == "queued"
+    assert set(decision["reasons"]) == {"manual", "new_rows"}
+    assert decision["reasons"]["manual"]["user"] == "analyst"
+    assert len(broker.jobs) == 1
+    # The next tick finds the retrain queued
+    assert [d["action"] for d in await scheduler.tick()] == ["coalesced"]
+    assert len(broker.jobs) == 1
+
+
+async def test_requests_without_a_model_are_skipped(scheduler, sessions):
+    untrained = add_dataset(sessions, rows=100)
+    add_run(sessions, untrained, status="failed")
+    scheduler.request(untrained)
+    scheduler.request(999)
+
+    decisions = await scheduler.tick()
+    assert [(d["dataset_id"], d["action"]) for d in decisions] == [(untrained, "skipped"), (999, "skipped")]
+    db = sessions()
+    assert [entry.action for entry in db.query(AuditLog).all()] == ["retrain.skipped", "retrain.skipped"]
+    db.close()
+
+
+async def test_per_tick_limit_defers_the_least_urgent(scheduler, sessions, broker):
+    scheduler.max_per_tick = 1
+    stale = add_dataset(sessions, rows=100)
+    add_run(sessions, stale, age=30 * DAY, results=trained(100))
+    requested = add_dataset(sessions, rows=100)
+    add_run(sessions, requested, results=trained(100))
+    scheduler.request(requested)
+
+    decisions = {d["dataset_id"]: d["action"] for d in await scheduler.tick()}
+    assert decisions == {requested: "queued", stale: "deferred"}
+    # Triggers are derived again at the next tick; the request was served
+    decisions = {d["dataset_id"]: d["action"] for d in await scheduler.tick()}
+    assert decisions == {stale: "queued"}
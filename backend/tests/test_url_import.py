@@ -0,0 +1,162 @@
+import re
+import time
+import threading
+import http.server
+import socketserver
+import numpy as np
+import pandas as pd
+import pytest
+import httpx
+from fastapi import FastAPI
+from app.api.endpoints import datasets
+from app.services import url_import
+from app.services.url_import import DownloadError, DownloadTooLarge, RemoteFile, import_url
+
+pytestmark = pytest.mark.anyio
+
+DATA = pd.DataFrame({
+    "date": pd.date_range("2021-01-01", periods=20000, freq="h").strftime("%Y-%m-%d %H:%M"),
+    "sales": np.random.default_rng(0).random(20000).round(6),
+}).to_csv(index=False).encode()
+ETAG = '"v1"'
+
+
+async def read(remote: RemoteFile) -> bytes:
+    return b"".join([chunk async for chunk in remote.chunks()])
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    /drop/...: the first transfer is cut after a third of the body, then Range requests
+    validated by If-Range are answered with 206. /norange/...: the same cut, but ranges are
+    ignored. /changed/...: the same cut, then a new version of the file. /big: announces more
+    bytes than the limit. /slow: stalls before answering.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        state = self.server.state
+        state["requests"].append({"path": self.path, "range": self.headers.get("Range"), "if_range": self.headers.get("If-Range")})
+        if self.path.startswith("/big"):
+            self.send_response(200)
+            self.send_header("Content-Length", str(10 ** 10))
+            self.end_headers()
+            return
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/slow"):
+            time.sleep(2)
+        start = 0
+        range_header = self.headers.get("Range")
+        changed = self.path.startswith("/changed") and len(state["requests"]) > 1
+        if range_header and self.headers.get("If-Range") == ETAG and not self.path.startswith("/norange") and not changed:
+            start = int(re.match(r"bytes=(\d+)-", range_header).group(1))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(DATA) - 1}/{len(DATA)}")
+        else:
+            self.send_response(200)
+        body = DATA[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v2"' if changed else ETAG)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.end_headers()
+        if start == 0 and state["drops"] > 0 and self.path.startswith(("/drop", "/norange", "/changed")):
+            state["drops"] -= 1
+            self.wfile.write(body[:len(body) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients going away mid-body (the deadline and size limit tests) are expected
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = Server(("127.0.0.1", 0), Handler)
+    httpd.state = {}
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+
+
+@pytest.fixture
+async def base(server, monkeypatch):
+    server.state.update(drops=1, requests=[])
+    monkeypatch.setattr(url_import, "RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(url_import, "_import_slots", None)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    # The shared client belongs to this test's event loop
+    await url_import.close_http_client()
+
+
+async def test_interrupted_transfer_resumes_with_range(base, server):
+    remote = RemoteFile(f"{base}/drop/data.csv")
+    assert await read(remote) == DATA
+    assert remote.received == len(DATA)
+    assert remote.content_type == "text/csv; charset=utf-8"
+    first, resumed = server.state["requests"]
+    assert first["range"] is None
+    offset = int(re.match(r"bytes=(\d+)-", resumed["range"]).group(1))
+    assert 0 < offset < len(DATA)
+    assert resumed["if_range"] == ETAG
+
+
+async def test_ignored_range_skips_what_was_read(base, server):
+    assert await read(RemoteFile(f"{base}/norange/data.csv")) == DATA
+    assert len(server.state["requests"]) == 2
+    assert server.state["requests"][1]["range"] is not None
+
+
+async def test_changed_file_is_ingested_from_zero(base, server, db):
+    dataset, result = await import_url(f"{base}/changed/sales.csv", db)
+    assert result["total_rows"] == 20000
+    assert dataset.metadata_info["size"] == len(DATA)
+    # Cut, resume refused with a new version, read again from zero
+    assert [r["range"] is not None for r in server.state["requests"]] == [False, True, False]
+
+
+async def test_size_limit(base):
+    with pytest.raises(DownloadTooLarge):
+        await read(RemoteFile(f"{base}/big", max_bytes=10 ** 6))
+    with pytest.raises(DownloadTooLarge):
+        await read(RemoteFile(f"{base}/data.csv", max_bytes=len(DATA) // 2))
+
+
+async def test_overall_deadline(base, monkeypatch):
+    monkeypatch.setattr(url_import.settings, "URL_IMPORT_TIMEOUT", 0.5)
+    with pytest.raises(DownloadError, match="did not finish"):
+        await import_url(f"{base}/slow/data.csv", db=None)
+
+
+async def test_upload_url_endpoint(base, db):
+    app = FastAPI()
+    app.include_router(datasets.router, prefix="/api/datasets")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=60) as client:
+        response = await client.post("/api/datasets/upload-url", params={"url": f"{base}/drop/sales.csv"})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["dataset"]["filename"] == "sales.csv"
+        assert body["total_rows"] == 20000
+
+        response = await client.post("/api/datasets/upload-url", params={"url": f"{base}/big"})
+        assert response.status_code == 413
+
+        response = await client.post("/api/datasets/upload-url", params={"url": f"{base}/missing"})
+        assert response.status_code == 502
+
+        response = await client.post("/api/datasets/upload-url", params={"url": "file:///etc/passwd"})
+        assert response.status_code == 502
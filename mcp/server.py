@@ -1,5 +1,10 @@
 from mcp.server.fastmcp import FastMCP
+import os
 import json
+import urllib.parse
+import urllib.request
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8000")
 
 # Initialize FastMCP server
 mcp = FastMCP("InsightX Forecast Agent")
@@ -153,10 +158,39 @@ def analyze_drivers(ticker: str) -> str:
     return "\n".join(json.dumps(msg) for msg in stream_messages)
 
 @mcp.tool()
-def configure_scenario(ticker: str) -> str:
+def configure_scenario(ticker: str, run_id: int = None, marketing_boost: float = 10) -> str:
     """
-    Configure a what-if scenario with A2UI sliders.
+    Configure a what-if scenario with A2UI sliders. With a run, the slider previews that
+    run's forecast from its precomputed response surface (see preview_scenario).
     """
+    children = ["title", "marketing_slider"]
+    components = [
+        {
+            "id": "title",
+            "component": {
+                "Text": {
+                    "text": {"literalString": "Scenario Simulator"},
+                    "usageHint": "h2"
+                }
+            }
+        },
+        {
+            "id": "marketing_slider",
+            "component": {
+                "Slider": {
+                    "label": "Marketing Boost (%)",
+                    "value": marketing_boost,
+                    "min": 0,
+                    "max": 100
+                }
+            }
+        }
+    ]
+    if run_id is not None:
+        preview_children, preview_components = _scenario_preview(run_id, marketing_boost)
+        children += preview_children
+        components += preview_components
+
     stream_messages = [
         {
             "surfaceUpdate": {
@@ -166,30 +200,11 @@ def configure_scenario(ticker: str) -> str:
                         "id": "root",
                         "component": {
                             "Column": {
-                                "children": {"explicitList": ["title", "marketing_slider", "run_btn"]}
+                                "children": {"explicitList": children}
                             }
                         }
                     },
-                    {
-                        "id": "title",
-                        "component": {
-                            "Text": {
-                                "text": {"literalString": "Scenario Simulator"},
-                                "usageHint": "h2"
-                            }
-                        }
-                    },
-                    {
-                        "id": "marketing_slider",
-                        "component": {
-                            "Slider": {
-                                "label": "Marketing Boost (%)",
-                                "value": 10,
-                                "min": 0,
-                                "max": 100
-                            }
-                        }
-                    }
+                    *components
                 ]
             }
         },
@@ -203,8 +218,83 @@ def configure_scenario(ticker: str) -> str:
     return "\n".join(json.dumps(msg) for msg in stream_messages)
 
 @mcp.tool()
-def run_backtest(dataset_id: int) -> str:
+def preview_scenario(run_id: int, marketing_boost: float, exact: bool = False) -> str:
+    """
+    Answer a Marketing Boost slider move for a run: interpolated from the run's response
+    surface (milliseconds), or with exact=True queue a full re-run with that boost.
+    """
+    if exact:
+        try:
+            job = _post(f"/api/runs/{run_id}/surface/exact", {"value": marketing_boost}, timeout=30)
+            text = f"Exact re-run with Marketing Boost {marketing_boost:g}% queued as run {job['run_id']} ({job['status']})."
+        except Exception as e:
+            text = f"Exact re-run failed: {e}"
+        components = [{"id": "preview_info", "component": {"Text": {"text": {"literalString": text}, "usageHint": "label"}}}]
+    else:
+        _, components = _scenario_preview(run_id, marketing_boost)
+
+    # Updates the preview components rendered by configure_scenario
+    return json.dumps({"surfaceUpdate": {"surfaceId": "scenario-config", "components": components}})
+
+def _scenario_preview(run_id: int, marketing_boost: float) -> tuple:
+    # (children, components) of the forecast preview at one slider value
+    try:
+        result = _get(f"/api/runs/{run_id}/surface", {"override": "marketing_boost", "value": marketing_boost})
+        preview = result["previews"][0]
+        data = [{"date": date, "price": round(value, 2)} for date, value in zip(result["dates"], preview["forecast"])]
+        text = f"Marketing Boost {marketing_boost:g}%: {preview['uplift_percent']:+.1f}% revenue over the horizon (interpolated)"
+    except Exception as e:
+        data, text = [], f"Preview unavailable: {e}"
+    return ["preview_info", "preview_chart"], [
+        {
+            "id": "preview_info",
+            "component": {
+                "Text": {
+                    "text": {"literalString": text},
+                    "usageHint": "label"
+                }
+            }
+        },
+        {
+            "id": "preview_chart",
+            "component": {
+                "StockChart": {
+                    "ticker": f"Run {run_id}",
+                    "data": data
+                }
+            }
+        }
+    ]
+
+def _get(path: str, params: dict = None, timeout: float = 30) -> dict:
+    query = f"?{urllib.parse.urlencode(params)}" if params else ""
+    with urllib.request.urlopen(f"{BACKEND_URL}{path}{query}", timeout=timeout) as response:
+        return json.loads(response.read())
+
+def _post(path: str, payload: dict, timeout: float = 600) -> dict:
+    request = urllib.request.Request(
+        f"{BACKEND_URL}{path}",
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+@mcp.tool()
+def run_backtest(dataset_id: int, horizons: list = None, folds: int = 5) -> str:
     """Run backtesting and returning metrics UI"""
+    try:
+        result = _post("/api/tools/run_backtest", {"dataset_id": dataset_id, "horizons": horizons or [30], "folds": folds})
+        metrics = result["metrics"]
+        mae_text = f"MAE: {metrics['mae']:.2f}" if metrics.get("mae") is not None else "MAE: n/a"
+        rmse_text = f"RMSE: {metrics['rmse']:.2f}" if metrics.get("rmse") is not None else "RMSE: n/a"
+        backtest = result["backtest"]
+        header = f"Backtest Results ({backtest['mode'].title()} Origin, {len(backtest['folds'])} folds)"
+    except Exception as e:
+        mae_text, rmse_text = "MAE: n/a", "RMSE: n/a"
+        header = f"Backtest failed: {e}"
+
     stream_messages = [
         {
             "surfaceUpdate": {
@@ -222,7 +312,7 @@ def run_backtest(dataset_id: int) -> str:
                         "id": "header",
                         "component": {
                             "Text": {
-                                "text": {"literalString": "Backtest Results (Rolling Window)"},
+                                "text": {"literalString": header},
                                 "usageHint": "h2" 
                             }
                         }
@@ -246,7 +336,7 @@ def run_backtest(dataset_id: int) -> str:
                     {
                         "id": "mae_text",
                         "component": {
-                            "Text": {"text": {"literalString": "MAE: 12.5"}}
+                            "Text": {"text": {"literalString": mae_text}}
                         }
                     },
                      {
@@ -260,7 +350,7 @@ def run_backtest(dataset_id: int) -> str:
                     {
                         "id": "rmse_text",
                         "component": {
-                            "Text": {"text": {"literalString": "RMSE: 14.2"}}
+                            "Text": {"text": {"literalString": rmse_text}}
                         }
                     }
                 ]